@@ -1,33 +1,82 @@
+import importlib
+
 __version__ = '2.1.3'
 __all__ = [
     'Axies',
+    'AxieStore',
     'AxieGraphQL',
+    'AxieIndexer',
+    'BalanceIndexer',
     'Breed',
+    'BulkBreed',
+    'BulkTransfer',
     'Claim',
+    'ClaimBatch',
     'CustomUI',
+    'EncryptedJWTCache',
+    'GasEstimator',
+    'JWTCache',
     'Morph',
+    'MorphBatch',
+    'NonceManager',
     'Payment',
+    'PaymentPlanner',
     'Scatter',
+    'SigningPool',
     'Transfer',
     'TrezorAxieGraphQL',
     'TrezorBreed',
     'TrezorClaim',
     'TrezorConfig',
     'TrezorMorph',
+    'TrezorMorphBatch',
     'TrezorPayment',
     'TrezorScatter',
+    'TrezorSigningSession',
     'TrezorTransfer',
     'get_nonce',
     'get_lastclaim',
+    'get_web3',
     'check_balance',
+    'check_balances',
+    'async_execute_claims',
 ]
 
-from axie_utils.axies import Axies
-from axie_utils.breeding import Breed, TrezorBreed
-from axie_utils.claims import Claim, TrezorClaim
-from axie_utils.graphql import AxieGraphQL, TrezorAxieGraphQL
-from axie_utils.morphing import Morph, TrezorMorph
-from axie_utils.payments import Payment, TrezorPayment
-from axie_utils.scatter import Scatter, TrezorScatter
-from axie_utils.transfers import Transfer, TrezorTransfer
-from axie_utils.utils import get_nonce, check_balance, CustomUI, TrezorConfig, get_lastclaim
+# Public names are imported from their module on first access, so a script that only needs check_balance
+# does not pay for every submodule
+_MODULES = {
+    'axies': ['Axies', 'AxieStore'],
+    'breeding': ['Breed', 'BulkBreed', 'TrezorBreed'],
+    'claims': ['Claim', 'ClaimBatch', 'TrezorClaim', 'async_execute_claims'],
+    'graphql': ['AxieGraphQL', 'EncryptedJWTCache', 'JWTCache', 'TrezorAxieGraphQL'],
+    'indexer': ['AxieIndexer', 'BalanceIndexer'],
+    'morphing': ['Morph', 'MorphBatch', 'TrezorMorph', 'TrezorMorphBatch'],
+    'payments': ['Payment', 'PaymentPlanner', 'TrezorPayment'],
+    'scatter': ['Scatter', 'TrezorScatter'],
+    'signing': ['SigningPool', 'TrezorSigningSession'],
+    'transfers': ['BulkTransfer', 'Transfer', 'TrezorTransfer'],
+    'utils': [
+        'GasEstimator',
+        'NonceManager',
+        'get_nonce',
+        'check_balance',
+        'check_balances',
+        'CustomUI',
+        'TrezorConfig',
+        'get_lastclaim',
+        'get_web3'
+    ]
+}
+_EXPORTS = {name: module for module, names in _MODULES.items() for name in names}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
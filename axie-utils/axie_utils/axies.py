@@ -1,20 +1,70 @@
 import json
 import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from time import time
 
 from web3 import Web3
 import requests
 
 from axie_utils.abis import AXIE_ABI
-from axie_utils.utils import check_balance, RONIN_PROVIDER, AXIE_CONTRACT, USER_AGENT
+from axie_utils.utils import batch_call, check_balance, get_session, get_web3, RONIN_PROVIDER, AXIE_CONTRACT
+
+GRAPHQL_URL = "https://graphql-gateway.axieinfinity.com/graphql"
+AXIE_QUERY_CHUNK = 50
+AXIE_QUERY_WORKERS = 4
+AXIE_CACHE_SIZE = 10000
+AXIE_CACHE_TTL = 600
+# bodyShape changes when the axie is morphed and owner on every transfer, everything else is fixed at birth
+MUTABLE_AXIE_FIELDS = frozenset(['bodyShape', 'owner'])
+AXIE_DETAIL_FRAGMENT = (
+    "fragment AxieDetail on Axie { id class birthDate bodyShape owner parts { ...AxiePart } __typename } "
+    "fragment AxiePart on AxiePart { id name class type }"
+)
+
+
+class AxieDetailCache:
+    # LRU bounded, fields in MUTABLE_AXIE_FIELDS are only trusted for ttl seconds
+    def __init__(self, maxsize=AXIE_CACHE_SIZE, ttl=AXIE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, axie_id, fields):
+        with self._lock:
+            entry = self._records.get(str(axie_id))
+            if entry is None:
+                return None
+            record, fetched_at = entry
+            if any(field not in record for field in fields):
+                return None
+            if MUTABLE_AXIE_FIELDS.intersection(fields) and time() - fetched_at > self.ttl:
+                return None
+            self._records.move_to_end(str(axie_id))
+            return record
+
+    def set(self, axie_id, record):
+        with self._lock:
+            self._records[str(axie_id)] = (record, time())
+            self._records.move_to_end(str(axie_id))
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+AXIE_DETAIL_CACHE = AxieDetailCache()
 
 
 class Axies:
-    def __init__(self, account):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, account, w3=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
         self.acc = account.replace("ronin:", "0x").lower()
         self.contract = self.w3.eth.contract(
             address=Web3.toChecksumAddress(AXIE_CONTRACT),
@@ -29,85 +79,234 @@ class Axies:
         logging.debug(f'Owner: {self.contract.functions.ownerOf(axie_id).call().lower()}, "checker": {self.acc}')
         return self.contract.functions.ownerOf(axie_id).call().lower() ==self.acc
 
+    def check_axie_owners(self, axie_ids):
+        owners = batch_call([(self.contract, 'ownerOf', [axie_id]) for axie_id in axie_ids])
+        return {
+            axie_id: owner is not None and owner.lower() == self.acc
+            for axie_id, owner in zip(axie_ids, owners)
+        }
+
     def find_axies_to_morph(self):
         axie_list = self.get_axies()
-        axies = []
-        for axie in axie_list:
-            morph_date, body_shape = self.get_morph_date_and_body(axie)
+        morphable = {axie for axie, status, _ in self.iter_axies_to_morph(axie_list) if status == 'morphable'}
+        return [axie for axie in axie_list if axie in morphable]
+
+    def iter_axies_to_morph(self, axie_list=None):
+        # Yields (axie, status, morph_date) as soon as each chunk is answered.
+        # status is 'morphable', 'waiting', 'adult' or None when the axie could not be read
+        if axie_list is None:
+            axie_list = self.get_axies()
+        for axie, morph_date, body_shape in self.iter_morph_dates_and_bodies(axie_list):
             if not morph_date and not body_shape:
                 logging.info(f"Something went wrong getting info for Axie {axie}, skipping it")
+                yield axie, None, None
             elif self.now >= morph_date and not body_shape:
-                axies.append(axie)
+                yield axie, 'morphable', morph_date
             elif not body_shape:
                 logging.info(f"Axie {axie} cannot be morphed until {morph_date}")
+                yield axie, 'waiting', morph_date
             else:
                 logging.info(f"Axie {axie} is already an adult!")
-        return axies
+                yield axie, 'adult', morph_date
 
     def get_axies(self):
         num_axies = self.number_of_axies()
-        axies = []
-        for i in range(num_axies):
-            axie = self.contract.functions.tokenOfOwnerByIndex(
-                _owner=Web3.toChecksumAddress(self.acc),
-                _index=i
-            ).call()
-            axies.append(axie)
+        owner = Web3.toChecksumAddress(self.acc)
+        axies = batch_call([(self.contract, 'tokenOfOwnerByIndex', [owner, i]) for i in range(num_axies)])
+        failed = [i for i, axie in enumerate(axies) if axie is None]
+        if failed:
+            # Retry failed reads once, a partial inventory is never returned
+            retried = batch_call([(self.contract, 'tokenOfOwnerByIndex', [owner, i]) for i in failed])
+            for i, axie in zip(failed, retried):
+                axies[i] = axie
+        if None in axies:
+            raise ValueError(f"Could not read {axies.count(None)} axies of account {self.acc.replace('0x', 'ronin:')}")
         return axies
 
     @staticmethod
-    def get_morph_date_and_body(axie_id):
+    def fetch_axie_detail(axie_id):
+        # One GetAxieDetail query fills every cached field, returns the raw record or None
         payload = {
             "operationName": "GetAxieDetail",
             "variables":
                 {"axieId": axie_id},
             "query": "query GetAxieDetail($axieId: ID!) { axie(axieId: $axieId) "
-            "{ ...AxieDetail __typename}} fragment AxieDetail on Axie "
-            "{ id birthDate bodyShape __typename }"
+            "{ ...AxieDetail __typename}} " + AXIE_DETAIL_FRAGMENT
         }
-        url = "https://graphql-gateway.axieinfinity.com/graphql"
-        response = requests.post(url, json=payload)
         try:
+            response = get_session(GRAPHQL_URL).post(GRAPHQL_URL, json=payload, timeout=30)
             json_response = response.json()
-        except json.decoder.JSONDecodeError:
+        except (requests.RequestException, json.decoder.JSONDecodeError):
             logging.debug("Response contains no json info")
-            return None, None
+            return None
+        if not isinstance(json_response, dict) or not isinstance(json_response.get('data'), dict):
+            return None
+        axie = json_response['data'].get('axie')
+        if not isinstance(axie, dict):
+            return None
+        AXIE_DETAIL_CACHE.set(axie_id, axie)
+        return axie
 
-        if "data" in json_response and "axie" in json_response['data']:
-            if 'bodyShape' in json_response['data']['axie'] and 'birthDate' in json_response['data']['axie']:
-                # In case we want to check correctly morphed
-                body_shape = json_response["data"]["axie"]["bodyShape"]
-                birth_date = json_response["data"]["axie"]["birthDate"]
-                morph_date = datetime.utcfromtimestamp(birth_date) + timedelta(days=5)
-                return morph_date, body_shape
+    @staticmethod
+    def get_axie_record(axie_id, fields):
+        return AXIE_DETAIL_CACHE.get(axie_id, fields) or Axies.fetch_axie_detail(axie_id)
 
+    @staticmethod
+    def get_morph_date_and_body(axie_id):
+        axie = Axies.get_axie_record(axie_id, ('birthDate', 'bodyShape'))
+        if axie and 'bodyShape' in axie and 'birthDate' in axie:
+            # In case we want to check correctly morphed
+            morph_date = datetime.utcfromtimestamp(axie["birthDate"]) + timedelta(days=5)
+            return morph_date, axie["bodyShape"]
         return None, None
 
     @staticmethod
-    def get_axie_details(axie_id):
+    def fetch_axie_details(axie_ids):
+        # One aliased query for the whole chunk, returns {axie_id: raw record} for the axies the gateway knows
+        variables = {f"axie{i}": str(axie_id) for i, axie_id in enumerate(axie_ids)}
         payload = {
-            "operationName": "GetAxieDetail",
-            "variables":
-                {"axieId": axie_id},
-            "query": "query GetAxieDetail($axieId: ID!) { axie(axieId: $axieId) "
-            "{ ...AxieDetail }} fragment AxieDetail on Axie "
-            "{ id class parts { ...AxiePart }} fragment AxiePart on AxiePart "
-            "{ id name class type }"
+            "operationName": "GetAxieMorphInfo",
+            "variables": variables,
+            "query": "query GetAxieMorphInfo(" + ", ".join(f"${alias}: ID!" for alias in variables) + ") { " +
+            " ".join(f"{alias}: axie(axieId: ${alias}) {{ ...AxieDetail __typename }}" for alias in variables) +
+            " } " + AXIE_DETAIL_FRAGMENT
         }
-        url = "https://graphql-gateway.axieinfinity.com/graphql"
-        response = requests.post(url, json=payload)
         try:
-            json_response = response.json()
-        except json.decoder.JSONDecodeError:
+            response = get_session(GRAPHQL_URL).post(GRAPHQL_URL, json=payload, timeout=30)
+            data = response.json().get('data') or {}
+        except (requests.RequestException, json.decoder.JSONDecodeError, AttributeError):
             logging.debug("Response contains no json info")
-            return None
-        if ("data" in json_response and 
-            "axie" in json_response['data'] and 
-            "parts" in json_response['data']['axie']):
+            return {}
+        records = {}
+        for alias, axie_id in zip(variables, axie_ids):
+            if isinstance(data.get(alias), dict):
+                records[axie_id] = data[alias]
+                AXIE_DETAIL_CACHE.set(axie_id, data[alias])
+        return records
+
+    @staticmethod
+    def get_morph_dates_and_bodies(axie_ids):
+        # Every axie of the chunk gets (morph_date, body_shape) or (None, None), only uncached ones are queried
+        records = {axie_id: AXIE_DETAIL_CACHE.get(axie_id, ('birthDate', 'bodyShape')) for axie_id in axie_ids}
+        missing = [axie_id for axie_id, record in records.items() if record is None]
+        if missing:
+            records.update(Axies.fetch_axie_details(missing))
+        results = {}
+        for axie_id, axie in records.items():
+            if isinstance(axie, dict) and 'bodyShape' in axie and 'birthDate' in axie:
+                morph_date = datetime.utcfromtimestamp(axie['birthDate']) + timedelta(days=5)
+                results[axie_id] = (morph_date, axie['bodyShape'])
+            else:
+                results[axie_id] = (None, None)
+        return results
+
+    @staticmethod
+    def iter_morph_dates_and_bodies(axie_ids, chunk_size=AXIE_QUERY_CHUNK, max_workers=AXIE_QUERY_WORKERS):
+        # Yields (axie, morph_date, body_shape), chunk by chunk in the order the gateway answers
+        chunks = [axie_ids[i:i + chunk_size] for i in range(0, len(axie_ids), chunk_size)]
+        if not chunks:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            futures = [pool.submit(Axies.get_morph_dates_and_bodies, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                for axie_id, (morph_date, body_shape) in future.result().items():
+                    yield axie_id, morph_date, body_shape
+
+    @staticmethod
+    def get_axie_details(axie_id):
+        axie = Axies.get_axie_record(axie_id, ('class', 'parts'))
+        if axie and isinstance(axie.get('parts'), list):
             parts = {}
-            for part in json_response['data']['axie']['parts']:
+            for part in axie['parts']:
                 parts[part['type'].lower()] = part['name'].lower()
-            if "class" in json_response['data']['axie']:
-                parts['class'] = json_response['data']['axie']['class'].lower()
+            if axie.get('class'):
+                parts['class'] = axie['class'].lower()
             return parts
         return None
+
+
+AXIE_STORE_MAX_AGE = 24 * 60 * 60
+
+
+class AxieStore:
+    # SQLite backed copy of the gateway axie records, so periodic jobs only fetch what may have changed
+    def __init__(self, path, w3=None):
+        self.path = path
+        self.w3 = w3
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS axies ("
+                "axie_id TEXT PRIMARY KEY, class TEXT, parts TEXT, birth_date INTEGER, body_shape TEXT, "
+                "owner TEXT, last_seen_block INTEGER, fetched_at REAL NOT NULL)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _row_to_record(self, row):
+        axie_id, axie_class, parts, birth_date, body_shape, owner, last_seen_block, fetched_at = row
+        return {
+            "id": axie_id,
+            "class": axie_class,
+            "parts": json.loads(parts) if parts else [],
+            "birthDate": birth_date,
+            "bodyShape": body_shape,
+            "owner": owner,
+            "lastSeenBlock": last_seen_block,
+            "fetchedAt": fetched_at
+        }
+
+    def get(self, axie_id):
+        return self.get_many([axie_id]).get(str(axie_id))
+
+    def get_many(self, axie_ids):
+        ids = [str(axie_id) for axie_id in axie_ids]
+        records = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT * FROM axies WHERE axie_id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for row in rows:
+                    records[row[0]] = self._row_to_record(row)
+        return records
+
+    def save(self, records, block=None):
+        # records is {axie_id: raw gateway record}
+        now = time()
+        rows = [
+            (str(axie_id), axie.get('class'), json.dumps(axie.get('parts') or []), axie.get('birthDate'),
+             axie.get('bodyShape'), (axie.get('owner') or '').lower() or None, block, now)
+            for axie_id, axie in records.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO axies VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def stale(self, axie_ids, max_age=AXIE_STORE_MAX_AGE, changed=()):
+        # Missing axies, axies known to have changed (e.g. transferred) and axies that can still morph
+        # and were fetched more than max_age seconds ago
+        changed = {str(axie_id) for axie_id in changed}
+        stored = self.get_many(axie_ids)
+        cutoff = time() - max_age
+        stale = []
+        for axie_id in axie_ids:
+            record = stored.get(str(axie_id))
+            if (record is None or str(axie_id) in changed or
+               (record['bodyShape'] is None and record['fetchedAt'] < cutoff)):
+                stale.append(axie_id)
+        return stale
+
+    def refresh(self, axie_ids, max_age=AXIE_STORE_MAX_AGE, changed=(), chunk_size=AXIE_QUERY_CHUNK):
+        # Returns the ids that were fetched again
+        stale = self.stale(axie_ids, max_age, changed)
+        block = self.w3.eth.block_number if self.w3 is not None and stale else None
+        refreshed = []
+        for start in range(0, len(stale), chunk_size):
+            records = Axies.fetch_axie_details(stale[start:start + chunk_size])
+            self.save(records, block)
+            refreshed.extend(records)
+        logging.info(f"Refreshed {len(refreshed)} out of {len(axie_ids)} axies")
+        return refreshed
@@ -1,89 +1,98 @@
 import logging
 import rlp
-from time import sleep
-from datetime import datetime, timedelta
 
-from web3 import Web3, exceptions
-from trezorlib.tools import parse_path
-from trezorlib import ethereum
+from web3 import Web3
 
 from axie_utils.abis import AXIE_ABI
+from axie_utils.calldata import encode_breed_axies
 from axie_utils.utils import (
+    batch_call,
     get_nonce,
+    send_raw_transactions,
+    wait_for_receipt,
+    watch_receipt,
+    get_web3,
+    parse_path,
+    ethereum,
     RONIN_PROVIDER,
-    AXIE_CONTRACT,
-    TIMEOUT_MINS,
-    USER_AGENT
+    AXIE_CONTRACT
 )
 
 
 class Breed:
-    def __init__(self, sire_axie, matron_axie, address, private_key):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, sire_axie, matron_axie, address, private_key, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 492874
         self.sire_axie = sire_axie
         self.matron_axie = matron_axie
         self.address = address.replace("ronin:", "0x")
         self.private_key = private_key
 
-    def execute(self):
-        # Prepare transaction
-        axie_contract = self.w3.eth.contract(
-            address=Web3.toChecksumAddress(AXIE_CONTRACT),
-            abi=AXIE_ABI
-        )
-        # Get Nonce
-        nonce = get_nonce(self.address)
-        # Build transaction
-        transaction = axie_contract.functions.breedAxies(
-            self.sire_axie,
-            self.matron_axie
-        ).buildTransaction({
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
+            "from": Web3.toChecksumAddress(self.address),
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_breed_axies(self.sire_axie, self.matron_axie),
+            "value": 0
+        }
+
+    def build(self, nonce):
+        # Same tx buildTransaction gives, with the calldata encoded directly
+        return {
+            "value": 0,
             "chainId": 2020,
-            "gas": 492874,
+            "gas": self.gas_limit(),
             "gasPrice": self.w3.toWei("1", "gwei"),
-            "nonce": nonce
-        })
+            "nonce": nonce,
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_breed_axies(self.sire_axie, self.matron_axie)
+        }
+
+    def sign(self, nonce):
         # Sign transaction
         signed = self.w3.eth.account.sign_transaction(
-            transaction,
+            self.build(nonce),
             private_key=self.private_key
         )
+        return signed.rawTransaction
+
+    def send(self, nonce):
+        raw_transaction = self.sign(nonce)
         # Send raw transaction
-        self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        self.w3.eth.send_raw_transaction(raw_transaction)
         # get transaction _hash
-        _hash = self.w3.toHex(self.w3.keccak(signed.rawTransaction))
+        _hash = self.w3.toHex(self.w3.keccak(raw_transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
+
+    def execute(self, nonce=None):
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.address)
+        _hash = self.send(nonce)
         # Wait for transaction to finish or timeout
         logging.info("{self} about to start!")
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 10minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                sleep(10)
-                logging.info(f"Waiting for transactions '{self}' to finish (Nonce: {nonce})...")
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
-
+        logging.info(f"Waiting for transactions '{self}' to finish (Nonce: {nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: {self} completed successfully")
             return _hash
@@ -96,11 +105,9 @@ class Breed:
 
 
 class TrezorBreed:
-    def __init__(self, sire_axie, matron_axie, address, client, bip_path):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, sire_axie, matron_axie, address, client, bip_path, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
         self.sire_axie = sire_axie
         self.matron_axie = matron_axie
         self.address = address.replace("ronin:", "0x")
@@ -108,21 +115,45 @@ class TrezorBreed:
         self.bip_path = parse_path(bip_path)
         self.gas = 250000
 
-    def execute(self):
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
+            "from": Web3.toChecksumAddress(self.address),
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_breed_axies(self.sire_axie, self.matron_axie),
+            "value": 0
+        }
+
+    def build(self, nonce):
+        # Unsigned tx for a TrezorSigningSession
+        return {
+            "value": 0,
+            "chainId": 2020,
+            "gas": self.gas_limit(),
+            "gasPrice": self.w3.toWei("1", "gwei"),
+            "nonce": nonce,
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_breed_axies(self.sire_axie, self.matron_axie)
+        }
+
+    def send(self, nonce):
+        gas = self.gas_limit()
         # Prepare transaction
         axie_contract = self.w3.eth.contract(
             address=Web3.toChecksumAddress(AXIE_CONTRACT),
             abi=AXIE_ABI
         )
-        # Get Nonce
-        nonce = get_nonce(self.address)
         # Build transaction
         breed_tx = axie_contract.functions.breedAxies(
             self.sire_axie,
             self.matron_axie
         ).buildTransaction({
             "chainId": 2020,
-            "gas": self.gas,
+            "gas": gas,
             "gasPrice": self.w3.toWei('1', 'gwei'),
             "nonce": nonce
         })
@@ -133,7 +164,7 @@ class TrezorBreed:
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.w3.toWei('1', 'gwei'),
-            gas_limit=self.gas,
+            gas_limit=gas,
             to=AXIE_CONTRACT,
             value=0,
             data=data,
@@ -143,40 +174,36 @@ class TrezorBreed:
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.w3.toWei('1', 'gwei'), self.gas, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.w3.toWei('1', 'gwei'), gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
         # get transaction _hash
         _hash = self.w3.toHex(self.w3.keccak(transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
+
+    def execute(self, nonce=None):
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.address)
+        _hash = self.send(nonce)
         # Wait for transaction to finish or timeout
         logging.info(f"{self} about to start!")
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 10minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                sleep(10)
-                logging.info(f"Waiting for transactions '{self}' to finish (Nonce: {nonce})...")
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
-
+        logging.info(f"Waiting for transactions '{self}' to finish (Nonce: {nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: {self} completed successfully")
             return _hash
@@ -187,3 +214,115 @@ class TrezorBreed:
     def __str__(self):
         return (f"Breeding axie {self.sire_axie} with {self.matron_axie} in account "
                 f"{self.address.replace('0x', 'ronin:')}")
+
+
+class BulkBreed:
+    # Many breeds across a few accounts: ownership of every axie involved is read in one batch, each account
+    # signs its breeds with consecutive nonces, all of them are broadcast in one burst and the receipts are
+    # awaited together
+    def __init__(self, pairs, private_keys, w3=None, gas_estimator=None, signer=None):
+        # pairs is an iterable of (sire_axie, matron_axie, account), private_keys maps every account to its key.
+        # signer is an optional SigningPool holding the same keys
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.signer = signer
+        private_keys = {acc.replace("ronin:", "0x").lower(): key for acc, key in private_keys.items()}
+        self.breeds = {}
+        for sire_axie, matron_axie, account in pairs:
+            self.breeds[(sire_axie, matron_axie)] = Breed(
+                sire_axie,
+                matron_axie,
+                account,
+                private_keys.get(account.replace("ronin:", "0x").lower()),
+                w3=self.w3,
+                gas_estimator=gas_estimator
+            )
+
+    def owners(self, axie_ids):
+        axie_contract = self.w3.eth.contract(
+            address=Web3.toChecksumAddress(AXIE_CONTRACT),
+            abi=AXIE_ABI
+        )
+        owners = batch_call([(axie_contract, 'ownerOf', [axie_id]) for axie_id in axie_ids])
+        return {axie_id: owner.lower() if owner else None for axie_id, owner in zip(axie_ids, owners)}
+
+    def sign(self, pairs, nonces):
+        # [(raw tx, error)] for every pair signed with its nonce
+        if self.signer is None:
+            return [(self.breeds[pair].sign(nonce), None) for pair, nonce in zip(pairs, nonces)]
+        signed = self.signer.sign([
+            (self.breeds[pair].address, self.breeds[pair].build(nonce)) for pair, nonce in zip(pairs, nonces)
+        ])
+        return [(tx['raw'], tx['error']) for tx in signed]
+
+    def execute(self, pairs=None):
+        # Returns {(sire_axie, matron_axie): result}. Pairs that did not breed can be sent again with pairs=[...]
+        pairs = list(self.breeds) if pairs is None else list(pairs)
+        results = {
+            pair: {
+                "account": self.breeds[pair].address.replace('0x', 'ronin:'),
+                "nonce": None,
+                "hash": None,
+                "status": "skipped",
+                "error": None
+            }
+            for pair in pairs
+        }
+        owners = self.owners(sorted({axie_id for pair in pairs for axie_id in pair}))
+        by_account = {}
+        for pair in pairs:
+            breed = self.breeds[pair]
+            if breed.private_key is None:
+                results[pair].update(status="error", error="missing private key")
+            elif any(owners[axie_id] != breed.address.lower() for axie_id in pair):
+                results[pair]['status'] = "not_owned"
+                logging.warning(f"Important: {breed} skipped, the axies are not in that account")
+            else:
+                by_account.setdefault(breed.address.lower(), []).append(pair)
+        to_sign = []
+        nonces = []
+        for account, account_pairs in by_account.items():
+            nonce = get_nonce(account)
+            for i, pair in enumerate(account_pairs):
+                to_sign.append(pair)
+                nonces.append(nonce + i)
+        to_send = []
+        raw_transactions = []
+        for pair, nonce, (raw_transaction, error) in zip(to_sign, nonces, self.sign(to_sign, nonces)):
+            results[pair]['nonce'] = nonce
+            if error is not None:
+                results[pair].update(status="error", error=error)
+                continue
+            raw_transactions.append(raw_transaction)
+            to_send.append(pair)
+            results[pair]['hash'] = self.w3.toHex(self.w3.keccak(raw_transaction))
+        if not to_send:
+            return results
+        errors = send_raw_transactions(raw_transactions, self.w3.provider.endpoint_uri)
+        futures = {}
+        for pair, error in zip(to_send, errors):
+            if error is not None:
+                logging.warning(f"Important: {self.breeds[pair]} was rejected. Error {error}")
+                results[pair].update(status="error", error=error)
+                continue
+            results[pair]['status'] = "pending"
+            if self.gas_estimator is not None:
+                self.gas_estimator.track(results[pair]['hash'], self.breeds[pair].call())
+            futures[pair] = watch_receipt(results[pair]['hash'], w3=self.w3)
+        for pair, future in futures.items():
+            try:
+                receipt = future.result()
+            except ValueError as e:
+                results[pair].update(status="error", error=str(e))
+                continue
+            if receipt is None:
+                results[pair]['status'] = "timeout"
+            elif receipt["status"] == 1:
+                results[pair]['status'] = "bred"
+                if self.gas_estimator is not None:
+                    self.gas_estimator.observe(receipt)
+            else:
+                results[pair]['status'] = "failed"
+        bred = sum(result['status'] == "bred" for result in results.values())
+        logging.info(f"Important: {bred} of {len(results)} breeds completed")
+        return results
@@ -0,0 +1,98 @@
+from web3 import Web3
+
+from axie_utils.abis import AXIE_ABI, SCATTER_ABI, SLP_ABI
+
+
+def _compile(abi, fn_name):
+    # Selector and argument types of fn_name, worked out once at import instead of on every call
+    for entry in abi:
+        if entry.get('type') == 'function' and entry.get('name') == fn_name:
+            types = [arg['type'] for arg in entry['inputs']]
+            return Web3.keccak(text=f"{fn_name}({','.join(types)})")[:4], types
+    raise ValueError(f"Function {fn_name} is not in the ABI")
+
+
+def _uint(value):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < 2 ** 256:
+        raise ValueError(f"Can not encode {value!r} as uint256")
+    return value.to_bytes(32, 'big')
+
+
+def _address(address):
+    if not isinstance(address, str) or not address.startswith('0x') or len(address) != 42:
+        raise ValueError(f"Can not encode {address!r} as address")
+    return bytes(12) + bytes.fromhex(address[2:])
+
+
+def _bytes(value):
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:] if value.startswith('0x') else value)
+    # eth-abi pads empty bytes to a full zero word, kept so the calldata stays byte-identical
+    padding = -len(value) % 32 or (32 if not value else 0)
+    return _uint(len(value)) + bytes(value) + bytes(padding)
+
+
+def _array(encode):
+    return lambda values: _uint(len(values)) + b"".join(encode(value) for value in values)
+
+
+_STATIC = {
+    'address': _address,
+    'uint256': _uint
+}
+_DYNAMIC = {
+    'address[]': _array(_address),
+    'uint256[]': _array(_uint),
+    'bytes': _bytes
+}
+
+
+def _encode(compiled, args):
+    # Standard ABI layout: one 32 byte head per argument, dynamic arguments are an offset into the tail
+    selector, types = compiled
+    heads = []
+    tails = []
+    offset = 32 * len(types)
+    for type_, arg in zip(types, args):
+        if type_ in _STATIC:
+            heads.append(_STATIC[type_](arg))
+        else:
+            tail = _DYNAMIC[type_](arg)
+            heads.append(_uint(offset))
+            tails.append(tail)
+            offset += len(tail)
+    return "0x" + (selector + b"".join(heads) + b"".join(tails)).hex()
+
+
+TRANSFER = _compile(SLP_ABI, 'transfer')
+CHECKPOINT = _compile(SLP_ABI, 'checkpoint')
+SAFE_TRANSFER_FROM = _compile(AXIE_ABI, 'safeTransferFrom')
+BREED_AXIES = _compile(AXIE_ABI, 'breedAxies')
+DISPERSE_TOKEN_SIMPLE = _compile(SCATTER_ABI, 'disperseTokenSimple')
+DISPERSE_ETHER = _compile(SCATTER_ABI, 'disperseEther')
+
+
+# Same hex calldata as contract.encodeABI, addresses are expected checksummed as web3 would ask for
+
+def encode_transfer(to_acc, amount):
+    return _encode(TRANSFER, [to_acc, amount])
+
+
+def encode_checkpoint(account, amount, timestamp, signature):
+    return _encode(CHECKPOINT, [account, amount, timestamp, signature])
+
+
+def encode_safe_transfer_from(from_acc, to_acc, axie_id):
+    return _encode(SAFE_TRANSFER_FROM, [from_acc, to_acc, axie_id])
+
+
+def encode_breed_axies(sire_axie, matron_axie):
+    return _encode(BREED_AXIES, [sire_axie, matron_axie])
+
+
+def encode_disperse_token_simple(token, recipients, amounts):
+    return _encode(DISPERSE_TOKEN_SIMPLE, [token, recipients, amounts])
+
+
+def encode_disperse_ether(recipients, amounts):
+    return _encode(DISPERSE_ETHER, [recipients, amounts])
@@ -1,32 +1,40 @@
 import asyncio
 import rlp
 import logging
-from time import sleep
 from datetime import datetime, timedelta, timezone
 
+import aiohttp
 import requests
 from requests.exceptions import RetryError
-from web3 import Web3, exceptions
-from trezorlib import ethereum
+from web3 import Web3
 
 from axie_utils.abis import SLP_ABI
+from axie_utils.calldata import encode_checkpoint
 from axie_utils.utils import (
+    async_check_balance,
+    async_get_nonce,
+    async_rpc,
     check_balance,
+    get_async_session,
+    StageLimiter,
     get_nonce,
+    wait_for_receipt,
+    watch_receipt,
+    get_web3,
+    ethereum,
     SLP_CONTRACT,
     RONIN_PROVIDER,
-    TIMEOUT_MINS
+    MAX_CONCURRENCY
 )
 from axie_utils.graphql import AxieGraphQL, TrezorAxieGraphQL
 
 
 class Claim(AxieGraphQL):
-    def __init__(self, acc_name, force, **kwargs):
+    def __init__(self, acc_name, force, w3=None, gas_estimator=None, **kwargs):
         super().__init__(**kwargs)
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": self.user_agent}}))
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 492874
         self.slp_contract = self.w3.eth.contract(
             address=Web3.toChecksumAddress(SLP_CONTRACT),
             abi=SLP_ABI
@@ -51,98 +59,153 @@ class Claim(AxieGraphQL):
                              f"({self.account.replace('0x', 'ronin:')})")
             return None
         if 200 <= response.status_code <= 299:
-            data = response.json()
-            last_claimed = datetime.utcfromtimestamp(data['lastClaimedItemAt'])
-            next_claim_date = last_claimed + timedelta(days=14)
-            utcnow = datetime.utcnow()
-            if utcnow < next_claim_date and not self.force:
-                logging.critical(
-                    f"Important: This account will be claimable again on {self.humanize_date(next_claim_date)}.")
-                return None
-            elif self.force:
-                logging.info('Important: Skipping check of dates, --force option was selected')
-            claimable_total = int(data['rawTotal']) - int(data['rawClaimableTotal'])
-            if claimable_total > 0:
-                return claimable_total
+            return self.claimable_amount(response.json())
         return None
 
-    async def async_execute(self):
-        unclaimed = self.has_unclaimed_slp()
+    async def async_has_unclaimed_slp(self, session):
+        url = f"http://game-api-pre.skymavis.com/v1/players/{self.account}/items/1"
+        try:
+            async with session.get(url, headers={"User-Agent": self.user_agent}) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            logging.critical(f"Important: Failed to check if there is unclaimed SLP for acc {self.acc_name} "
+                             f"({self.account.replace('0x', 'ronin:')})")
+            return None
+        return self.claimable_amount(data)
+
+    def claimable_amount(self, data):
+        last_claimed = datetime.utcfromtimestamp(data['lastClaimedItemAt'])
+        next_claim_date = last_claimed + timedelta(days=14)
+        utcnow = datetime.utcnow()
+        if utcnow < next_claim_date and not self.force:
+            logging.critical(
+                f"Important: This account will be claimable again on {self.humanize_date(next_claim_date)}.")
+            return None
+        elif self.force:
+            logging.info('Important: Skipping check of dates, --force option was selected')
+        claimable_total = int(data['rawTotal']) - int(data['rawClaimableTotal'])
+        if claimable_total > 0:
+            return claimable_total
+        return None
+
+    def gas_limit(self, signature, rpc=True):
+        # The async path passes rpc=False, only a learned limit is used there so the event loop never blocks
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(signature), self.gas, w3=self.w3, rpc=rpc)
+
+    def call(self, signature):
+        return {
+            "from": Web3.toChecksumAddress(self.account),
+            "to": Web3.toChecksumAddress(SLP_CONTRACT),
+            "data": encode_checkpoint(
+                Web3.toChecksumAddress(self.account),
+                signature['amount'],
+                signature['timestamp'],
+                signature['signature']
+            ),
+            "value": 0
+        }
+
+    async def async_execute(self, session=None):
+        if session is None:
+            async with get_async_session() as session:
+                return await self.async_execute(session)
+        unclaimed = await self.async_has_unclaimed_slp(session)
         if not unclaimed:
             logging.info(f"Important: Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "has no claimable SLP")
             return
         logging.info(f"Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) has "
                      f"{unclaimed} unclaimed SLP")
-        jwt = self.get_jwt()
+        jwt = await self.async_get_jwt(session)
         if not jwt:
             logging.critical("Important: Skipping claiming, we could not get the JWT for account "
                              f"{self.account.replace('0x', 'ronin:')}")
             return
+        signature = await self.async_claim_signature(session, jwt)
+        if not signature:
+            return
+        hash = await self.async_send_claim(session, signature)
+        receipt = await self.async_wait_claim(session, hash)
+        return receipt is not None and receipt["status"] == 1
+
+    async def async_claim_signature(self, session, jwt):
         headers = {
             "User-Agent": self.user_agent,
             "authorization": f"Bearer {jwt}"
         }
         url = "http://game-api-pre.skymavis.com/v1/players/me/items/1/claim"
         try:
-            response = self.request.post(url, headers=headers)
-        except RetryError as e:
+            async with session.post(url, headers=headers) as response:
+                status = response.status
+                data = await response.json(content_type=None) if 200 <= status <= 299 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logging.critical(f"Important: Error! Executing SLP claim API call for account {self.acc_name}"
                              f"({self.account.replace('0x', 'ronin:')}). Error {e}")
-            return
-        if 200 <= response.status_code <= 299:
-            signature = response.json()["blockchainRelated"].get("signature")
+            return None
+        if data is not None:
+            signature = data["blockchainRelated"].get("signature")
             if not signature or not signature["signature"]:
                 logging.critical(f"Important: Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) had no signature "
                                  "in blockchainRelated")
-                return
+                return None
         else:
             logging.info(f"Important: Claim for account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "had to be skipped")
-            return
-        nonce = get_nonce(self.account)
-        # Build claim
+            return None
+        return signature
+
+    async def async_send_claim(self, session, signature):
+        nonce = await async_get_nonce(self.account, session)
+        # Build claim, chainId is given so web3 does not block on the node to fill it
         claim = self.slp_contract.functions.checkpoint(
             Web3.toChecksumAddress(self.account),
             signature['amount'],
             signature['timestamp'],
             signature['signature']
-        ).buildTransaction({'gas': 492874, 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
+        ).buildTransaction({
+            'gas': self.gas_limit(signature, rpc=False),
+            'gasPrice': self.w3.toWei('1', 'gwei'),
+            'nonce': nonce,
+            'chainId': 2020
+        })
         # Sign claim
         signed_claim = self.w3.eth.account.sign_transaction(
             claim,
             private_key=self.private_key
         )
+        transaction = signed_claim.rawTransaction
         # Send raw transaction
-        self.w3.eth.send_raw_transaction(signed_claim.rawTransaction)
+        await async_rpc(session, "eth_sendRawTransaction", [Web3.toHex(transaction)], self.w3.provider.endpoint_uri)
         # Get transaction hash
-        hash = self.w3.toHex(self.w3.keccak(signed_claim.rawTransaction))
+        hash = self.w3.toHex(self.w3.keccak(transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(hash, self.call(signature))
+        logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
+                      f"finish (Nonce:{nonce}) (Hash: {hash})...")
+        return hash
+
+    async def async_wait_claim(self, session, hash):
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5 minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
-                              f"finish (Nonce:{nonce}) (Hash: {hash})...")
-                # Sleep 5 seconds not to constantly send requests!
-                await asyncio.sleep(5)
+        receipt = await asyncio.wrap_future(watch_receipt(hash, w3=self.w3))
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
+            balance = await async_check_balance(self.account, session, endpoint=self.w3.provider.endpoint_uri)
             logging.info(f"Important: SLP Claimed! New balance for account {self.acc_name} "
-                         f"({self.account.replace('0x', 'ronin:')}) is: {check_balance(self.account)}")
+                         f"({self.account.replace('0x', 'ronin:')}) is: {balance}")
         else:
             logging.info(f"Important: Claim for account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "failed")
+        return receipt
 
     def execute(self):
         unclaimed = self.has_unclaimed_slp()
@@ -185,7 +248,7 @@ class Claim(AxieGraphQL):
             signature['amount'],
             signature['timestamp'],
             signature['signature']
-        ).buildTransaction({'gas': 492874, 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
+        ).buildTransaction({'gas': self.gas_limit(signature), 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
         # Sign claim
         signed_claim = self.w3.eth.account.sign_transaction(
             claim,
@@ -195,26 +258,19 @@ class Claim(AxieGraphQL):
         self.w3.eth.send_raw_transaction(signed_claim.rawTransaction)
         # Get transaction hash
         hash = self.w3.toHex(self.w3.keccak(signed_claim.rawTransaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(hash, self.call(signature))
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5 minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
-                              f"finish (Nonce:{nonce}) (Hash: {hash})...")
-                # Sleep 5 seconds not to constantly send requests!
-                sleep(5)
+        logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
+                      f"finish (Nonce:{nonce}) (Hash: {hash})...")
+        receipt = wait_for_receipt(hash, w3=self.w3)
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: SLP Claimed! New balance for account {self.acc_name} "
                          f"({self.account.replace('0x', 'ronin:')}) is: {check_balance(self.account)}")
@@ -227,12 +283,10 @@ class Claim(AxieGraphQL):
 
 
 class TrezorClaim(TrezorAxieGraphQL):
-    def __init__(self, acc_name, force, **kwargs):
+    def __init__(self, acc_name, force, w3=None, gas_estimator=None, **kwargs):
         super().__init__(**kwargs)
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": self.user_agent}}))
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
         self.slp_contract = self.w3.eth.contract(
             address=Web3.toChecksumAddress(SLP_CONTRACT),
             abi=SLP_ABI
@@ -259,70 +313,122 @@ class TrezorClaim(TrezorAxieGraphQL):
                              f"({self.account.replace('0x','ronin:')})")
             return None
         if 200 <= response.status_code <= 299:
-            data = response.json()
-            last_claimed = datetime.utcfromtimestamp(data['lastClaimedItemAt'])
-            next_claim_date = last_claimed + timedelta(days=14)
-            utcnow = datetime.utcnow()
-            if utcnow < next_claim_date and not self.force:
-                logging.critical(f"Important: This account will be claimable again on {self.humanize_date(next_claim_date)}.")
-                return None
-            elif self.force:
-                logging.info('Important: Skipping check of dates, --force option was selected')
-            claimable_total = int(data['rawTotal']) - int(data['rawClaimableTotal'])
-            if claimable_total > 0:
-                return claimable_total
+            return self.claimable_amount(response.json())
         return None
 
-    async def async_execute(self):
-        unclaimed = self.has_unclaimed_slp()
+    async def async_has_unclaimed_slp(self, session):
+        url = f"http://game-api-pre.skymavis.com/v1/players/{self.account}/items/1"
+        try:
+            async with session.get(url, headers={"User-Agent": self.user_agent}) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            logging.critical(f"Important: Failed to check if there is unclaimed SLP for acc {self.acc_name} "
+                             f"({self.account.replace('0x','ronin:')})")
+            return None
+        return self.claimable_amount(data)
+
+    def claimable_amount(self, data):
+        last_claimed = datetime.utcfromtimestamp(data['lastClaimedItemAt'])
+        next_claim_date = last_claimed + timedelta(days=14)
+        utcnow = datetime.utcnow()
+        if utcnow < next_claim_date and not self.force:
+            logging.critical(
+                f"Important: This account will be claimable again on {self.humanize_date(next_claim_date)}.")
+            return None
+        elif self.force:
+            logging.info('Important: Skipping check of dates, --force option was selected')
+        claimable_total = int(data['rawTotal']) - int(data['rawClaimableTotal'])
+        if claimable_total > 0:
+            return claimable_total
+        return None
+
+    def gas_limit(self, signature, rpc=True):
+        # The async path passes rpc=False, only a learned limit is used there so the event loop never blocks
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(signature), self.gas, w3=self.w3, rpc=rpc)
+
+    def call(self, signature):
+        return {
+            "from": Web3.toChecksumAddress(self.account),
+            "to": Web3.toChecksumAddress(SLP_CONTRACT),
+            "data": encode_checkpoint(
+                Web3.toChecksumAddress(self.account),
+                signature['amount'],
+                signature['timestamp'],
+                signature['signature']
+            ),
+            "value": 0
+        }
+
+    async def async_execute(self, session=None):
+        if session is None:
+            async with get_async_session() as session:
+                return await self.async_execute(session)
+        unclaimed = await self.async_has_unclaimed_slp(session)
         if not unclaimed:
             logging.info(f"Important: Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "has no claimable SLP")
             return
         logging.info(f"Important: Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) has "
                      f"{unclaimed} unclaimed SLP")
-        jwt = self.get_jwt()
+        jwt = await self.async_get_jwt(session)
         if not jwt:
             logging.critical("Important: Skipping claiming, we could not get the JWT for account "
                              f"{self.account.replace('0x', 'ronin:')}")
             return
+        signature = await self.async_claim_signature(session, jwt)
+        if not signature:
+            return
+        hash = await self.async_send_claim(session, signature)
+        receipt = await self.async_wait_claim(session, hash)
+        return receipt is not None and receipt["status"] == 1
+
+    async def async_claim_signature(self, session, jwt):
         headers = {
             "User-Agent": self.user_agent,
             "authorization": f"Bearer {jwt}"
         }
         url = "http://game-api-pre.skymavis.com/v1/players/me/items/1/claim"
         try:
-            response = self.request.post(url, headers=headers)
-        except RetryError as e:
+            async with session.post(url, headers=headers) as response:
+                status = response.status
+                data = await response.json(content_type=None) if 200 <= status <= 299 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logging.critical(f"Important: Error! Executing SLP claim API call for account {self.acc_name}"
                              f"({self.account.replace('0x', 'ronin:')}). Error {e}")
-            return
-        if 200 <= response.status_code <= 299:
-            signature = response.json()["blockchainRelated"].get("signature")
+            return None
+        if data is not None:
+            signature = data["blockchainRelated"].get("signature")
             if not signature or not signature["signature"]:
                 logging.critical(f"Important: Account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) had no signature "
                                  "in blockchainRelated")
-                return
+                return None
         else:
             logging.info(f"Important: Claim for account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "had to be skipped")
-            return
-        nonce = get_nonce(self.account)
-        # Build claim
-        claim = self.slp_contract.functions.checkpoint(
+            return None
+        return signature
+
+    async def async_send_claim(self, session, signature):
+        nonce = await async_get_nonce(self.account, session)
+        gas = self.gas_limit(signature, rpc=False)
+        # Build claim, the transaction is rebuilt by hand so web3 never has to ask the node for defaults
+        data = self.w3.toBytes(hexstr=self.slp_contract.encodeABI(fn_name='checkpoint', args=[
             Web3.toChecksumAddress(self.account),
             signature['amount'],
             signature['timestamp'],
             signature['signature']
-        ).buildTransaction({'gas': self.gas, 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
-        data = self.w3.toBytes(hexstr=claim['data'])
+        ]))
         to = self.w3.toBytes(hexstr=SLP_CONTRACT)
         sig = ethereum.sign_tx(
             self.client,
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.gwei,
-            gas_limit=self.gas,
+            gas_limit=gas,
             to=SLP_CONTRACT,
             value=0,
             data=data,
@@ -332,38 +438,35 @@ class TrezorClaim(TrezorAxieGraphQL):
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.gwei, self.gas, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.gwei, gas, to, 0, data) + sig)
         # Send raw transaction
-        self.w3.eth.send_raw_transaction(transaction)
+        await async_rpc(session, "eth_sendRawTransaction", [Web3.toHex(transaction)], self.w3.provider.endpoint_uri)
+        # Get transaction hash
         hash = self.w3.toHex(self.w3.keccak(transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(hash, self.call(signature))
+        logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
+                      f"finish (Nonce:{nonce}) (Hash: {hash})...")
+        return hash
+
+    async def async_wait_claim(self, session, hash):
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5 minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
-                              f"finish (Nonce:{nonce}) (Hash: {hash})...")
-                # Sleep 5 seconds not to constantly send requests!
-                await asyncio.sleep(5)
+        receipt = await asyncio.wrap_future(watch_receipt(hash, w3=self.w3))
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
+            balance = await async_check_balance(self.account, session, endpoint=self.w3.provider.endpoint_uri)
             logging.info(f"Important: SLP Claimed! New balance for account {self.acc_name} "
-                         f"({self.account.replace('0x', 'ronin:')}) is: {check_balance(self.account)}")
-            return
+                         f"({self.account.replace('0x', 'ronin:')}) is: {balance}")
         else:
             logging.info(f"Important: Claim for account {self.acc_name} ({self.account.replace('0x', 'ronin:')}) "
                          "failed")
-        return
+        return receipt
 
     def execute(self):
         unclaimed = self.has_unclaimed_slp()
@@ -400,13 +503,14 @@ class TrezorClaim(TrezorAxieGraphQL):
                          "had to be skipped")
             return
         nonce = get_nonce(self.account)
+        gas = self.gas_limit(signature)
         # Build claim
         claim = self.slp_contract.functions.checkpoint(
             Web3.toChecksumAddress(self.account),
             signature['amount'],
             signature['timestamp'],
             signature['signature']
-        ).buildTransaction({'gas': self.gas, 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
+        ).buildTransaction({'gas': gas, 'gasPrice': self.w3.toWei('1', 'gwei'), 'nonce': nonce})
         data = self.w3.toBytes(hexstr=claim['data'])
         to = self.w3.toBytes(hexstr=SLP_CONTRACT)
         sig = ethereum.sign_tx(
@@ -414,7 +518,7 @@ class TrezorClaim(TrezorAxieGraphQL):
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.gwei,
-            gas_limit=self.gas,
+            gas_limit=gas,
             to=SLP_CONTRACT,
             value=0,
             data=data,
@@ -424,30 +528,23 @@ class TrezorClaim(TrezorAxieGraphQL):
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.gwei, self.gas, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.gwei, gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
         hash = self.w3.toHex(self.w3.keccak(transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(hash, self.call(signature))
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5 minutes for this tx to respond
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
-                              f"finish (Nonce:{nonce}) (Hash: {hash})...")
-                # Sleep 5 seconds not to constantly send requests!
-                sleep(5)
+        logging.debug(f"Waiting for claim for {self.acc_name} ({self.account.replace('0x', 'ronin:')}) to "
+                      f"finish (Nonce:{nonce}) (Hash: {hash})...")
+        receipt = wait_for_receipt(hash, w3=self.w3)
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: SLP Claimed! New balance for account {self.acc_name} "
                          f"({self.account.replace('0x', 'ronin:')}) is: {check_balance(self.account)}")
@@ -459,3 +556,102 @@ class TrezorClaim(TrezorAxieGraphQL):
 
     def __str__(self):
         return f"SLP claim for account {self.account.replace('0x', 'ronin:')}"
+
+
+async def async_execute_claims(claims, max_concurrency=MAX_CONCURRENCY):
+    # Runs the claims on one shared aiohttp session, never more than max_concurrency at a time
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with get_async_session(max_concurrency) as session:
+        async def run(claim):
+            async with semaphore:
+                try:
+                    return await claim.async_execute(session)
+                except Exception as e:
+                    logging.critical(f"Important: {claim} failed. Error given: {e}")
+        return await asyncio.gather(*[run(claim) for claim in claims])
+
+
+CLAIM_STAGES = {
+    'unclaimed': 20,
+    'jwt': 10,
+    'claim_api': 10,
+    'send': 10,
+    'receipt': 1000
+}
+
+
+class ClaimBatch:
+    # Claims for many accounts, every account moves through the stages on its own so a slow
+    # game-api call never holds back signing and broadcasting for the rest
+    def __init__(self, accounts, force=False, w3=None, concurrency=None, rates=None, jwt_cache=None,
+                 gas_estimator=None):
+        # accounts is an iterable of (acc_name, account, private_key)
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.claims = [
+            Claim(acc_name=acc_name, account=account, private_key=private_key, force=force, w3=self.w3,
+                  jwt_cache=jwt_cache, gas_estimator=gas_estimator)
+            for acc_name, account, private_key in accounts
+        ]
+        self.concurrency = dict(CLAIM_STAGES, **(concurrency or {}))
+        self.rates = rates or {}
+
+    async def _run(self, claim, session, limiters):
+        report = {
+            "acc_name": claim.acc_name,
+            "account": claim.account.replace('0x', 'ronin:'),
+            "status": "skipped",
+            "stage": "unclaimed",
+            "amount": None,
+            "hash": None,
+            "error": None
+        }
+        try:
+            async with limiters['unclaimed']:
+                report['amount'] = await claim.async_has_unclaimed_slp(session)
+            if not report['amount']:
+                return report
+            report['stage'] = 'jwt'
+            async with limiters['jwt']:
+                jwt = await claim.async_get_jwt(session)
+            if not jwt:
+                report['status'] = 'failed'
+                return report
+            report['stage'] = 'claim_api'
+            async with limiters['claim_api']:
+                signature = await claim.async_claim_signature(session, jwt)
+            if not signature:
+                report['status'] = 'failed'
+                return report
+            report['stage'] = 'send'
+            async with limiters['send']:
+                report['hash'] = await claim.async_send_claim(session, signature)
+            report['stage'] = 'receipt'
+            async with limiters['receipt']:
+                receipt = await claim.async_wait_claim(session, report['hash'])
+            if receipt is None:
+                report['status'] = 'timeout'
+            else:
+                report['status'] = 'claimed' if receipt['status'] == 1 else 'failed'
+        except Exception as e:
+            logging.critical(f"Important: {claim} failed at stage {report['stage']}. Error given: {e}")
+            report['status'] = 'error'
+            report['error'] = str(e)
+        return report
+
+    async def async_execute(self, session=None):
+        if session is None:
+            # The receipt stage only waits on the watcher, it does not need connections of its own
+            limit = max(limit for stage, limit in self.concurrency.items() if stage != 'receipt')
+            async with get_async_session(limit) as session:
+                return await self.async_execute(session)
+        limiters = {
+            stage: StageLimiter(self.concurrency[stage], self.rates.get(stage))
+            for stage in CLAIM_STAGES
+        }
+        return await asyncio.gather(*[self._run(claim, session, limiters) for claim in self.claims])
+
+    def execute(self):
+        reports = asyncio.run(self.async_execute())
+        claimed = sum(1 for report in reports if report['status'] == 'claimed')
+        logging.info(f"Important: Claimed {claimed} out of {len(reports)} accounts")
+        return reports
@@ -1,20 +1,107 @@
+import asyncio
+import base64
+import json
 import logging
+import os
+import threading
+from time import time
 
 from eth_account.messages import encode_defunct
+import aiohttp
 import requests
 from requests.adapters import HTTPAdapter
 from requests.exceptions import RetryError
 from web3 import Web3
 from hexbytes import HexBytes
-from trezorlib import ethereum
-from trezorlib.tools import parse_path
 
-from axie_utils.utils import USER_AGENT, RETRIES
+from axie_utils.utils import ethereum, parse_path, USER_AGENT, RETRIES
+
+
+JWT_EXPIRY_MARGIN = 300
+
+
+def jwt_expiry(token):
+    # Reads the exp claim without verifying the token, it is only used to know when to stop reusing it
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class JWTCache:
+    def __init__(self, margin=JWT_EXPIRY_MARGIN):
+        self.margin = margin
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, account):
+        with self._lock:
+            token, expiry = self._tokens.get(account, (None, 0))
+        if expiry - self.margin > time():
+            return token
+        return None
+
+    def set(self, account, token):
+        expiry = jwt_expiry(token)
+        if expiry is None:
+            logging.debug(f"Not caching JWT for {account}, it has no expiry")
+            return
+        with self._lock:
+            self._tokens[account] = (token, expiry)
+            self.save()
+
+    def invalidate(self, account):
+        with self._lock:
+            if self._tokens.pop(account, None):
+                self.save()
+
+    def save(self):
+        pass
+
+
+class EncryptedJWTCache(JWTCache):
+    # Keeps the tokens in a Fernet encrypted file so restarts do not have to log every account in again.
+    # Needs the optional cryptography package
+    def __init__(self, path, key, margin=JWT_EXPIRY_MARGIN):
+        try:
+            from cryptography.fernet import Fernet, InvalidToken
+        except ImportError:
+            raise ImportError("EncryptedJWTCache needs the cryptography package, install it with "
+                              "'pip install cryptography'")
+        super().__init__(margin)
+        self.path = path
+        self._fernet = Fernet(key)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    tokens = json.loads(self._fernet.decrypt(f.read()))
+            except (InvalidToken, ValueError) as e:
+                logging.warning(f"Ignoring unreadable JWT cache {path}: {e!r}")
+            else:
+                self._tokens = {account: tuple(entry) for account, entry in tokens.items()}
+
+    @staticmethod
+    def generate_key():
+        from cryptography.fernet import Fernet
+        return Fernet.generate_key()
+
+    def save(self):
+        # Called with the lock held
+        now = time()
+        tokens = {account: entry for account, entry in self._tokens.items() if entry[1] > now}
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self._fernet.encrypt(json.dumps(tokens).encode()))
+        os.replace(tmp_path, self.path)
 
 
 class AxieGraphQL:
-    def __init__(self, account, private_key, **kwargs):
+    def __init__(self, account, private_key, jwt_cache=None, **kwargs):
         self.account = account.lower().replace("ronin:", "0x")
+        self.jwt_cache = jwt_cache
         self.private_key = private_key.lower()
         self.request = requests.Session()
         self.request.mount('https://', HTTPAdapter(max_retries=RETRIES))
@@ -40,6 +127,10 @@ class AxieGraphQL:
         return None
 
     def get_jwt(self):
+        if self.jwt_cache is not None:
+            token = self.jwt_cache.get(self.account)
+            if token:
+                return token
         msg = self.create_random_msg()
         if not msg:
             return None
@@ -74,13 +165,83 @@ class AxieGraphQL:
                 logging.critical("Could not retreive JWT, probably your private key for this account is wrong. "
                                  f"Account: {self.account.replace('0x','ronin:')} \n AccountName: {self.acc_name}")
                 return None
-            return response.json()['data']['createAccessTokenWithSignature']['accessToken']
+            token = response.json()['data']['createAccessTokenWithSignature']['accessToken']
+            if self.jwt_cache is not None:
+                self.jwt_cache.set(self.account, token)
+            return token
         return None
 
+    async def async_create_random_msg(self, session):
+        payload = {
+            "operationName": "CreateRandomMessage",
+            "variables": {},
+            "query": "mutation CreateRandomMessage{createRandomMessage}"
+        }
+        url = "https://graphql-gateway.axieinfinity.com/graphql"
+        try:
+            async with session.post(url, json=payload) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.critical(f"Error! Creating random msg! Error: {e}")
+            return None
+        try:
+            return data['data']['createRandomMessage']
+        except (KeyError, TypeError):
+            return None
+
+    async def async_get_jwt(self, session):
+        if self.jwt_cache is not None:
+            token = self.jwt_cache.get(self.account)
+            if token:
+                return token
+        msg = await self.async_create_random_msg(session)
+        if not msg:
+            return None
+        signed_msg = Web3().eth.account.sign_message(
+            encode_defunct(text=msg),
+            private_key=self.private_key
+        )
+        hex_msg = signed_msg['signature'].hex()
+        payload = {
+            "operationName": "CreateAccessTokenWithSignature",
+            "variables": {
+                "input": {
+                    "mainnet": "ronin",
+                    "owner": f"{self.account}",
+                    "message": f"{msg}",
+                    "signature": f"{hex_msg}"
+                }
+            },
+            "query": "mutation CreateAccessTokenWithSignature($input: SignatureInput!)"
+            "{createAccessTokenWithSignature(input: $input) "
+            "{newAccount result accessToken __typename}}"
+        }
+        url = "https://graphql-gateway.axieinfinity.com/graphql"
+        try:
+            async with session.post(url, headers={"User-Agent": self.user_agent}, json=payload) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.critical(f"Error! Getting JWT! Error: {e}")
+            return None
+        if (not data.get('data') or not data['data'].get('createAccessTokenWithSignature') or
+           not data['data']['createAccessTokenWithSignature'].get('accessToken')):
+            logging.critical("Could not retreive JWT, probably your private key for this account is wrong. "
+                             f"Account: {self.account.replace('0x','ronin:')} \n AccountName: {self.acc_name}")
+            return None
+        token = data['data']['createAccessTokenWithSignature']['accessToken']
+        if self.jwt_cache is not None:
+            self.jwt_cache.set(self.account, token)
+        return token
+
 
 class TrezorAxieGraphQL:
-    def __init__(self, account, client, bip_path):
+    def __init__(self, account, client, bip_path, jwt_cache=None):
         self.account = account.lower().replace("ronin:", "0x")
+        self.jwt_cache = jwt_cache
         self.request = requests.Session()
         self.request.mount('https://', HTTPAdapter(max_retries=RETRIES))
         self.user_agent = USER_AGENT
@@ -107,6 +268,10 @@ class TrezorAxieGraphQL:
         return None
 
     def get_jwt(self):
+        if self.jwt_cache is not None:
+            token = self.jwt_cache.get(self.account)
+            if token:
+                return token
         msg = self.create_random_msg()
         if not msg:
             return None
@@ -138,5 +303,72 @@ class TrezorAxieGraphQL:
                 logging.critical("Could not retreive JWT, probably your private key for this account is wrong. "
                                  f"Account: {self.account.replace('0x','ronin:')} \n AccountName: {self.acc_name}")
                 return None
-            return response.json()['data']['createAccessTokenWithSignature']['accessToken']
+            token = response.json()['data']['createAccessTokenWithSignature']['accessToken']
+            if self.jwt_cache is not None:
+                self.jwt_cache.set(self.account, token)
+            return token
         return None
+
+    async def async_create_random_msg(self, session):
+        payload = {
+            "operationName": "CreateRandomMessage",
+            "variables": {},
+            "query": "mutation CreateRandomMessage{createRandomMessage}"
+        }
+        url = "https://graphql-gateway.axieinfinity.com/graphql"
+        try:
+            async with session.post(url, json=payload) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.critical(f"Error! Creating random msg! Error: {e}")
+            return None
+        try:
+            return data['data']['createRandomMessage']
+        except (KeyError, TypeError):
+            return None
+
+    async def async_get_jwt(self, session):
+        if self.jwt_cache is not None:
+            token = self.jwt_cache.get(self.account)
+            if token:
+                return token
+        msg = await self.async_create_random_msg(session)
+        if not msg:
+            return None
+        # The device handles one request at a time, so signing stays on the event loop thread
+        signed_msg = ethereum.sign_message(self.client, self.bip_path, msg)
+        hex_msg = HexBytes(signed_msg.signature).hex()
+        payload = {
+            "operationName": "CreateAccessTokenWithSignature",
+            "variables": {
+                "input": {
+                    "mainnet": "ronin",
+                    "owner": f"{self.account}",
+                    "message": f"{msg}",
+                    "signature": f"{hex_msg}"
+                }
+            },
+            "query": "mutation CreateAccessTokenWithSignature($input: SignatureInput!)"
+            "{createAccessTokenWithSignature(input: $input) "
+            "{newAccount result accessToken __typename}}"
+        }
+        url = "https://graphql-gateway.axieinfinity.com/graphql"
+        try:
+            async with session.post(url, headers={"User-Agent": self.user_agent}, json=payload) as response:
+                if not 200 <= response.status <= 299:
+                    return None
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.critical(f"Error! Getting JWT! Error: {e}")
+            return None
+        if (not data.get('data') or not data['data'].get('createAccessTokenWithSignature') or
+           not data['data']['createAccessTokenWithSignature'].get('accessToken')):
+            logging.critical("Could not retreive JWT, probably your private key for this account is wrong. "
+                             f"Account: {self.account.replace('0x','ronin:')} \n AccountName: {self.acc_name}")
+            return None
+        token = data['data']['createAccessTokenWithSignature']['accessToken']
+        if self.jwt_cache is not None:
+            self.jwt_cache.set(self.account, token)
+        return token
@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import random
+from time import time
+
+from web3 import Web3
+
+from axie_utils.axies import Axies
+from axie_utils.utils import (
+    _format_balance,
+    get_web3,
+    rpc_batch,
+    AXIE_CONTRACT,
+    BALANCE_OF_SELECTOR,
+    RONIN_PROVIDER,
+    TOKEN
+)
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+LOG_CHUNK = 2000
+LOG_CONFIRMATIONS = 5
+LOG_BATCH_SIZE = 10
+TOPIC_ACCOUNTS = 100
+BALANCE_TOKENS = ('slp', 'axs', 'weth', 'usdc')
+BALANCE_INDEX_MAX_AGE = 60
+
+
+def _topic(address):
+    return '0x' + address[2:].rjust(64, '0')
+
+
+def _address(topic):
+    return '0x' + topic[-40:]
+
+
+class TransferLogIndexer:
+    # Replays Transfer logs that touch the watched accounts, block range by block range, and remembers the
+    # last block it processed. Subclasses keep their own state through apply, state and load_state
+    def __init__(self, address, accounts, path=None, w3=None, start_block=0,
+                 chunk_size=LOG_CHUNK, confirmations=LOG_CONFIRMATIONS):
+        self.address = address
+        self.accounts = sorted({account.replace("ronin:", "0x").lower() for account in accounts})
+        self.path = path
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.endpoint = self.w3.provider.endpoint_uri
+        self.chunk_size = chunk_size
+        self.confirmations = confirmations
+        self.block = start_block - 1
+        self.topics = []
+        for start in range(0, len(self.accounts), TOPIC_ACCOUNTS):
+            group = [_topic(account) for account in self.accounts[start:start + TOPIC_ACCOUNTS]]
+            self.topics.append([TRANSFER_TOPIC, group])
+            self.topics.append([TRANSFER_TOPIC, None, group])
+        if path and os.path.exists(path):
+            self.load()
+
+    def apply(self, log):
+        raise NotImplementedError
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+    def accepts(self, state):
+        return True
+
+    def load(self):
+        with open(self.path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('accounts') != self.accounts or not self.accepts(checkpoint['state']):
+            # New accounts or tokens have no history in this checkpoint, the caller has to bootstrap again
+            logging.warning(f"Ignoring checkpoint {self.path}, it was built for other accounts or tokens")
+            return
+        self.block = checkpoint['block']
+        self.load_state(checkpoint['state'])
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"block": self.block, "accounts": self.accounts, "state": self.state()}, f)
+        os.replace(tmp_path, self.path)
+
+    def head(self):
+        response = rpc_batch([("eth_blockNumber", [])], self.endpoint)[0]
+        if 'error' in response:
+            raise ValueError(f"Could not get the latest block: {response['error']}")
+        return int(response['result'], 16)
+
+    def get_logs(self, from_block, to_block):
+        # Ranges the node refuses (too many results, timeouts) are split in half and asked again
+        ranges = [
+            (start, min(start + self.chunk_size - 1, to_block))
+            for start in range(from_block, to_block + 1, self.chunk_size)
+        ]
+        logs = {}
+        while ranges:
+            calls = [
+                ("eth_getLogs", [{
+                    "address": self.address,
+                    "fromBlock": hex(start),
+                    "toBlock": hex(end),
+                    "topics": topics
+                }])
+                for start, end in ranges
+                for topics in self.topics
+            ]
+            responses = rpc_batch(calls, self.endpoint, LOG_BATCH_SIZE)
+            retry = []
+            for i, (start, end) in enumerate(ranges):
+                answers = responses[i * len(self.topics):(i + 1) * len(self.topics)]
+                errors = [answer['error'] for answer in answers if 'error' in answer]
+                if not errors:
+                    for answer in answers:
+                        for log in answer['result']:
+                            # A transfer between two watched accounts is returned by both filters
+                            logs[(int(log['blockNumber'], 16), int(log['logIndex'], 16))] = log
+                elif start == end:
+                    raise ValueError(f"Could not get logs for block {start}: {errors[0]}")
+                else:
+                    middle = (start + end) // 2
+                    retry.extend([(start, middle), (middle + 1, end)])
+            ranges = retry
+        return [logs[key] for key in sorted(logs)]
+
+    def refresh(self, to_block=None):
+        # Processes every new block up to to_block (default: head minus confirmations), returns the logs applied
+        if not self.accounts:
+            return []
+        if to_block is None:
+            to_block = self.head() - self.confirmations
+        applied = []
+        window = self.chunk_size * LOG_BATCH_SIZE
+        while self.block < to_block:
+            end = min(self.block + window, to_block)
+            for log in self.get_logs(self.block + 1, end):
+                self.apply(log)
+                applied.append(log)
+            self.block = end
+            self.save()
+        return applied
+
+
+class AxieIndexer(TransferLogIndexer):
+    # Owner -> axies index for the watched accounts, answered locally once the Transfer logs are replayed
+    def __init__(self, accounts, path=None, w3=None, start_block=0, **kwargs):
+        self.owners = {}
+        self.axie_owners = {}
+        super().__init__(AXIE_CONTRACT, accounts, path=path, w3=w3, start_block=start_block, **kwargs)
+        for account in self.accounts:
+            self.owners.setdefault(account, set())
+
+    def apply(self, log):
+        sender, receiver = _address(log['topics'][1]), _address(log['topics'][2])
+        axie = int(log['topics'][3], 16)
+        if sender in self.owners:
+            self.owners[sender].discard(axie)
+            self.axie_owners.pop(axie, None)
+        if receiver in self.owners:
+            self.owners[receiver].add(axie)
+            self.axie_owners[axie] = receiver
+
+    def state(self):
+        return {account: sorted(axies) for account, axies in self.owners.items()}
+
+    def load_state(self, state):
+        self.owners = {account: set(axies) for account, axies in state.items()}
+        self.axie_owners = {axie: account for account, axies in self.owners.items() for axie in axies}
+
+    def bootstrap(self):
+        # Seeds the index by enumerating every account, then only logs after that block are replayed.
+        # Logs that land while enumerating are replayed on top, which is harmless
+        block = self.head()
+        self.load_state({account: Axies(account, w3=self.w3).get_axies() for account in self.accounts})
+        self.block = block
+        self.save()
+
+    def get_axies(self, account):
+        return sorted(self.owners.get(account.replace("ronin:", "0x").lower(), ()))
+
+    def owner_of(self, axie_id):
+        # Only knows about the watched accounts
+        return self.axie_owners.get(axie_id)
+
+    def refresh(self, to_block=None):
+        # Returns the axies that moved in or out of the watched accounts
+        return sorted({int(log['topics'][3], 16) for log in super().refresh(to_block)})
+
+
+class BalanceIndexer(TransferLogIndexer):
+    # ERC-20 balances of the watched accounts kept up to date from Transfer logs. Balances live in one flat
+    # list indexed by account index * number of tokens + token index; 18 decimal balances do not fit in
+    # fixed width arrays
+    def __init__(self, accounts, tokens=BALANCE_TOKENS, path=None, w3=None, start_block=0, **kwargs):
+        self.tokens = [token.lower() for token in tokens]
+        self.contracts = [TOKEN[token] for token in self.tokens]
+        self.token_index = {contract: i for i, contract in enumerate(self.contracts)}
+        self.balances = None
+        self.refreshed_at = 0
+        super().__init__(self.contracts, accounts, path=path, w3=w3, start_block=start_block, **kwargs)
+        self.account_index = {account: i for i, account in enumerate(self.accounts)}
+        if self.balances is None:
+            self.balances = [0] * (len(self.accounts) * len(self.tokens))
+
+    def _cell(self, account, token):
+        row = self.account_index.get(account)
+        col = self.token_index.get(token)
+        if row is None or col is None:
+            return None
+        return row * len(self.tokens) + col
+
+    def apply(self, log):
+        value = int(log['data'], 16)
+        contract = log['address'].lower()
+        sender = self._cell(_address(log['topics'][1]), contract)
+        receiver = self._cell(_address(log['topics'][2]), contract)
+        if sender is not None:
+            self.balances[sender] -= value
+        if receiver is not None:
+            self.balances[receiver] += value
+
+    def state(self):
+        return {"tokens": self.tokens, "balances": self.balances}
+
+    def accepts(self, state):
+        return state.get('tokens') == self.tokens
+
+    def load_state(self, state):
+        self.balances = state['balances']
+
+    def refresh(self, to_block=None):
+        # Returns the accounts whose balances moved
+        touched = set()
+        for log in super().refresh(to_block):
+            touched.update(_address(topic) for topic in log['topics'][1:3])
+        self.refreshed_at = time()
+        return sorted(touched.intersection(self.account_index))
+
+    def is_fresh(self, max_age=BALANCE_INDEX_MAX_AGE):
+        return time() - self.refreshed_at <= max_age
+
+    def balance(self, account, token='slp'):
+        token = token.lower()
+        if token not in TOKEN:
+            return None
+        cell = self._cell(account.replace("ronin:", "0x").lower(), TOKEN[token])
+        if cell is None:
+            return None
+        return _format_balance(token, self.balances[cell])
+
+    def reconcile(self, accounts=None, sample=None, fix=True):
+        # Compares the index with balanceOf at the last indexed block, returns
+        # (account, token, indexed, on chain) for every mismatch and, unless told otherwise, trusts the chain
+        if accounts is None:
+            accounts = self.accounts
+        accounts = [account.replace("ronin:", "0x").lower() for account in accounts]
+        if sample is not None and sample < len(accounts):
+            accounts = random.sample(accounts, sample)
+        cells = []
+        calls = []
+        for account in accounts:
+            for token, contract in zip(self.tokens, self.contracts):
+                cell = self._cell(account, contract)
+                if cell is None:
+                    continue
+                data = BALANCE_OF_SELECTOR + account[2:].rjust(64, '0')
+                calls.append(("eth_call", [{"to": contract, "data": data}, hex(self.block)]))
+                cells.append((account, token, cell))
+        mismatches = []
+        for (account, token, cell), response in zip(cells, rpc_batch(calls, self.endpoint)):
+            if 'error' in response or response.get('result') in (None, '0x'):
+                logging.warning(f"Could not reconcile {token} balance for {account}: {response.get('error')}")
+                continue
+            actual = int(response['result'], 16)
+            if actual != self.balances[cell]:
+                mismatches.append((account, token, self.balances[cell], actual))
+                if fix:
+                    self.balances[cell] = actual
+        if mismatches:
+            logging.warning(f"Found {len(mismatches)} balance mismatches reconciling {len(accounts)} accounts")
+            if fix:
+                self.save()
+        return mismatches
+
+    def bootstrap(self):
+        # Seeds every balance from balanceOf, only logs after that block are replayed afterwards
+        self.block = self.head() - self.confirmations
+        self.reconcile()
+        self.refreshed_at = time()
+        self.save()
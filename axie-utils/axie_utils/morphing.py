@@ -1,12 +1,58 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from eth_account.messages import encode_defunct
 from hexbytes import HexBytes
-from trezorlib import ethereum
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RetryError
 from web3 import Web3
 
 from axie_utils.graphql import AxieGraphQL, TrezorAxieGraphQL
+from axie_utils.utils import ethereum, MAX_CONCURRENCY, RETRIES
+
+
+def send_morph(request, user_agent, account, axie, jwt, signature):
+    # Returns 'morphed', 'failed' or 'not_ready'
+    headers = {
+        "User-Agent": user_agent,
+        "authorization": f"Bearer {jwt}"
+    }
+    payload = {
+        "operationName": "MorphAxie",
+        "variables": {
+            "axieId": f"{axie}",
+            "owner": f"{account}",
+            "signature": f"{signature}"
+        },
+        "query": "mutation MorphAxie($axieId: ID!, $owner: String!, $signature: String!) "
+        "{morphAxie(axieId: $axieId, owner: $owner, signature: $signature)}"
+    }
+    url = 'https://graphql-gateway.axieinfinity.com/graphql'
+    try:
+        response = request.post(url, headers=headers, json=payload)
+    except RetryError:
+        logging.critical(f"Important: Axie {axie} in {account} is not ready to be morphed!")
+        return 'not_ready'
+    if 200 <= response.status_code <= 299:
+        if response.json().get('data') and response.json()['data'].get('morphAxie'):
+            logging.info(f"Important: Axie {axie} in {account} correctly morphed!")
+            return 'morphed'
+        logging.info(f"Important: Something went wrong morphing axie {axie} in {account}")
+        return 'failed'
+    logging.critical(f"Important: Axie {axie} in {account} is not ready to be morphed!")
+    return 'not_ready'
+
+
+def send_morphs(batch, jwt, signatures):
+    if not jwt:
+        logging.critical("Important: Skipping morphing, we could not get the JWT for account "
+                         f"{batch.account.replace('0x', 'ronin:')}")
+        return {axie: 'failed' for axie in batch.axies}
+    with ThreadPoolExecutor(max_workers=batch.max_workers) as pool:
+        results = pool.map(
+            lambda axie: send_morph(batch.request, batch.user_agent, batch.account, axie, jwt, signatures[axie]),
+            batch.axies)
+        return dict(zip(batch.axies, results))
 
 
 class Morph(AxieGraphQL):
@@ -20,37 +66,7 @@ class Morph(AxieGraphQL):
         signed_msg = Web3().eth.account.sign_message(encode_defunct(text=msg),
                                                      private_key=self.private_key)
         signature = signed_msg['signature'].hex()
-        headers = {
-            "User-Agent": self.user_agent,
-            "authorization": f"Bearer {jwt}"
-        }
-        payload = {
-            "operationName": "MorphAxie",
-            "variables": {
-                "axieId": f"{self.axie}",
-                "owner": f"{self.account}",
-                "signature": f"{signature}"
-            },
-            "query": "mutation MorphAxie($axieId: ID!, $owner: String!, $signature: String!) "
-            "{morphAxie(axieId: $axieId, owner: $owner, signature: $signature)}"
-        }
-        url = 'https://graphql-gateway.axieinfinity.com/graphql'
-        try:
-            response = self.request.post(url, headers=headers, json=payload)
-        except RetryError:
-            logging.critical(f"Important: Axie {self.axie} in {self.account} is not ready to be morphed!")
-            return
-
-        if 200 <= response.status_code <= 299:
-            if response.json().get('data') and response.json()['data'].get('morphAxie'):
-                logging.info(f"Important: Axie {self.axie} in {self.account} correctly morphed!")
-                return
-            else:
-                logging.info(f"Important: Something went wrong morphing axie {self.axie} in {self.account}")
-                return
-        else:
-            logging.critical(f"Important: Axie {self.axie} in {self.account} is not ready to be morphed!")
-        return
+        return send_morph(self.request, self.user_agent, self.account, self.axie, jwt, signature)
 
 
 class TrezorMorph(TrezorAxieGraphQL):
@@ -63,31 +79,52 @@ class TrezorMorph(TrezorAxieGraphQL):
         msg = f"axie_id={self.axie}&owner={self.account}"
         signed_msg = ethereum.sign_message(self.client, self.bip_path, msg)
         signature = HexBytes(signed_msg.signature).hex()
-        headers = {
-            "User-Agent": self.user_agent,
-            "authorization": f"Bearer {jwt}"
-        }
-        payload = {
-            "operationName": "MorphAxie",
-            "variables": {
-                "axieId": f"{self.axie}",
-                "owner": f"{self.account}",
-                "signature": f"{signature}"
-            },
-            "query": "mutation MorphAxie($axieId: ID!, $owner: String!, $signature: String!) "
-            "{morphAxie(axieId: $axieId, owner: $owner, signature: $signature)}"
-        }
-        url = 'https://graphql-gateway.axieinfinity.com/graphql'
+        return send_morph(self.request, self.user_agent, self.account, self.axie, jwt, signature)
+
+
+class MorphBatch(AxieGraphQL):
+    # Morphs many axies of one account: one login, every message signed up front, mutations sent concurrently
+    def __init__(self, axies, acc_name=None, max_workers=MAX_CONCURRENCY, **kwargs):
+        self.axies = list(axies)
+        self.acc_name = acc_name
+        self.max_workers = max_workers
+        super().__init__(**kwargs)
+        self.request.mount('https://', HTTPAdapter(pool_maxsize=max_workers, max_retries=RETRIES))
+
+    def sign_morphs(self):
+        signatures = {}
+        for axie in self.axies:
+            signed_msg = Web3().eth.account.sign_message(encode_defunct(text=f"axie_id={axie}&owner={self.account}"),
+                                                         private_key=self.private_key)
+            signatures[axie] = signed_msg['signature'].hex()
+        return signatures
+
+    def execute(self):
+        jwt = self.get_jwt()
+        return send_morphs(self, jwt, self.sign_morphs() if jwt else {})
+
+
+class TrezorMorphBatch(TrezorAxieGraphQL):
+    def __init__(self, axies, acc_name=None, max_workers=MAX_CONCURRENCY, **kwargs):
+        self.axies = list(axies)
+        self.acc_name = acc_name
+        self.max_workers = max_workers
+        super().__init__(**kwargs)
+        self.request.mount('https://', HTTPAdapter(pool_maxsize=max_workers, max_retries=RETRIES))
+
+    def sign_morphs(self):
+        signatures = {}
+        for axie in self.axies:
+            signed_msg = ethereum.sign_message(self.client, self.bip_path, f"axie_id={axie}&owner={self.account}")
+            signatures[axie] = HexBytes(signed_msg.signature).hex()
+        return signatures
+
+    def execute(self):
+        # Login and every morph signature share one device session
+        self.client.open()
         try:
-            response = self.request.post(url, headers=headers, json=payload)
-        except RetryError:
-            logging.critical(f"Axie {self.axie} in {self.account} is not ready to be morphed!")
-            return
-
-        if 200 <= response.status_code <= 299:
-            if response.json().get('data') and response.json()['data'].get('morphAxie'):
-                logging.info(f"Important: Axie {self.axie} in {self.account} correctly morphed!")
-            else:
-                logging.info(f"Important: Something went wrong morphing axie {self.axie} in {self.account}")
-        else:
-            logging.critical(f"Important: Axie {self.axie} in {self.account} is not ready to be morphed!")
+            jwt = self.get_jwt()
+            signatures = self.sign_morphs() if jwt else {}
+        finally:
+            self.client.close()
+        return send_morphs(self, jwt, signatures)
@@ -1,28 +1,33 @@
 import rlp
 import logging
-from datetime import datetime, timedelta
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 
-from trezorlib import ethereum
-from trezorlib.tools import parse_path
-from web3 import Web3, exceptions
+from web3 import Web3
 
 from axie_utils.abis import SLP_ABI
+from axie_utils.calldata import encode_transfer
+from axie_utils.scatter import Scatter
 from axie_utils.utils import (
     get_nonce,
+    wait_for_receipt,
+    watch_receipt,
+    get_web3,
+    preflight,
+    parse_path,
+    ethereum,
     SLP_CONTRACT,
-    RONIN_PROVIDER,
-    TIMEOUT_MINS,
-    USER_AGENT
+    RONIN_PROVIDER
 )
 
+SCATTER_THRESHOLD = 3
+PLANNER_WORKERS = 4
+
 
 class Payment:
-    def __init__(self, name, from_acc, from_private, to_acc, amount):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, name, from_acc, from_private, to_acc, amount, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 246437
         self.name = name
         self.from_acc = from_acc.replace("ronin:", "0x")
         self.from_private = from_private
@@ -40,17 +45,27 @@ class Payment:
         # Increase gas price to get tx unstuck
         self.execute(1.01, nonce)
 
-    def execute(self, gas_price=1, nonce=None):
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
+            "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(SLP_CONTRACT),
+            "data": encode_transfer(Web3.toChecksumAddress(self.to_acc), self.amount),
+            "value": 0
+        }
+
+    def send(self, nonce, gas_price=1):
         # Build transaction
         transaction = self.contract.functions.transfer(
             Web3.toChecksumAddress(self.to_acc),
             self.amount
         ).buildTransaction({
             "chainId": 2020,
-            "gas": 246437,
+            "gas": self.gas_limit(),
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce
         })
@@ -63,34 +78,33 @@ class Payment:
         self.w3.eth.send_raw_transaction(signed.rawTransaction)
         # get transaction _hash
         _hash = self.w3.toHex(self.w3.keccak(signed.rawTransaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
 
+    def execute(self, gas_price=1, nonce=None):
+        # Check enough SLP and RON are present, before a nonce is used
+        if not preflight([(self.from_acc, 'slp', self.amount)], endpoint=self.w3.provider.endpoint_uri)[0]:
+            return
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! _hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -104,11 +118,9 @@ class Payment:
 
 
 class TrezorPayment:
-    def __init__(self, name, client, bip_path, from_acc, to_acc, amount):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, name, client, bip_path, from_acc, to_acc, amount, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
         self.name = name
         self.from_acc = from_acc.replace("ronin:", "0x")
         self.to_acc = to_acc.replace("ronin:", "0x")
@@ -128,17 +140,40 @@ class TrezorPayment:
         # Increase gas price to get tx unstuck
         self.execute(1.01, nonce)
 
-    def execute(self, gas_price=1, nonce=None):
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
+            "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(SLP_CONTRACT),
+            "data": encode_transfer(Web3.toChecksumAddress(self.to_acc), self.amount),
+            "value": 0
+        }
+
+    def build(self, nonce, gas_price=1):
+        # Unsigned tx for a TrezorSigningSession
+        return {
+            "value": 0,
+            "chainId": 2020,
+            "gas": self.gas_limit(),
+            "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
+            "nonce": nonce,
+            "to": Web3.toChecksumAddress(SLP_CONTRACT),
+            "data": encode_transfer(Web3.toChecksumAddress(self.to_acc), self.amount)
+        }
+
+    def send(self, nonce, gas_price=1):
+        gas = self.gas_limit()
         # Build transaction
         send_tx = self.contract.functions.transfer(
             Web3.toChecksumAddress(self.to_acc),
             self.amount
         ).buildTransaction({
             "chainId": 2020,
-            "gas": self.gas,
+            "gas": gas,
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce
         })
@@ -149,7 +184,7 @@ class TrezorPayment:
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.w3.toWei(str(gas_price), "gwei"),
-            gas_limit=self.gas,
+            gas_limit=gas,
             to=SLP_CONTRACT,
             value=0,
             data=data,
@@ -159,38 +194,37 @@ class TrezorPayment:
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), 'gwei'), self.gas, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), 'gwei'), gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
         _hash = self.w3.toHex(self.w3.keccak(transaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5 minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
 
+    def execute(self, gas_price=1, nonce=None):
+        # Check enough SLP and RON are present, before a nonce is used
+        if not preflight([(self.from_acc, 'slp', self.amount)], endpoint=self.w3.provider.endpoint_uri)[0]:
+            return
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! _hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -201,3 +235,143 @@ class TrezorPayment:
 
     def __str__(self):
         return f"{self.name}({self.to_acc.replace('0x', 'ronin:')}) for the amount of {self.amount} SLP"
+
+
+class PaymentPlanner:
+    # Groups payments by sender and token. Groups with at least scatter_threshold recipients go out as one
+    # Scatter, the rest are sent as Payments with consecutive nonces and confirmed together. Payment only
+    # moves SLP, so other tokens always go through Scatter
+    def __init__(self, payments, private_keys, scatter_threshold=SCATTER_THRESHOLD, w3=None,
+                 gas_estimator=None, max_workers=PLANNER_WORKERS):
+        # payments is an iterable of (from_acc, to_acc, amount) or (from_acc, to_acc, amount, token),
+        # private_keys maps every sender to its private key
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.scatter_threshold = scatter_threshold
+        self.max_workers = max_workers
+        self.private_keys = {acc.replace("ronin:", "0x").lower(): key for acc, key in private_keys.items()}
+        self.payments = []
+        self.groups = {}
+        for i, payment in enumerate(payments):
+            from_acc, to_acc, amount = payment[:3]
+            token = payment[3].lower() if len(payment) > 3 else 'slp'
+            self.payments.append({
+                "from": from_acc.replace("ronin:", "0x").lower(),
+                "to": to_acc.replace("ronin:", "0x").lower(),
+                "amount": amount,
+                "token": token
+            })
+            self.groups.setdefault((self.payments[-1]['from'], token), []).append(i)
+
+    def plan(self, accepted=None):
+        # [(sender, token, 'scatter' or 'payment', payment indexes)], payments not accepted by the preflight
+        # are planned as 'rejected'
+        plan = []
+        for (sender, token), indexes in self.groups.items():
+            if accepted is not None:
+                rejected = [i for i in indexes if not accepted[i]]
+                if rejected:
+                    plan.append((sender, token, 'rejected', rejected))
+                indexes = [i for i in indexes if accepted[i]]
+                if not indexes:
+                    continue
+            recipients = {self.payments[i]['to'] for i in indexes}
+            if token != 'slp' or len(recipients) >= self.scatter_threshold:
+                plan.append((sender, token, 'scatter', indexes))
+            else:
+                plan.append((sender, token, 'payment', indexes))
+        return plan
+
+    def scatter(self, sender, token, indexes, gas_price=1):
+        amounts = {}
+        for i in indexes:
+            to_acc = self.payments[i]['to']
+            amounts[to_acc] = amounts.get(to_acc, 0) + self.payments[i]['amount']
+        scatter = Scatter(token, sender, self.private_keys[sender], amounts, w3=self.w3,
+                          gas_estimator=self.gas_estimator)
+        chunks = scatter.execute_chunks(gas_price, funded=True)
+        by_recipient = {}
+        for chunk in chunks.values():
+            for to_acc in chunk['recipients']:
+                by_recipient[to_acc.lower()] = chunk
+        return {
+            i: {
+                "hash": by_recipient[self.payments[i]['to']]['hash'],
+                "status": by_recipient[self.payments[i]['to']]['status'],
+                "error": by_recipient[self.payments[i]['to']]['error']
+            }
+            for i in indexes
+        }
+
+    def pay(self, sender, indexes, gas_price=1):
+        results = {i: {"hash": None, "status": "skipped", "error": None} for i in indexes}
+        nonce = get_nonce(sender)
+        futures = {}
+        for i in indexes:
+            payment = Payment(
+                "Planned payment",
+                sender,
+                self.private_keys[sender],
+                self.payments[i]['to'],
+                self.payments[i]['amount'],
+                w3=self.w3,
+                gas_estimator=self.gas_estimator
+            )
+            try:
+                _hash = payment.send(nonce, gas_price)
+            except Exception as e:
+                # Nothing after this payment is sent, it would be stuck behind the unused nonce
+                logging.warning(f"Important: {payment} could not be sent. Error {e}")
+                results[i].update(status="error", error=str(e))
+                break
+            results[i].update(hash=_hash, status="pending")
+            futures[i] = watch_receipt(_hash, w3=self.w3)
+            nonce += 1
+        for i, future in futures.items():
+            try:
+                receipt = future.result()
+            except ValueError as e:
+                results[i].update(status="error", error=str(e))
+                continue
+            if receipt is None:
+                results[i]['status'] = "timeout"
+            elif receipt["status"] == 1:
+                results[i]['status'] = "paid"
+                if self.gas_estimator is not None:
+                    self.gas_estimator.observe(receipt)
+            else:
+                results[i]['status'] = "failed"
+        return results
+
+    def run(self, step, gas_price):
+        sender, token, via, indexes = step
+        if via == 'rejected':
+            return {i: {"hash": None, "status": "rejected", "error": "not enough balance"} for i in indexes}
+        if sender not in self.private_keys:
+            logging.warning(f"Important: No private key for {sender.replace('0x', 'ronin:')}, skipping its payments")
+            return {i: {"hash": None, "status": "error", "error": "missing private key"} for i in indexes}
+        if via == 'scatter':
+            return self.scatter(sender, token, indexes, gas_price)
+        return self.pay(sender, indexes, gas_price)
+
+    def execute(self, gas_price=1):
+        # Senders run in parallel, returns one result per payment in the order they were given. Balances for
+        # every payment are read in one batch first, payments that can not be covered are not sent
+        results = [None] * len(self.payments)
+        accepted = preflight(
+            [(payment['from'], payment['token'], payment['amount']) for payment in self.payments],
+            endpoint=self.w3.provider.endpoint_uri)
+        plan = self.plan(accepted)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for (_, _, via, _), step_results in zip(plan, pool.map(lambda step: self.run(step, gas_price), plan)):
+                for i, result in step_results.items():
+                    payment = self.payments[i]
+                    results[i] = {
+                        "from": payment['from'].replace('0x', 'ronin:'),
+                        "to": payment['to'].replace('0x', 'ronin:'),
+                        "amount": payment['amount'],
+                        "token": payment['token'],
+                        "via": via,
+                        **result
+                    }
+        return results
@@ -1,30 +1,137 @@
 import rlp
 import logging
-from datetime import datetime, timedelta
-from time import sleep
+import threading
 
-from trezorlib import ethereum
-from trezorlib.tools import parse_path
-from web3 import Web3, exceptions
+from web3 import Web3
 
 from axie_utils.abis import SCATTER_ABI, APPROVE_ABI
+from axie_utils.calldata import encode_disperse_ether, encode_disperse_token_simple
 from axie_utils.utils import (
     get_nonce,
-    check_balance,
+    wait_for_receipt,
+    watch_receipt,
+    get_web3,
+    preflight,
+    parse_path,
+    ethereum,
     SCATTER_CONTRACT,
     TOKEN,
-    RONIN_PROVIDER,
-    USER_AGENT,
-    TIMEOUT_MINS
+    RONIN_PROVIDER
 )
-    
+
+SCATTER_GAS_BUDGET = 1000000
+SCATTER_BASE_GAS = 60000
+SCATTER_RECIPIENT_GAS = 40000
+MAX_ALLOWANCE = 2**256 - 1
+
+
+class AllowanceCache:
+    # Allowances per (owner, token, spender). Spends are taken off locally when a scatter is sent, the chain is
+    # only read again when the cached value does not cover the next spend
+    def __init__(self):
+        self._allowances = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(owner, token, spender):
+        return (owner.replace("ronin:", "0x").lower(), token.lower(), spender.lower())
+
+    def get(self, owner, token, spender):
+        with self._lock:
+            return self._allowances.get(self._key(owner, token, spender))
+
+    def set(self, owner, token, spender, allowance):
+        with self._lock:
+            self._allowances[self._key(owner, token, spender)] = allowance
+
+    def spend(self, owner, token, spender, amount):
+        # A spend that is never mined leaves the cache low, which only means an earlier re-read
+        with self._lock:
+            key = self._key(owner, token, spender)
+            if key in self._allowances:
+                self._allowances[key] = max(0, self._allowances[key] - amount)
+
+    def invalidate(self, owner, token, spender):
+        with self._lock:
+            self._allowances.pop(self._key(owner, token, spender), None)
+
+    def clear(self):
+        with self._lock:
+            self._allowances.clear()
+
+
+ALLOWANCE_CACHE = AllowanceCache()
+
+
+def execute_chunks(scatter, gas_price=1, nonce=None, chunks=None, funded=False):
+    # Sends every chunk with consecutive nonces, then waits for all the receipts together. Returns
+    # {chunk index: result}; 'failed' and 'skipped' chunks paid nobody and can be sent again with
+    # chunks=[...], a 'timeout' chunk may still be mined and has to be checked first
+    ranges = scatter.chunks()
+    if chunks is None:
+        chunks = range(len(ranges))
+    results = {}
+    for i in chunks:
+        start, end = ranges[i]
+        results[i] = {
+            "recipients": dict(zip(scatter.to_list[start:end], scatter.amounts_list[start:end])),
+            "nonce": None,
+            "hash": None,
+            "status": "skipped",
+            "error": None
+        }
+    total = sum(sum(result['recipients'].values()) for result in results.values())
+    # funded means the caller already ran the preflight for these payments
+    if not funded and not scatter.has_funds(total):
+        logging.warning(f"Important: Not enough {scatter.token} balance or not enough RON to pay for {scatter}")
+        return results
+    if scatter.token != 'ron' and not scatter.is_contract_accepted():
+        logging.warning(f"Important: Token {scatter.token} is not approved to use scatter, "
+                        "you can re-try or manually accept it on "
+                        "scatter website (https://scatter.roninchain.com/).")
+        return results
+    if nonce is None:
+        nonce = get_nonce(scatter.from_acc)
+    futures = {}
+    for i, result in results.items():
+        try:
+            _hash = scatter.send(nonce, gas_price, ranges[i])
+        except Exception as e:
+            # Nothing after this chunk is sent, it would be stuck behind the unused nonce
+            logging.warning(f"Important: Chunk {i} of {scatter} could not be sent. Error {e}")
+            result.update(status="error", error=str(e))
+            break
+        result.update(nonce=nonce, hash=_hash, status="pending")
+        futures[i] = watch_receipt(_hash, w3=scatter.w3)
+        nonce += 1
+    for i, future in futures.items():
+        try:
+            receipt = future.result()
+        except ValueError as e:
+            results[i].update(status="error", error=str(e))
+            continue
+        if receipt is None:
+            results[i]['status'] = "timeout"
+        elif receipt["status"] == 1:
+            results[i]['status'] = "paid"
+            if scatter.gas_estimator is not None:
+                scatter.gas_estimator.observe(receipt)
+        else:
+            results[i]['status'] = "failed"
+    paid = sum(result['status'] == "paid" for result in results.values())
+    logging.info(f"Important: {scatter} paid {paid} of {len(results)} chunks")
+    return results
+
 
 class Scatter:
-    def __init__(self, token, from_acc, from_private, to_ronin_ammount_dict):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, token, from_acc, from_private, to_ronin_ammount_dict, w3=None, gas_estimator=None,
+                 gas_budget=SCATTER_GAS_BUDGET):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 1000000
+        # Recipients per tx so a chunk stays under the gas budget
+        self.gas_budget = gas_budget
+        self.chunk_size = max(1, (gas_budget - SCATTER_BASE_GAS) // SCATTER_RECIPIENT_GAS)
         self.token = token.lower()
         if self.token != 'ron':
             self.token_contract = self.w3.eth.contract(
@@ -47,21 +154,28 @@ class Scatter:
                 self.amounts_list.append(v)
    
     def is_contract_accepted(self):
+        total = sum(self.amounts_list)
+        cached = ALLOWANCE_CACHE.get(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT)
+        if cached is not None and cached > total:
+            return True
         allowance = self.token_contract.functions.allowance(
             Web3.toChecksumAddress(self.from_acc),
             Web3.toChecksumAddress(SCATTER_CONTRACT)).call()
-        if int(allowance) > sum(self.amounts_list):
+        ALLOWANCE_CACHE.set(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, int(allowance))
+        if int(allowance) > total:
             return True
         return self.approve_contract()
 
-    def approve_contract(self):
+    def approve_contract(self, nonce=None):
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
         approve_tx = self.token_contract.functions.approve(
             Web3.toChecksumAddress(SCATTER_CONTRACT),
-            115792089237316195423570985008687907853269984665640564039457584007913129639935
+            MAX_ALLOWANCE
         ).buildTransaction({
             "gas": 1000000,
             "gasPrice": self.w3.toWei(1, "gwei"),
-            "nonce": get_nonce(self.from_acc)
+            "nonce": nonce
         })
         signed_approval = self.w3.eth.account.sign_transaction(
             approve_tx,
@@ -71,6 +185,7 @@ class Scatter:
         approve_hash = self.w3.toHex(self.w3.keccak(signed_approval.rawTransaction))
         approved = self.w3.eth.wait_for_transaction_receipt(approve_hash, timeout=240)
         if approved['status'] == 1:
+            ALLOWANCE_CACHE.set(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, MAX_ALLOWANCE)
             return True
         return False
 
@@ -81,30 +196,59 @@ class Scatter:
         # Increase gas price to get tx unstuck
         return self.execute(1.01, nonce)
 
-    def execute_token(self, gas_price=1, nonce=None):
-        # Check token is approved
-        if not self.is_contract_accepted():
-            logging.warning(f"Token {self.token} is not approved to use scatter, "
-                            "you can re-try or manually accept it on "
-                            "scatter website (https://scatter.roninchain.com/).")
-            return
+    def chunks(self):
+        return [
+            (start, min(start + self.chunk_size, len(self.to_list)))
+            for start in range(0, len(self.to_list), self.chunk_size)
+        ]
 
-        # Check enough balance is present
-        if not check_balance(self.from_acc, self.token) >= sum(self.amounts_list) and check_balance(self.from_acc, 'ron') >= self.w3.toWei(0.00001, 'ether'):
-            logging.warning(f"Important: Not enough {TOKEN[self.token]} balance or not enough RON to pay for the tx")
-            return
-        
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def recipients(self, chunk=None):
+        if chunk is None:
+            return self.to_list, self.amounts_list
+        start, end = chunk
+        return self.to_list[start:end], self.amounts_list[start:end]
+
+    def has_funds(self, total):
+        # Token and RON balances come back in one batched request
+        return preflight([(self.from_acc, self.token, total)], endpoint=self.w3.provider.endpoint_uri)[0]
+
+    def gas_limit(self, chunk=None):
+        if chunk is None:
+            default = self.gas
+        else:
+            default = min(self.gas_budget, SCATTER_BASE_GAS + SCATTER_RECIPIENT_GAS * (chunk[1] - chunk[0]))
+        if self.gas_estimator is None:
+            return default
+        return self.gas_estimator.estimate(self.call(chunk), default, w3=self.w3)
+
+    def call(self, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
+        call = {
+            "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(SCATTER_CONTRACT)
+        }
+        if self.token == 'ron':
+            call["data"] = encode_disperse_ether(to_list, amounts_list)
+            call["value"] = sum(amounts_list)
+        else:
+            call["data"] = encode_disperse_token_simple(
+                Web3.toChecksumAddress(TOKEN[self.token]),
+                to_list,
+                amounts_list
+            )
+            call["value"] = 0
+        return call
+
+    def send_token(self, nonce, gas_price=1, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
         # Build transaction
         transaction = self.contract.functions.disperseTokenSimple(
             Web3.toChecksumAddress(TOKEN[self.token]),
-            self.to_list,
-            self.amounts_list
+            to_list,
+            amounts_list
         ).buildTransaction({
             "chainId": 2020,
-            "gas": 1000000,
+            "gas": self.gas_limit(chunk),
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce
         })
@@ -115,36 +259,45 @@ class Scatter:
         )
         # Send raw transaction
         self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        ALLOWANCE_CACHE.spend(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, sum(amounts_list))
         # get transaction _hash
         _hash = self.w3.toHex(self.w3.keccak(signed.rawTransaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important:Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call(chunk))
+        return _hash
+
+    def execute_token(self, gas_price=1, nonce=None):
+        # Check enough balance is present, before approving anything
+        if not self.has_funds(sum(self.amounts_list)):
+            logging.warning(f"Important: Not enough {TOKEN[self.token]} balance or not enough RON to pay for the tx")
+            return
 
+        # Check token is approved
+        if not self.is_contract_accepted():
+            logging.warning(f"Token {self.token} is not approved to use scatter, "
+                            "you can re-try or manually accept it on "
+                            "scatter website (https://scatter.roninchain.com/).")
+            return
+
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send_token(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important:Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -154,27 +307,20 @@ class Scatter:
             self.increase_gas_tx(nonce)
     
     
-    def execute_ron(self, gas_price=1, nonce=None):
-        # Check enough balance is present
-        if not self.w3.toWei(check_balance(self.from_acc, 'ron'), 'ether') >= (sum(self.amounts_list) + self.w3.toWei(0.00001, 'ether')):
-            logging.warning("Important: Not enough RON balance to scatter and pay the tx.")
-            return
-                
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def send_ron(self, nonce, gas_price=1, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
         # Build transaction
         transaction = self.contract.functions.disperseEther(
-            self.to_list,
-            self.amounts_list
+            to_list,
+            amounts_list
         ).buildTransaction({
             "chainId": 2020,
-            "gas": 1000000,
+            "gas": self.gas_limit(chunk),
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce,
-            "value": sum(self.amounts_list)
+            "value": sum(amounts_list)
         })
-        logging.debug(f'DEBUG: {transaction}. \n to_list: {self.to_list}   \n amounts_list: {self.amounts_list}')
+        logging.debug(f'DEBUG: {transaction}. \n to_list: {to_list}   \n amounts_list: {amounts_list}')
         # Sign Transaction
         signed = self.w3.eth.account.sign_transaction(
             transaction,
@@ -184,34 +330,35 @@ class Scatter:
         self.w3.eth.send_raw_transaction(signed.rawTransaction)
         # get transaction _hash
         _hash = self.w3.toHex(self.w3.keccak(signed.rawTransaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call(chunk))
+        return _hash
 
+    def execute_ron(self, gas_price=1, nonce=None):
+        # Check enough balance is present
+        if not self.has_funds(sum(self.amounts_list)):
+            logging.warning("Important: Not enough RON balance to scatter and pay the tx.")
+            return
+                
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send_ron(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -220,7 +367,19 @@ class Scatter:
             logging.info(f"Important: Transaction {self} failed. Trying to augment gas price to unstuck it.")
             self.increase_gas_tx(nonce)
 
+    def send(self, nonce, gas_price=1, chunk=None):
+        send = self.send_ron if self.token == 'ron' else self.send_token
+        if chunk is None:
+            return send(nonce, gas_price)
+        return send(nonce, gas_price, chunk)
+
+    def execute_chunks(self, gas_price=1, nonce=None, chunks=None, funded=False):
+        return execute_chunks(self, gas_price, nonce, chunks, funded)
+
     def execute(self, gas_price=1, nonce=None):
+        # Recipient lists over the gas budget are split, the result is then a map of chunk results
+        if len(self.chunks()) > 1:
+            return self.execute_chunks(gas_price, nonce)
         if self.token == 'ron':
             return self.execute_ron(gas_price, nonce)
         return self.execute_token(gas_price, nonce)
@@ -230,11 +389,14 @@ class Scatter:
 
 
 class TrezorScatter:
-    def __init__(self, token, from_acc, client, bip_path, to_ronin_ammount_dict):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, token, from_acc, client, bip_path, to_ronin_ammount_dict, w3=None, gas_estimator=None,
+                 gas_budget=SCATTER_GAS_BUDGET):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 1000000
+        # Recipients per tx so a chunk stays under the gas budget
+        self.gas_budget = gas_budget
+        self.chunk_size = max(1, (gas_budget - SCATTER_BASE_GAS) // SCATTER_RECIPIENT_GAS)
         self.token = token.lower()
         if self.token != 'ron':
             self.token_contract = self.w3.eth.contract(
@@ -257,19 +419,25 @@ class TrezorScatter:
             else:
                 self.amounts_list.append(v)
    
-    def is_contract_accepted(self):        
+    def is_contract_accepted(self):
+        total = sum(self.amounts_list)
+        cached = ALLOWANCE_CACHE.get(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT)
+        if cached is not None and cached > total:
+            return True
         allowance = self.token_contract.functions.allowance(
             Web3.toChecksumAddress(self.from_acc),
             Web3.toChecksumAddress(SCATTER_CONTRACT)).call()
-        if int(allowance) > sum(self.amounts_list):
+        ALLOWANCE_CACHE.set(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, int(allowance))
+        if int(allowance) > total:
             return True
-        self.approve_contract()
+        return self.approve_contract()
 
-    def approve_contract(self):
-        nonce = get_nonce(self.from_acc)
+    def approve_contract(self, nonce=None):
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
         approve_tx = self.token_contract.functions.approve(
             Web3.toChecksumAddress(SCATTER_CONTRACT),
-            115792089237316195423570985008687907853269984665640564039457584007913129639935
+            MAX_ALLOWANCE
         ).buildTransaction({
             "gas": 1000000,
             "gasPrice": self.w3.toWei(1, "gwei"),
@@ -297,6 +465,7 @@ class TrezorScatter:
         approve_hash = self.w3.toHex(self.w3.keccak(transaction))
         approved = self.w3.eth.wait_for_transaction_receipt(approve_hash, timeout=240)
         if approved['status'] == 1:
+            ALLOWANCE_CACHE.set(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, MAX_ALLOWANCE)
             return True
         return False
 
@@ -309,30 +478,60 @@ class TrezorScatter:
             self.execute_ron(1.01, nonce)
         self.execute_token(1.01, nonce)
 
-    def execute_token(self, gas_price=1, nonce=None):
-        # Check token is approved
-        if not self.is_contract_accepted():
-            logging.warning(f"Important: Token {self.token} is not approved to use scatter, "
-                            "you can re-try or manually accept it on "
-                            "scatter website (https://scatter.roninchain.com/).")
-            return
+    def chunks(self):
+        return [
+            (start, min(start + self.chunk_size, len(self.to_list)))
+            for start in range(0, len(self.to_list), self.chunk_size)
+        ]
 
-        # Check enough balance is present
-        if not check_balance(self.from_acc, self.token) >= (sum(self.amounts_list) and check_balance(self.from_acc, 'ron') >= self.w3.toWei(0.00001, 'ether')):
-            logging.warning(f"Important: Not enough {TOKEN[self.token]} balance or not enough RON to pay for the tx")
-            return
-        
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def recipients(self, chunk=None):
+        if chunk is None:
+            return self.to_list, self.amounts_list
+        start, end = chunk
+        return self.to_list[start:end], self.amounts_list[start:end]
+
+    def has_funds(self, total):
+        # Token and RON balances come back in one batched request
+        return preflight([(self.from_acc, self.token, total)], endpoint=self.w3.provider.endpoint_uri)[0]
+
+    def gas_limit(self, chunk=None):
+        if chunk is None:
+            default = self.gas
+        else:
+            default = min(self.gas_budget, SCATTER_BASE_GAS + SCATTER_RECIPIENT_GAS * (chunk[1] - chunk[0]))
+        if self.gas_estimator is None:
+            return default
+        return self.gas_estimator.estimate(self.call(chunk), default, w3=self.w3)
+
+    def call(self, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
+        call = {
+            "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(SCATTER_CONTRACT)
+        }
+        if self.token == 'ron':
+            call["data"] = encode_disperse_ether(to_list, amounts_list)
+            call["value"] = sum(amounts_list)
+        else:
+            call["data"] = encode_disperse_token_simple(
+                Web3.toChecksumAddress(TOKEN[self.token]),
+                to_list,
+                amounts_list
+            )
+            call["value"] = 0
+        return call
+
+    def send_token(self, nonce, gas_price=1, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
+        gas = self.gas_limit(chunk)
         # Build transaction
         transaction = self.contract.functions.disperseTokenSimple(
             Web3.toChecksumAddress(TOKEN[self.token]),
-            self.to_list,
-            self.amounts_list
+            to_list,
+            amounts_list
         ).buildTransaction({
             "chainId": 2020,
-            "gas": 1000000,
+            "gas": gas,
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce
         })
@@ -343,7 +542,7 @@ class TrezorScatter:
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.w3.toWei(str(gas_price), "gwei"),
-            gas_limit=1000000,
+            gas_limit=gas,
             to=SCATTER_CONTRACT,
             value=0,
             data=data,
@@ -353,38 +552,47 @@ class TrezorScatter:
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), "gwei"), 1000000, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), "gwei"), gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
+        ALLOWANCE_CACHE.spend(self.from_acc, TOKEN[self.token], SCATTER_CONTRACT, sum(amounts_list))
         _hash = self.w3.toHex(self.w3.keccak(transaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call(chunk))
+        return _hash
+
+    def execute_token(self, gas_price=1, nonce=None):
+        # Check enough balance is present, before approving anything
+        if not self.has_funds(sum(self.amounts_list)):
+            logging.warning(f"Important: Not enough {TOKEN[self.token]} balance or not enough RON to pay for the tx")
+            return
+
+        # Check token is approved
+        if not self.is_contract_accepted():
+            logging.warning(f"Important: Token {self.token} is not approved to use scatter, "
+                            "you can re-try or manually accept it on "
+                            "scatter website (https://scatter.roninchain.com/).")
+            return
 
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send_token(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -394,25 +602,19 @@ class TrezorScatter:
             self.increase_gas_tx(nonce)
     
     
-    def execute_ron(self, gas_price=1, nonce=None):
-        # Check enough balance is present
-        if not self.w3.toWei(check_balance(self.from_acc, 'ron'), 'ether') >= (sum(self.amounts_list) + self.w3.toWei(0.00001, 'ether')):
-            logging.warning("Not enough RON balance to scatter and pay the tx.")
-            return
-
-        # Get Nonce
-        if nonce is None:
-            nonce = get_nonce(self.from_acc)
+    def send_ron(self, nonce, gas_price=1, chunk=None):
+        to_list, amounts_list = self.recipients(chunk)
+        gas = self.gas_limit(chunk)
         # Build transaction
         transaction = self.contract.functions.disperseEther(
-            self.to_list,
-            self.amounts_list
+            to_list,
+            amounts_list
         ).buildTransaction({
             "chainId": 2020,
-            "gas": 1000000,
+            "gas": gas,
             "gasPrice": self.w3.toWei(str(gas_price), "gwei"),
             "nonce": nonce,
-            "value": sum(self.amounts_list)
+            "value": sum(amounts_list)
         })
         data = self.w3.toBytes(hexstr=transaction['data'])
         to = self.w3.toBytes(hexstr=SCATTER_CONTRACT)
@@ -421,9 +623,9 @@ class TrezorScatter:
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.w3.toWei(str(gas_price), "gwei"),
-            gas_limit=1000000,
+            gas_limit=gas,
             to=SCATTER_CONTRACT,
-            value=sum(self.amounts_list),
+            value=sum(amounts_list),
             data=data,
             chain_id=2020
         )
@@ -431,38 +633,39 @@ class TrezorScatter:
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), "gwei"), 1000000, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.w3.toWei(str(gas_price), "gwei"), gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
         _hash = self.w3.toHex(self.w3.keccak(transaction))
-        # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5minutes for this tx to respond, if it does not, we will re-try
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transaction {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                # Sleep 10s while waiting
-                logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call(chunk))
+        return _hash
 
+    def execute_ron(self, gas_price=1, nonce=None):
+        # Check enough balance is present
+        if not self.has_funds(sum(self.amounts_list)):
+            logging.warning("Not enough RON balance to scatter and pay the tx.")
+            return
+
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send_ron(nonce, gas_price)
+        # Wait for transaction to finish or timeout
+        logging.info(f"Waiting for transaction '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transaction {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: Transaction {self} completed! hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -471,7 +674,19 @@ class TrezorScatter:
             logging.info(f"Important: Transaction {self} failed. Trying to augment gas price to unstuck it.")
             self.increase_gas_tx(nonce)
 
+    def send(self, nonce, gas_price=1, chunk=None):
+        send = self.send_ron if self.token == 'ron' else self.send_token
+        if chunk is None:
+            return send(nonce, gas_price)
+        return send(nonce, gas_price, chunk)
+
+    def execute_chunks(self, gas_price=1, nonce=None, chunks=None, funded=False):
+        return execute_chunks(self, gas_price, nonce, chunks, funded)
+
     def execute(self, gas_price=1, nonce=None):
+        # Recipient lists over the gas budget are split, the result is then a map of chunk results
+        if len(self.chunks()) > 1:
+            return self.execute_chunks(gas_price, nonce)
         if self.token == 'ron':
             return self.execute_ron(gas_price, nonce)
         return self.execute_token(gas_price, nonce)
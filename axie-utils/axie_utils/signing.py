@@ -0,0 +1,173 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import rlp
+import requests
+from eth_account import Account
+from web3 import Web3
+
+from axie_utils.utils import (
+    ethereum,
+    get_web3,
+    parse_path,
+    trezor_exceptions,
+    RONIN_PROVIDER
+)
+
+SIGNING_WORKERS = os.cpu_count() or 1
+SIGNING_CHUNK = 32
+
+# Private keys of the worker process, loaded once by the pool initializer so tasks only carry accounts
+_KEYS = {}
+
+
+def _account_key(account):
+    return account.replace("ronin:", "0x").lower()
+
+
+def _load_keys(private_keys):
+    _KEYS.clear()
+    _KEYS.update(private_keys)
+
+
+def _redact(message, private_key):
+    key = str(private_key)
+    for secret in {key, key[2:] if key.startswith("0x") else key}:
+        if secret:
+            message = message.replace(secret, "<private key>")
+    return message
+
+
+def _sign(job):
+    account, transaction = job
+    private_key = _KEYS.get(account)
+    if private_key is None:
+        return None, None, "missing private key"
+    try:
+        signed = Account.sign_transaction(transaction, private_key)
+    except Exception as e:
+        # Only the exception type and message leave the worker, its traceback and locals hold the key
+        return None, None, _redact(f"{type(e).__name__}: {e}", private_key)
+    return bytes(signed.rawTransaction), Web3.toHex(signed.hash), None
+
+
+class SigningPool:
+    # Signs unsigned tx dicts across worker processes, ECDSA signing is CPU bound and one process
+    # caps a large payout run at one core. Keys are handed to the workers once when they start,
+    # each job only names the account that signs it
+    def __init__(self, private_keys, max_workers=SIGNING_WORKERS, chunk_size=SIGNING_CHUNK):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._keys = {_account_key(account): key for account, key in private_keys.items()}
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_load_keys,
+                initargs=(self._keys,)
+            )
+        return self._executor
+
+    def sign(self, jobs):
+        # jobs is an iterable of (account, unsigned tx). Returns one {"raw", "hash", "error"} per job, in order
+        jobs = [(_account_key(account), transaction) for account, transaction in jobs]
+        if self.max_workers <= 1 or len(jobs) <= self.chunk_size:
+            # Not worth a round trip to the workers
+            _load_keys(self._keys)
+            try:
+                signed = [_sign(job) for job in jobs]
+            finally:
+                _KEYS.clear()
+        else:
+            signed = self._get_executor().map(_sign, jobs, chunksize=self.chunk_size)
+        results = []
+        for (account, transaction), (raw_transaction, _hash, error) in zip(jobs, signed):
+            if error is not None:
+                logging.warning(f"Could not sign tx with nonce {transaction.get('nonce')} for "
+                                f"{account.replace('0x', 'ronin:')}. Error {error}")
+            results.append({"raw": raw_transaction, "hash": _hash, "error": error})
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class TrezorSigningSession:
+    # Signs a queue of prepared txs on one device session, back to back. Each signed tx is handed to a
+    # broadcasting thread so the device is already signing the next one while the previous is being sent
+    def __init__(self, client, w3=None):
+        self.client = client
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+
+    def sign_tx(self, bip_path, transaction):
+        # transaction holds nonce, gasPrice, gas, to, value, data and chainId, as build returns them
+        if isinstance(bip_path, str):
+            bip_path = parse_path(bip_path)
+        data = self.w3.toBytes(hexstr=transaction['data'])
+        sig = ethereum.sign_tx(
+            self.client,
+            n=bip_path,
+            nonce=transaction['nonce'],
+            gas_price=transaction['gasPrice'],
+            gas_limit=transaction['gas'],
+            to=transaction['to'],
+            value=transaction['value'],
+            data=data,
+            chain_id=transaction['chainId']
+        )
+        l_sig = list(sig)
+        l_sig[1] = l_sig[1].lstrip(b'\x00')
+        l_sig[2] = l_sig[2].lstrip(b'\x00')
+        sig = tuple(l_sig)
+        return rlp.encode((
+            transaction['nonce'],
+            transaction['gasPrice'],
+            transaction['gas'],
+            self.w3.toBytes(hexstr=transaction['to']),
+            transaction['value'],
+            data
+        ) + sig)
+
+    def broadcast(self, raw_transaction):
+        try:
+            self.w3.eth.send_raw_transaction(raw_transaction)
+        except (ValueError, requests.exceptions.RequestException) as e:
+            return str(e)
+        return None
+
+    def sign(self, jobs, broadcast=True):
+        # jobs is an iterable of (bip_path, unsigned tx). Returns one {"raw", "hash", "error"} per job, in order.
+        # The queue stops at the first tx the device does not sign, the rest are left unsigned
+        results = []
+        sent = []
+        failed = None
+        self.client.open()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as broadcaster:
+                for bip_path, transaction in jobs:
+                    result = {"raw": None, "hash": None, "error": None}
+                    results.append(result)
+                    if failed is not None:
+                        result['error'] = f"not signed, an earlier tx failed: {failed}"
+                        continue
+                    try:
+                        raw_transaction = self.sign_tx(bip_path, transaction)
+                    except trezor_exceptions.TrezorException as e:
+                        failed = str(e)
+                        logging.warning(f"Important: Trezor did not sign tx with nonce {transaction['nonce']}. "
+                                        f"Error {e}")
+                        result['error'] = failed
+                        continue
+                    result.update(raw=raw_transaction, hash=self.w3.toHex(self.w3.keccak(raw_transaction)))
+                    if broadcast:
+                        sent.append((result, broadcaster.submit(self.broadcast, raw_transaction)))
+                for result, future in sent:
+                    result['error'] = future.result()
+        finally:
+            self.client.close()
+        return results
@@ -1,90 +1,100 @@
 import logging
 import rlp
-from datetime import datetime, timedelta
-from time import sleep
 
-from trezorlib.tools import parse_path
-from trezorlib import ethereum
-from web3 import Web3, exceptions
+from web3 import Web3
 
 from axie_utils.abis import AXIE_ABI
+from axie_utils.calldata import encode_safe_transfer_from
 from axie_utils.utils import (
+    batch_call,
     get_nonce,
+    send_raw_transactions,
+    wait_for_receipt,
+    watch_receipt,
+    get_web3,
+    parse_path,
+    ethereum,
     RONIN_PROVIDER,
-    AXIE_CONTRACT,
-    TIMEOUT_MINS,
-    USER_AGENT
+    AXIE_CONTRACT
 )
 
 
 class Transfer:
-    def __init__(self, from_acc, from_private, to_acc, axie_id):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, from_acc, from_private, to_acc, axie_id, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
+        self.gas = 492874
         self.from_acc = from_acc.replace("ronin:", "0x")
         self.from_private = from_private
         self.to_acc = to_acc.replace("ronin:", "0x")
         self.axie_id = axie_id
 
-    def execute(self):
-        # Load ABI
-        axie_contract = self.w3.eth.contract(
-            address=Web3.toChecksumAddress(AXIE_CONTRACT),
-            abi=AXIE_ABI
-        )
-        # Get Nonce
-        nonce = get_nonce(self.from_acc)
-        # Build transaction
-        transaction = axie_contract.functions.safeTransferFrom(
-            Web3.toChecksumAddress(self.from_acc),
-            Web3.toChecksumAddress(self.to_acc),
-            self.axie_id
-        ).buildTransaction({
-            "chainId": 2020,
-            "gas": 492874,
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
             "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_safe_transfer_from(
+                Web3.toChecksumAddress(self.from_acc),
+                Web3.toChecksumAddress(self.to_acc),
+                self.axie_id
+            ),
+            "value": 0
+        }
+
+    def build(self, nonce):
+        # Same tx buildTransaction gives, with the calldata encoded directly
+        transaction = self.call()
+        transaction.update({
+            "chainId": 2020,
+            "gas": self.gas_limit(),
             "gasPrice": self.w3.toWei("1", "gwei"),
-            "value": 0,
             "nonce": nonce
         })
+        return transaction
+
+    def sign(self, nonce):
         # Sign Transaction
         signed = self.w3.eth.account.sign_transaction(
-            transaction,
+            self.build(nonce),
             private_key=self.from_private
         )
+        return signed.rawTransaction
+
+    def send(self, nonce):
+        raw_transaction = self.sign(nonce)
         # Send raw transaction
-        self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        self.w3.eth.send_raw_transaction(raw_transaction)
         # get transaction _hash
-        _hash = self.w3.toHex(self.w3.keccak(signed.rawTransaction))
+        _hash = self.w3.toHex(self.w3.keccak(raw_transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
+
+    def execute(self, nonce=None):
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send(nonce)
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5min for this trasnfer to happen
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transfer {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.info(f"Waiting for transfer '{self}' to finish (Nonce:{nonce})...")
-                # Sleep 10 seconds not to constantly send requests!
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning("Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    "Error given: {err}.")
-                    return
+        logging.info(f"Waiting for transfer '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transfer {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: {self} completed! Hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -99,11 +109,9 @@ class Transfer:
 
 
 class TrezorTransfer:
-    def __init__(self, from_acc, client, bip_path, to_acc, axie_id):
-        self.w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}))
+    def __init__(self, from_acc, client, bip_path, to_acc, axie_id, w3=None, gas_estimator=None):
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.gas_estimator = gas_estimator
         self.from_acc = from_acc.replace("ronin:", "0x")
         self.to_acc = to_acc.replace("ronin:", "0x")
         self.axie_id = axie_id
@@ -112,13 +120,40 @@ class TrezorTransfer:
         self.gwei = self.w3.toWei('1', 'gwei')
         self.gas = 250000
 
-    def execute(self):
+    def gas_limit(self):
+        if self.gas_estimator is None:
+            return self.gas
+        return self.gas_estimator.estimate(self.call(), self.gas, w3=self.w3)
+
+    def call(self):
+        return {
+            "from": Web3.toChecksumAddress(self.from_acc),
+            "to": Web3.toChecksumAddress(AXIE_CONTRACT),
+            "data": encode_safe_transfer_from(
+                Web3.toChecksumAddress(self.from_acc),
+                Web3.toChecksumAddress(self.to_acc),
+                self.axie_id
+            ),
+            "value": 0
+        }
+
+    def build(self, nonce):
+        # Unsigned tx for a TrezorSigningSession
+        transaction = self.call()
+        transaction.update({
+            "chainId": 2020,
+            "gas": self.gas_limit(),
+            "gasPrice": self.gwei,
+            "nonce": nonce
+        })
+        return transaction
+
+    def send(self, nonce):
+        gas = self.gas_limit()
         axie_contract = self.w3.eth.contract(
             address=Web3.toChecksumAddress(AXIE_CONTRACT),
             abi=AXIE_ABI
         )
-        # Get Nonce
-        nonce = get_nonce(self.from_acc)
         # Build transaction
         transfer_tx = axie_contract.functions.safeTransferFrom(
             Web3.toChecksumAddress(self.from_acc),
@@ -126,7 +161,7 @@ class TrezorTransfer:
             self.axie_id
         ).buildTransaction({
             "chainId": 2020,
-            "gas": self.gas,
+            "gas": gas,
             "from": Web3.toChecksumAddress(self.from_acc),
             "gasPrice": self.w3.toWei("1", "gwei"),
             "value": 0,
@@ -139,7 +174,7 @@ class TrezorTransfer:
             n=self.bip_path,
             nonce=nonce,
             gas_price=self.gwei,
-            gas_limit=self.gas,
+            gas_limit=gas,
             to=AXIE_CONTRACT,
             value=0,
             data=data,
@@ -149,38 +184,35 @@ class TrezorTransfer:
         l_sig[1] = l_sig[1].lstrip(b'\x00')
         l_sig[2] = l_sig[2].lstrip(b'\x00')
         sig = tuple(l_sig)
-        transaction = rlp.encode((nonce, self.gwei, self.gas, to, 0, data) + sig)
+        transaction = rlp.encode((nonce, self.gwei, gas, to, 0, data) + sig)
         # Send raw transaction
         self.w3.eth.send_raw_transaction(transaction)
         # Get transaction _hash
         _hash = self.w3.toHex(self.w3.keccak(transaction))
+        if self.gas_estimator is not None:
+            self.gas_estimator.track(_hash, self.call())
+        return _hash
+
+    def execute(self, nonce=None):
+        # Get Nonce
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        _hash = self.send(nonce)
         # Wait for transaction to finish or timeout
-        start_time = datetime.now()
-        while True:
-            # We will wait for max 5min for this trasnfer to happen
-            if datetime.now() - start_time > timedelta(minutes=TIMEOUT_MINS):
-                success = False
-                logging.info(f"Important: Transfer {self}, timed out!")
-                break
-            try:
-                recepit = self.w3.eth.get_transaction_receipt(_hash)
-                if recepit["status"] == 1:
-                    success = True
-                else:
-                    success = False
-                break
-            except exceptions.TransactionNotFound:
-                logging.info(f"Waiting for transfer '{self}' to finish (Nonce:{nonce})...")
-                # Sleep 10 seconds not to constantly send requests!
-                sleep(10)
-            except ValueError as err:
-                if 'receipts not found by' in err.args[0]['message']:
-                    logging.info("Could not find TX, giving it a bit more time.")
-                    sleep(20)
-                else:
-                    logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
-                                    f"Error given: {err}.")
-                    return
+        logging.info(f"Waiting for transfer '{self}' to finish (Nonce:{nonce})...")
+        try:
+            receipt = wait_for_receipt(_hash, w3=self.w3)
+        except ValueError as err:
+            logging.warning(f"Important: Error occurred trying to find recepit for transaction '{self}'.\n"
+                            f"Error given: {err}.")
+            return
+        if receipt is None:
+            success = False
+            logging.info(f"Important: Transfer {self}, timed out!")
+        else:
+            success = receipt["status"] == 1
+            if self.gas_estimator is not None:
+                self.gas_estimator.observe(receipt)
         if success:
             logging.info(f"Important: {self} completed! Hash: {_hash} - "
                          f"Explorer: https://explorer.roninchain.com/tx/{str(_hash)}")
@@ -192,3 +224,107 @@ class TrezorTransfer:
     def __str__(self):
         return (f"Axie Transfer of axie ({self.axie_id}) from account ({self.from_acc.replace('0x', 'ronin:')}) "
                 f"to account ({self.to_acc.replace('0x', 'ronin:')})")
+
+
+class BulkTransfer:
+    # Many axies out of one account: ownership is checked in one batched read, every transfer is signed
+    # with consecutive nonces, broadcast in one burst and all the receipts are awaited together
+    def __init__(self, from_acc, from_private, transfers, w3=None, gas_estimator=None, signer=None):
+        # transfers is an iterable of (axie_id, to_acc), signer is an optional SigningPool holding from_private
+        self.w3 = w3 or get_web3(RONIN_PROVIDER)
+        self.from_acc = from_acc.replace("ronin:", "0x")
+        self.gas_estimator = gas_estimator
+        self.signer = signer
+        self.transfers = {
+            axie_id: Transfer(from_acc, from_private, to_acc, axie_id, w3=self.w3, gas_estimator=gas_estimator)
+            for axie_id, to_acc in transfers
+        }
+
+    def owned(self, axie_ids):
+        axie_contract = self.w3.eth.contract(
+            address=Web3.toChecksumAddress(AXIE_CONTRACT),
+            abi=AXIE_ABI
+        )
+        owners = batch_call([(axie_contract, 'ownerOf', [axie_id]) for axie_id in axie_ids])
+        return {
+            axie_id: owner is not None and owner.lower() == self.from_acc.lower()
+            for axie_id, owner in zip(axie_ids, owners)
+        }
+
+    def sign(self, axie_ids, nonce):
+        # [(raw tx, error)] for consecutive nonces starting at nonce
+        if self.signer is None:
+            return [(self.transfers[axie_id].sign(nonce + i), None) for i, axie_id in enumerate(axie_ids)]
+        signed = self.signer.sign([
+            (self.from_acc, self.transfers[axie_id].build(nonce + i)) for i, axie_id in enumerate(axie_ids)
+        ])
+        return [(tx['raw'], tx['error']) for tx in signed]
+
+    def execute(self, nonce=None, axies=None):
+        # Returns {axie_id: result}. Only 'transferred' axies left the account, the rest can be sent again
+        # with axies=[...]. Txs broadcast after a rejected one wait behind its nonce and end up as 'timeout'
+        axies = list(self.transfers) if axies is None else list(axies)
+        results = {
+            axie_id: {
+                "to": self.transfers[axie_id].to_acc.replace('0x', 'ronin:'),
+                "nonce": None,
+                "hash": None,
+                "status": "skipped",
+                "error": None
+            }
+            for axie_id in axies
+        }
+        owned = self.owned(axies)
+        to_send = []
+        for axie_id in axies:
+            if owned[axie_id]:
+                to_send.append(axie_id)
+            else:
+                results[axie_id]['status'] = "not_owned"
+                logging.warning(f"Important: Axie {axie_id} is not in account {self.from_acc.replace('0x', 'ronin:')}")
+        if not to_send:
+            return results
+        if nonce is None:
+            nonce = get_nonce(self.from_acc)
+        signed = []
+        raw_transactions = []
+        for i, (axie_id, (raw_transaction, error)) in enumerate(zip(to_send, self.sign(to_send, nonce))):
+            results[axie_id]['nonce'] = nonce + i
+            if error is not None:
+                results[axie_id].update(status="error", error=error)
+                continue
+            signed.append(axie_id)
+            raw_transactions.append(raw_transaction)
+            results[axie_id]['hash'] = self.w3.toHex(self.w3.keccak(raw_transaction))
+        to_send = signed
+        if not to_send:
+            return results
+        errors = send_raw_transactions(raw_transactions, self.w3.provider.endpoint_uri)
+        futures = {}
+        for axie_id, error in zip(to_send, errors):
+            if error is not None:
+                logging.warning(f"Important: Transfer of axie {axie_id} was rejected. Error {error}")
+                results[axie_id].update(status="error", error=error)
+                continue
+            results[axie_id]['status'] = "pending"
+            if self.gas_estimator is not None:
+                self.gas_estimator.track(results[axie_id]['hash'], self.transfers[axie_id].call())
+            futures[axie_id] = watch_receipt(results[axie_id]['hash'], w3=self.w3)
+        for axie_id, future in futures.items():
+            try:
+                receipt = future.result()
+            except ValueError as e:
+                results[axie_id].update(status="error", error=str(e))
+                continue
+            if receipt is None:
+                results[axie_id]['status'] = "timeout"
+            elif receipt["status"] == 1:
+                results[axie_id]['status'] = "transferred"
+                if self.gas_estimator is not None:
+                    self.gas_estimator.observe(receipt)
+            else:
+                results[axie_id]['status'] = "failed"
+        transferred = sum(result['status'] == "transferred" for result in results.values())
+        logging.info(f"Important: {transferred} of {len(results)} axies transferred from "
+                     f"{self.from_acc.replace('0x', 'ronin:')}")
+        return results
@@ -1,14 +1,23 @@
+import asyncio
+import hashlib
+import hmac
+import importlib
+import json
 import logging
+import os
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
+from time import time
 from json.decoder import JSONDecodeError
 
+import aiohttp
 import requests
+from hexbytes import HexBytes
+from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 from web3 import Web3
-from trezorlib.ui import ClickUI
-from trezorlib.client import get_default_client
-from trezorlib.tools import parse_path
-from trezorlib import ethereum
 
 from axie_utils.abis import BALANCE_ABI
 
@@ -28,6 +37,18 @@ RETRIES = Retry(
     status_forcelist=[500, 502, 503, 504],
     allowed_methods=frozenset(['GET', 'POST'])
 )
+POOL_SIZE = 20
+BATCH_SIZE = 100
+RECEIPT_POLL_SECONDS = 10
+MAX_CONCURRENCY = 20
+TX_FEE = Web3.toWei(0.00001, 'ether')
+GAS_MARGIN = 1.2
+GAS_MIN_SAMPLES = 3
+GAS_SAMPLES = 20
+GAS_TRACKED = 1000
+BIP_ACCOUNT_PATH = "m/44'/60'/0'/0"
+
+BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4].hex()
 
 TOKEN = {
     'slp': SLP_CONTRACT,
@@ -38,17 +59,262 @@ TOKEN = {
 }
 
 
-def check_balance(account, token='slp'):
+class LazyModule:
+    # Stands in for a module that is imported on first attribute access. trezorlib pulls in the USB
+    # stack, so it is only loaded once a Trezor class actually talks to the device
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+ethereum = LazyModule("trezorlib.ethereum")
+trezor_client = LazyModule("trezorlib.client")
+trezor_exceptions = LazyModule("trezorlib.exceptions")
+trezor_tools = LazyModule("trezorlib.tools")
+trezor_ui = LazyModule("trezorlib.ui")
+
+
+def parse_path(bip_path):
+    return trezor_tools.parse_path(bip_path)
+
+
+def get_default_client(*args, **kwargs):
+    return trezor_client.get_default_client(*args, **kwargs)
+
+
+_PROVIDERS = {}
+_PROVIDERS_LOCK = threading.Lock()
+_WATCHERS = {}
+
+
+def _build_provider(endpoint):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=RETRIES)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({"content-type": "application/json", "user-agent": USER_AGENT})
     w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER,
-                request_kwargs={
-                    "headers": {"content-type": "application/json",
-                                "user-agent": USER_AGENT}}))
+        Web3.HTTPProvider(
+            endpoint,
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=session))
+    return session, w3
+
+
+def _get_provider(endpoint):
+    # One keep-alive session (pool of POOL_SIZE connections) and Web3 instance per endpoint,
+    # shared by the whole process
+    with _PROVIDERS_LOCK:
+        if endpoint not in _PROVIDERS:
+            _PROVIDERS[endpoint] = _build_provider(endpoint)
+        return _PROVIDERS[endpoint]
+
+
+def get_web3(endpoint=RONIN_PROVIDER):
+    return _get_provider(endpoint)[1]
+
+
+def get_session(endpoint=RONIN_PROVIDER):
+    return _get_provider(endpoint)[0]
+
+
+def reset_providers():
+    with _PROVIDERS_LOCK:
+        for watcher in _WATCHERS.values():
+            watcher.stop()
+        _WATCHERS.clear()
+        for session, _ in _PROVIDERS.values():
+            session.close()
+        _PROVIDERS.clear()
+
+
+def rpc_batch(calls, endpoint=RONIN_PROVIDER, batch_size=BATCH_SIZE):
+    # calls is a list of (method, params), responses come back in the same order
+    session = get_session(endpoint)
+    responses = []
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(chunk)
+        ]
+        response = session.post(endpoint, json=payload, timeout=30)
+        response.raise_for_status()
+        body = response.json()
+        if not isinstance(body, list):
+            # Batch-level failures (rate limits, oversized batches) come back as a single object
+            error = body.get('error') if isinstance(body, dict) else None
+            logging.warning(f"RPC batch rejected by {endpoint}: {error or body}")
+            responses.extend({"error": error or {"message": "invalid batch response"}} for _ in chunk)
+            continue
+        by_id = {item.get('id'): item for item in body if isinstance(item, dict)}
+        for i in range(len(chunk)):
+            responses.append(by_id.get(i, {"error": {"message": "missing response in batch"}}))
+    return responses
+
+
+def get_async_session(limit=MAX_CONCURRENCY):
+    # Must be created inside a running event loop; limit caps the open connections
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit),
+        timeout=aiohttp.ClientTimeout(total=30),
+        headers={"content-type": "application/json", "user-agent": USER_AGENT})
+
+
+class StageLimiter:
+    # Caps how many coroutines are inside a stage and, optionally, how many may enter it per second.
+    # Has to be created inside the event loop that uses it
+    def __init__(self, concurrency=MAX_CONCURRENCY, rate=None):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1 / rate if rate else 0
+        self._next_start = 0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            async with self._lock:
+                now = asyncio.get_running_loop().time()
+                delay = self._next_start - now
+                self._next_start = max(now, self._next_start) + self._interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *args):
+        self._semaphore.release()
+        return False
+
+
+async def async_rpc(session, method, params, endpoint=RONIN_PROVIDER):
+    payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    async with session.post(endpoint, json=payload) as response:
+        response.raise_for_status()
+        body = await response.json(content_type=None)
+    if body.get('error'):
+        raise ValueError(body['error'])
+    return body['result']
+
+
+def batch_call(calls, endpoint=None, batch_size=BATCH_SIZE):
+    # Aggregates read-only contract calls, given as (contract, fn_name, args), into batched eth_call requests.
+    # Unless told otherwise, reads go to the endpoint the contracts' Web3 instance points at
+    if not calls:
+        return []
+    if endpoint is None:
+        endpoint = calls[0][0].web3.provider.endpoint_uri
+    requests_list = []
+    output_types = []
+    for contract, fn_name, args in calls:
+        fn_abi = next(item for item in contract.abi if item.get('type') == 'function' and item['name'] == fn_name)
+        output_types.append([output['type'] for output in fn_abi['outputs']])
+        data = contract.encodeABI(fn_name=fn_name, args=args)
+        requests_list.append(("eth_call", [{"to": contract.address, "data": data}, "latest"]))
+    responses = rpc_batch(requests_list, endpoint, batch_size)
+    results = []
+    for (contract, fn_name, args), types, response in zip(calls, output_types, responses):
+        if 'error' in response or response.get('result') in (None, '0x'):
+            logging.debug(f"Call {fn_name}{tuple(args)} failed: {response.get('error')}")
+            results.append(None)
+            continue
+        decoded = contract.web3.codec.decode_abi(types, HexBytes(response['result']))
+        results.append(decoded[0] if len(decoded) == 1 else decoded)
+    return results
+
+
+def send_raw_transactions(raw_transactions, endpoint=RONIN_PROVIDER, batch_size=BATCH_SIZE):
+    # Broadcasts signed txs in one burst, in order. Returns the node's error for each tx, None when accepted
+    calls = [("eth_sendRawTransaction", [Web3.toHex(raw)]) for raw in raw_transactions]
+    return [
+        response['error'].get('message', str(response['error'])) if 'error' in response else None
+        for response in rpc_batch(calls, endpoint, batch_size)
+    ]
+
+
+def _format_balance(token, balance):
+    if token in ('ron', 'weth'):
+        return float(balance/1000000000000000000)
+    return int(balance)
+
+
+def get_raw_balances(accounts, tokens=('slp', 'ron'), batch_size=BATCH_SIZE, endpoint=RONIN_PROVIDER):
+    # Balances in base units (wei for RON), one row per account with one column per token, None where the
+    # call failed and 0 for unknown tokens
+    tokens = [token.lower() for token in tokens]
+    calls = []
+    cells = []
+    for row, account in enumerate(accounts):
+        address = account.replace("ronin:", "0x").lower()
+        for col, token in enumerate(tokens):
+            if token in TOKEN:
+                data = BALANCE_OF_SELECTOR + address[2:].rjust(64, '0')
+                calls.append(("eth_call", [{"to": TOKEN[token], "data": data}, "latest"]))
+            elif token == 'ron':
+                calls.append(("eth_getBalance", [address, "latest"]))
+            else:
+                continue
+            cells.append((row, col, token))
+    table = [[0] * len(tokens) for _ in accounts]
+    for (row, col, token), response in zip(cells, rpc_batch(calls, endpoint, batch_size)):
+        if 'error' in response or response.get('result') in (None, '0x'):
+            logging.warning(f"Could not get {token} balance for {accounts[row]}: {response.get('error')}")
+            table[row][col] = None
+        else:
+            table[row][col] = int(response['result'], 16)
+    return table
+
+
+def check_balances(accounts, tokens=('slp', 'ron'), batch_size=BATCH_SIZE, endpoint=RONIN_PROVIDER):
+    # Returns one row per account with one column per token, None where the call failed
+    tokens = [token.lower() for token in tokens]
+    return [
+        [None if balance is None else _format_balance(token, balance) for token, balance in zip(tokens, row)]
+        for row in get_raw_balances(accounts, tokens, batch_size, endpoint)
+    ]
+
+
+def preflight(txs, fee=TX_FEE, batch_size=BATCH_SIZE, endpoint=RONIN_PROVIDER):
+    # txs is a list of (account, token, amount) with amount in base units, every tx also needs fee wei of RON.
+    # All the balances are read in one batch, then txs are checked in order against what is left for their
+    # sender. Returns one bool per tx; balances that could not be read do not block a tx
+    accounts = sorted({account.replace("ronin:", "0x").lower() for account, _, _ in txs})
+    tokens = sorted({token.lower() for _, token, _ in txs} | {'ron'})
+    table = get_raw_balances(accounts, tokens, batch_size, endpoint)
+    left = {
+        (account, token): balance
+        for account, row in zip(accounts, table)
+        for token, balance in zip(tokens, row)
+    }
+    accepted = []
+    for account, token, amount in txs:
+        account, token = account.replace("ronin:", "0x").lower(), token.lower()
+        needed = {'ron': fee}
+        needed[token] = needed.get(token, 0) + amount
+        if any(left[(account, key)] is not None and left[(account, key)] < value for key, value in needed.items()):
+            logging.warning(f"Important: Not enough {token} or RON in {account.replace('0x', 'ronin:')} "
+                            f"to send {amount} {token}, skipping it")
+            accepted.append(False)
+            continue
+        for key, value in needed.items():
+            if left[(account, key)] is not None:
+                left[(account, key)] -= value
+        accepted.append(True)
+    return accepted
+
+
+def check_balance(account, token='slp', w3=None, index=None):
+    # A fresh BalanceIndexer answers without asking the node
+    if index is not None and index.is_fresh():
+        balance = index.balance(account, token)
+        if balance is not None:
+            return balance
+    w3 = w3 or get_web3(RONIN_PROVIDER)
     if token.lower() in TOKEN:
         contract = TOKEN[token.lower()]
     elif token.lower() == "ron":
-        return float(w3.eth.get_balance(Web3.toChecksumAddress(account.replace("ronin:", "0x"))) / 1000000000000000000)
+        return _format_balance('ron', w3.eth.get_balance(Web3.toChecksumAddress(account.replace("ronin:", "0x"))))
     else:
         return 0
     ctr = w3.eth.contract(
@@ -58,24 +324,310 @@ def check_balance(account, token='slp'):
     balance = ctr.functions.balanceOf(
         Web3.toChecksumAddress(account.replace("ronin:", "0x"))
     ).call()
-    if token == 'weth':
-        return float(balance/1000000000000000000)
-    return int(balance)
+    return _format_balance(token.lower(), balance)
 
 
-def get_nonce(account):
-    w3 = Web3(
-            Web3.HTTPProvider(
-                RONIN_PROVIDER_FREE,
-                request_kwargs={
-                    "headers": {"content-type": "application/json",
-                                "user-agent": USER_AGENT}}))
+def get_nonce(account, w3=None, block_identifier='latest'):
+    w3 = w3 or get_web3(RONIN_PROVIDER_FREE)
     nonce = w3.eth.get_transaction_count(
-        Web3.toChecksumAddress(account.replace("ronin:", "0x"))
+        Web3.toChecksumAddress(account.replace("ronin:", "0x")),
+        block_identifier
     )
     return nonce
 
 
+async def async_check_balance(account, session, token='slp', endpoint=RONIN_PROVIDER):
+    address = account.replace("ronin:", "0x").lower()
+    token = token.lower()
+    if token in TOKEN:
+        data = BALANCE_OF_SELECTOR + address[2:].rjust(64, '0')
+        balance = await async_rpc(session, "eth_call", [{"to": TOKEN[token], "data": data}, "latest"], endpoint)
+    elif token == "ron":
+        balance = await async_rpc(session, "eth_getBalance", [address, "latest"], endpoint)
+    else:
+        return 0
+    return _format_balance(token, int(balance, 16))
+
+
+async def async_get_nonce(account, session, endpoint=RONIN_PROVIDER_FREE, block_identifier='latest'):
+    nonce = await async_rpc(
+        session,
+        "eth_getTransactionCount",
+        [Web3.toChecksumAddress(account.replace("ronin:", "0x")), block_identifier],
+        endpoint)
+    return int(nonce, 16)
+
+
+class NonceManager:
+    def __init__(self, w3=None):
+        self.w3 = w3
+        self._lock = threading.Lock()
+        self._next = {}
+        self._released = {}
+
+    @staticmethod
+    def _key(account):
+        return account.replace("ronin:", "0x").lower()
+
+    def _allocate(self, key):
+        if self._released.get(key):
+            nonce = min(self._released[key])
+            self._released[key].remove(nonce)
+            return nonce
+        if key not in self._next:
+            return None
+        nonce = self._next[key]
+        self._next[key] += 1
+        return nonce
+
+    def get_nonce(self, account):
+        # Fetch the pending nonce once per account, then hand out consecutive ones locally
+        key = self._key(account)
+        with self._lock:
+            nonce = self._allocate(key)
+        if nonce is not None:
+            return nonce
+        # First use of this account, the RPC call runs outside the lock so other accounts are not blocked
+        chain_nonce = get_nonce(account, w3=self.w3, block_identifier='pending')
+        with self._lock:
+            self._next.setdefault(key, chain_nonce)
+            return self._allocate(key)
+
+    def release(self, account, nonce):
+        # The tx using this nonce was never broadcast, hand it out again before any new one
+        key = self._key(account)
+        with self._lock:
+            if key not in self._next or nonce >= self._next[key]:
+                return
+            if nonce == self._next[key] - 1:
+                self._next[key] = nonce
+                while nonce - 1 in self._released.get(key, set()):
+                    nonce -= 1
+                    self._released[key].remove(nonce)
+                    self._next[key] = nonce
+            else:
+                self._released.setdefault(key, set()).add(nonce)
+
+    def reconcile(self, account):
+        # Re-sync with the chain after failures so dropped txs don't leave nonce gaps behind
+        key = self._key(account)
+        chain_nonce = get_nonce(account, w3=self.w3, block_identifier='pending')
+        with self._lock:
+            self._next[key] = chain_nonce
+            self._released.pop(key, None)
+        return chain_nonce
+
+    def reset(self, account=None):
+        with self._lock:
+            if account is None:
+                self._next.clear()
+                self._released.clear()
+            else:
+                self._next.pop(self._key(account), None)
+                self._released.pop(self._key(account), None)
+
+
+class GasEstimator:
+    # Gas limits per call instead of one hardcoded limit per tx type. Calls are grouped by
+    # (contract, method, calldata size); until enough receipts of a group were seen the node is asked with
+    # eth_estimateGas, after that the largest gasUsed seen is served locally. Both get the safety margin
+    def __init__(self, w3=None, margin=GAS_MARGIN, min_samples=GAS_MIN_SAMPLES, samples=GAS_SAMPLES):
+        self.w3 = w3
+        self.margin = margin
+        self.min_samples = min_samples
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._used = {}
+        self._sent = OrderedDict()
+
+    @staticmethod
+    def key(tx):
+        data = tx.get('data') or '0x'
+        if not isinstance(data, str):
+            data = Web3.toHex(data)
+        return (tx['to'].lower(), data[:10], len(data))
+
+    def learned(self, tx):
+        with self._lock:
+            used = self._used.get(self.key(tx))
+            if used is None or len(used) < self.min_samples:
+                return None
+            return int(max(used) * self.margin)
+
+    def estimate(self, tx, default, w3=None, rpc=True):
+        # tx holds from, to, data and value. Falls back to default when the node can not estimate it,
+        # or when rpc is False and nothing was learned yet
+        limit = self.learned(tx)
+        if limit is not None:
+            return limit
+        if not rpc:
+            return default
+        w3 = w3 or self.w3 or get_web3(RONIN_PROVIDER)
+        try:
+            estimated = w3.eth.estimate_gas(tx)
+        except (ValueError, requests.exceptions.RequestException) as e:
+            logging.warning(f"Could not estimate gas for call to {tx['to']}, using {default}. Error {e}")
+            return default
+        return int(estimated * self.margin)
+
+    def track(self, tx_hash, tx):
+        # Remembers which group a sent tx belongs to, so its receipt can be learned from
+        with self._lock:
+            self._sent[tx_hash] = self.key(tx)
+            while len(self._sent) > GAS_TRACKED:
+                self._sent.popitem(last=False)
+
+    def observe(self, receipt):
+        if not receipt or receipt.get('status') != 1:
+            return
+        tx_hash = receipt.get('transactionHash')
+        if tx_hash is not None and not isinstance(tx_hash, str):
+            tx_hash = Web3.toHex(tx_hash)
+        with self._lock:
+            key = self._sent.pop(tx_hash, None)
+            if key is None:
+                return
+            self._used.setdefault(key, deque(maxlen=self.samples)).append(receipt['gasUsed'])
+
+    def clear(self):
+        with self._lock:
+            self._used.clear()
+            self._sent.clear()
+
+
+def _format_receipt(receipt):
+    formatted = dict(receipt)
+    for key in ('status', 'gasUsed', 'cumulativeGasUsed', 'blockNumber', 'transactionIndex'):
+        if isinstance(formatted.get(key), str):
+            formatted[key] = int(formatted[key], 16)
+    return formatted
+
+
+class ReceiptWatcher:
+    def __init__(self, endpoint=RONIN_PROVIDER, poll_interval=RECEIPT_POLL_SECONDS,
+                 timeout=TIMEOUT_MINS * 60, batch_size=BATCH_SIZE):
+        self.endpoint = endpoint
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def watch(self, tx_hash, timeout=None):
+        # Future resolves to the receipt, to None on timeout or raises ValueError on node errors
+        deadline = time() + (timeout or self.timeout)
+        with self._lock:
+            if tx_hash in self._pending:
+                future, current = self._pending[tx_hash]
+                self._pending[tx_hash] = (future, max(current, deadline))
+            else:
+                future = Future()
+                self._pending[tx_hash] = (future, deadline)
+            if self._thread is None or not self._thread.is_alive() or self._stopped.is_set():
+                # Every poller thread gets its own stop event so a stopping one never picks up new work
+                self._stopped = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stopped,), name="receipt-watcher", daemon=True)
+                self._thread.start()
+        return future
+
+    def wait(self, tx_hash, timeout=None):
+        timeout = timeout or self.timeout
+        future = self.watch(tx_hash, timeout)
+        try:
+            # Never block past the deadline, even if the poller died
+            return future.result(timeout=timeout + self.poll_interval)
+        except FutureTimeoutError:
+            # The poller is late, expire the hash here unless someone extended its deadline
+            with self._lock:
+                _, deadline = self._pending.get(tx_hash, (None, 0))
+            if deadline and deadline < time():
+                self._resolve(tx_hash, future, result=None)
+            return None
+
+    def poll(self):
+        with self._lock:
+            pending = list(self._pending.items())
+        if not pending:
+            return 0
+        try:
+            responses = rpc_batch(
+                [("eth_getTransactionReceipt", [tx_hash]) for tx_hash, _ in pending],
+                self.endpoint,
+                self.batch_size)
+        except Exception as err:
+            logging.info(f"Could not poll receipts, giving it a bit more time. Error: {err}")
+            responses = [{}] * len(pending)
+        now = time()
+        for (tx_hash, (future, deadline)), response in zip(pending, responses):
+            error = response.get('error')
+            # Entries without an id were never answered by the node (missing or rejected batch), poll them again
+            if error and 'id' in response and 'receipts not found by' not in error.get('message', ''):
+                self._resolve(tx_hash, future, exception=ValueError(error))
+            elif response.get('result'):
+                self._resolve(tx_hash, future, result=_format_receipt(response['result']))
+            elif now > deadline:
+                self._resolve(tx_hash, future, result=None)
+        with self._lock:
+            return len(self._pending)
+
+    def _resolve(self, tx_hash, future, result=None, exception=None):
+        with self._lock:
+            self._pending.pop(tx_hash, None)
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _run(self, stopped):
+        while not stopped.is_set():
+            with self._lock:
+                pending = len(self._pending)
+                if not pending:
+                    if self._thread is threading.current_thread():
+                        self._thread = None
+                    return
+            logging.debug(f"Waiting for {pending} transactions to finish...")
+            try:
+                self.poll()
+            except Exception as err:
+                logging.warning(f"Important: Error occurred polling receipts. Error given: {err}.")
+            stopped.wait(self.poll_interval)
+
+    def stop(self):
+        # Pending waiters get None, as if their transactions had timed out
+        with self._lock:
+            self._stopped.set()
+            pending = list(self._pending.items())
+            self._pending.clear()
+        for _, (future, _) in pending:
+            if not future.done():
+                future.set_result(None)
+
+
+def get_receipt_watcher(endpoint=RONIN_PROVIDER):
+    with _PROVIDERS_LOCK:
+        if endpoint not in _WATCHERS:
+            _WATCHERS[endpoint] = ReceiptWatcher(endpoint)
+        return _WATCHERS[endpoint]
+
+
+def _receipt_endpoint(w3):
+    return w3.provider.endpoint_uri if w3 is not None else RONIN_PROVIDER
+
+
+def watch_receipt(tx_hash, w3=None):
+    return get_receipt_watcher(_receipt_endpoint(w3)).watch(tx_hash)
+
+
+def wait_for_receipt(tx_hash, w3=None):
+    return get_receipt_watcher(_receipt_endpoint(w3)).wait(tx_hash)
+
+
 def get_lastclaim(account):
     url = f'https://game-api.skymavis.com/game-api/clients/{account.replace("ronin:", "0x")}/items/1'
     try:
@@ -90,23 +642,92 @@ def get_lastclaim(account):
     return None
 
 
-class CustomUI(ClickUI):
+class CustomUI:
+    # trezorlib's ClickUI with a fixed passphrase. It wraps ClickUI instead of subclassing it so trezorlib
+    # is not imported with this module
     def __init__(self, passphrase=None, *args, **kwargs):
         self.passphrase = passphrase
-        super().__init__(*args, **kwargs)
+        self._ui = trezor_ui.ClickUI(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._ui, attr)
 
     def get_passphrase(self, *args, **kwargs):
         return self.passphrase
 
 
+def derive_addresses(node, count):
+    # BIP32 public derivation (CKDpub) of the first count non-hardened children of node, a trezorlib
+    # HDNodeType. Returns their addresses, lowercase
+    from ecdsa import SECP256k1, VerifyingKey
+
+    parent = VerifyingKey.from_string(node.public_key, curve=SECP256k1).pubkey.point
+    addresses = []
+    for i in range(count):
+        digest = hmac.new(node.chain_code, node.public_key + i.to_bytes(4, 'big'), hashlib.sha512).digest()
+        tweak = int.from_bytes(digest[:32], 'big')
+        if tweak >= SECP256k1.order:
+            # Odds are below 1 in 2**127, BIP32 says to move on to the next index
+            raise ValueError(f"Index {i} can not be derived from this node")
+        child = VerifyingKey.from_public_point(parent + SECP256k1.generator * tweak, curve=SECP256k1)
+        addresses.append(Web3.toHex(Web3.keccak(child.to_string())[-20:]))
+    return addresses
+
+
 class TrezorConfig:
     def __init__(self, accounts_number, passphrase=None):
         self.accounts_number = accounts_number
         self.passphrase = '' if not passphrase else passphrase
 
-    def list_bip_paths(self):
-        response = {}
+    def fingerprint(self, client):
+        # Identifies the wallet (device seed plus passphrase) without writing the passphrase to disk
+        device_id = client.features.device_id
+        if not device_id:
+            return None
+        return hmac.new(device_id.encode(), self.passphrase.encode(), hashlib.sha256).hexdigest()
+
+    def load_cache(self, path, fingerprint):
+        if not path or not fingerprint or not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f).get(fingerprint, {})
+
+    def save_cache(self, path, fingerprint, bip_paths):
+        cache = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                cache = json.load(f)
+        cache[fingerprint] = bip_paths
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+
+    def derive_bip_paths(self, client):
+        # One device call for the m/44'/60'/0'/0 public node, every account address is derived locally.
+        # The first one is checked against the device so a wrong wallet never goes unnoticed
+        node = ethereum.get_public_node(client, parse_path(BIP_ACCOUNT_PATH)).node
+        addresses = derive_addresses(node, self.accounts_number)
+        if addresses and ethereum.get_address(client, parse_path(f"{BIP_ACCOUNT_PATH}/0")).lower() != addresses[0]:
+            raise ValueError("Derived addresses do not match the device")
+        return {address.replace('0x', 'ronin:'): f"{BIP_ACCOUNT_PATH}/{i}" for i, address in enumerate(addresses)}
+
+    def list_bip_paths(self, fast=False, cache_path=None):
+        # fast derives the addresses from one public key instead of confirming each one on the device, and
+        # with cache_path the ronin -> bip_path map is kept on disk per device and passphrase
         ui = CustomUI(passphrase=self.passphrase)
+        if fast:
+            client = get_default_client(ui=ui)
+            fingerprint = self.fingerprint(client)
+            ronins = {bip_path: ronin for ronin, bip_path in self.load_cache(cache_path, fingerprint).items()}
+            bip_paths = [f"{BIP_ACCOUNT_PATH}/{i}" for i in range(self.accounts_number)]
+            if any(bip_path not in ronins for bip_path in bip_paths):
+                derived = self.derive_bip_paths(client)
+                ronins = {bip_path: ronin for ronin, bip_path in derived.items()}
+                if cache_path and fingerprint:
+                    self.save_cache(cache_path, fingerprint, derived)
+            return {ronins[bip_path]: {"passphrase": self.passphrase, "bip_path": bip_path} for bip_path in bip_paths}
+        response = {}
         for i in range(self.accounts_number):
             bip_path = f"m/44'/60'/0'/0/{i}"
             client = get_default_client(ui=ui)
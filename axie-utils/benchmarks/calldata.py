@@ -0,0 +1,59 @@
+# Calldata encoding through the web3 contract against axie_utils.calldata, run with: python -m benchmarks.calldata
+from timeit import timeit
+
+from web3 import Web3
+
+from axie_utils.abis import AXIE_ABI, SCATTER_ABI, SLP_ABI
+from axie_utils.calldata import (
+    encode_breed_axies,
+    encode_checkpoint,
+    encode_disperse_token_simple,
+    encode_safe_transfer_from,
+    encode_transfer
+)
+from axie_utils.utils import AXIE_CONTRACT, SCATTER_CONTRACT, SLP_CONTRACT
+
+FROM = Web3.toChecksumAddress("0x" + "ab" * 20)
+TO = Web3.toChecksumAddress("0x" + "1c" * 20)
+SIGNATURE = "0x" + "ab" * 65
+RECIPIENTS = [TO] * 50
+AMOUNTS = list(range(1, 51))
+W3 = Web3()
+
+
+def contract(address, abi):
+    # Every execute builds its contract again, so does the web3 side of the benchmark
+    return W3.eth.contract(address=Web3.toChecksumAddress(address), abi=abi)
+
+
+CASES = [
+    ("transfer",
+     lambda: contract(SLP_CONTRACT, SLP_ABI).encodeABI(fn_name='transfer', args=[TO, 100]),
+     lambda: encode_transfer(TO, 100)),
+    ("checkpoint",
+     lambda: contract(SLP_CONTRACT, SLP_ABI).encodeABI(fn_name='checkpoint', args=[FROM, 100, 1, SIGNATURE]),
+     lambda: encode_checkpoint(FROM, 100, 1, SIGNATURE)),
+    ("safeTransferFrom",
+     lambda: contract(AXIE_CONTRACT, AXIE_ABI).encodeABI(fn_name='safeTransferFrom', args=[FROM, TO, 123]),
+     lambda: encode_safe_transfer_from(FROM, TO, 123)),
+    ("breedAxies",
+     lambda: contract(AXIE_CONTRACT, AXIE_ABI).encodeABI(fn_name='breedAxies', args=[1, 2]),
+     lambda: encode_breed_axies(1, 2)),
+    ("disperseTokenSimple x50",
+     lambda: contract(SCATTER_CONTRACT, SCATTER_ABI).encodeABI(
+         fn_name='disperseTokenSimple', args=[FROM, RECIPIENTS, AMOUNTS]),
+     lambda: encode_disperse_token_simple(FROM, RECIPIENTS, AMOUNTS)),
+]
+
+
+def main(number=500):
+    for name, web3_path, fast_path in CASES:
+        assert web3_path() == fast_path()
+        web3_time = timeit(web3_path, number=number) / number
+        fast_time = timeit(fast_path, number=number) / number
+        print(f"{name:<24} web3 {web3_time * 1e6:>9.1f}us  fast {fast_time * 1e6:>7.1f}us  "
+              f"{web3_time / fast_time:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# Import time of axie_utils in fresh interpreters, run with: python -m benchmarks.imports [runs]
+import subprocess
+import sys
+from statistics import median
+
+CASES = [
+    ("import axie_utils", "import axie_utils"),
+    ("check_balance", "from axie_utils import check_balance"),
+    ("Payment", "from axie_utils import Payment"),
+    ("everything", "from axie_utils import *"),
+    ("TrezorTransfer in use",
+     "from axie_utils import TrezorTransfer\n"
+     "TrezorTransfer('ronin:' + 'a' * 40, None, \"m/44'/60'/0'/0/0\", 'ronin:' + 'b' * 40, 1)"),
+]
+
+
+def timed(code):
+    script = f"import time\nstart = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return float(result.stdout.splitlines()[-1])
+
+
+def main(runs=5):
+    for name, code in CASES:
+        seconds = median(timed(code) for _ in range(runs))
+        print(f"{name:<24} {seconds * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
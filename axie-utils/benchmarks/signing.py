@@ -0,0 +1,48 @@
+# Signatures per second of SigningPool for 1 up to every core, run with: python -m benchmarks.signing [txs]
+import os
+import sys
+from time import perf_counter
+
+from eth_account import Account
+
+from axie_utils.signing import SigningPool
+
+KEYS = ["0x" + str(i) * 64 for i in range(1, 5)]
+ACCOUNTS = [Account.from_key(key).address for key in KEYS]
+RECEIVER = Account.from_key("0x" + "9" * 64).address
+
+
+def jobs(count):
+    return [
+        (ACCOUNTS[i % len(ACCOUNTS)], {
+            "chainId": 2020,
+            "gas": 492874,
+            "gasPrice": 1000000000,
+            "nonce": i,
+            "to": RECEIVER,
+            "value": 0,
+            "data": "0xa9059cbb" + "00" * 64
+        })
+        for i in range(count)
+    ]
+
+
+def main(count=2000):
+    work = jobs(count)
+    cores = os.cpu_count() or 1
+    workers = sorted({1, *range(2, cores + 1, 2), cores})
+    baseline = None
+    for max_workers in workers:
+        pool = SigningPool(dict(zip(ACCOUNTS, KEYS)), max_workers=max_workers)
+        # Warm up, so process start up is not measured
+        pool.sign(work[:max_workers * pool.chunk_size + 1])
+        start = perf_counter()
+        pool.sign(work)
+        rate = count / (perf_counter() - start)
+        pool.close()
+        baseline = baseline or rate
+        print(f"{max_workers:>3} workers: {rate:>9.0f} signatures/sec ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,16 @@
+import pytest
+
+from axie_utils.axies import AXIE_DETAIL_CACHE
+from axie_utils.scatter import ALLOWANCE_CACHE
+from axie_utils.utils import reset_providers
+
+
+@pytest.fixture(autouse=True)
+def fresh_providers():
+    reset_providers()
+    AXIE_DETAIL_CACHE.clear()
+    ALLOWANCE_CACHE.clear()
+    yield
+    reset_providers()
+    AXIE_DETAIL_CACHE.clear()
+    ALLOWANCE_CACHE.clear()
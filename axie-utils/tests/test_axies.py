@@ -1,13 +1,15 @@
 from datetime import datetime, timedelta
 
-from mock import patch, call
+from mock import patch, call, ANY, Mock
 from freezegun import freeze_time
 import requests_mock
 import pytest
+from web3 import Web3
 
 from axie_utils import Axies
+from axie_utils.axies import AxieDetailCache, AxieStore
 from axie_utils.abis import AXIE_ABI
-from axie_utils.utils import AXIE_CONTRACT, RONIN_PROVIDER, USER_AGENT
+from axie_utils.utils import get_web3, AXIE_CONTRACT, RONIN_PROVIDER, USER_AGENT
 from tests.utils import MockedOwner
 
 @freeze_time('2021-01-14 01:10:05')
@@ -18,7 +20,8 @@ def test_axies_init(mocked_provider, mocked_checksum, mocked_contract):
     a = Axies("ronin:abc1")
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(AXIE_CONTRACT)
     mocked_contract.assert_called_with(address="checksum", abi=AXIE_ABI)
@@ -52,11 +55,11 @@ def test_check_axie_owner(mocked_checksum, mocked_contract):
     mocked_contract.assert_called_with(address="checksum", abi=AXIE_ABI)
 
 
-@patch("web3.eth.Eth.contract.functions.tokenOfOwnerByIndex")
+@patch("axie_utils.axies.batch_call", return_value=[1, 2, 3, 4, 5])
 @patch("web3.eth.Eth.contract")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("axie_utils.Axies.number_of_axies", return_value=5)
-def test_get_axies(mocked_number_of_axies, mocked_checksum, mocked_contract, _):
+def test_get_axies(mocked_number_of_axies, mocked_checksum, mocked_contract, mocked_batch_call):
     a = Axies("ronin:abc1")
     axies = a.get_axies()
     mocked_contract.assert_called_with(address="checksum", abi=AXIE_ABI)
@@ -64,12 +67,60 @@ def test_get_axies(mocked_number_of_axies, mocked_checksum, mocked_contract, _):
     mocked_checksum.assert_has_calls(calls=[
         call(AXIE_CONTRACT), call(a.acc)
     ])
-    assert len(axies) == 5
+    mocked_batch_call.assert_called_with([(a.contract, 'tokenOfOwnerByIndex', ["checksum", i]) for i in range(5)])
+    assert axies == [1, 2, 3, 4, 5]
+
+
+@patch("axie_utils.axies.batch_call", side_effect=[[1, None, 3], [2]])
+@patch("axie_utils.Axies.number_of_axies", return_value=3)
+def test_get_axies_retries_failed_reads(_, mocked_batch_call):
+    a = Axies("ronin:" + "ab" * 20)
+    assert a.get_axies() == [1, 2, 3]
+    assert mocked_batch_call.call_args[0][0] == [(a.contract, 'tokenOfOwnerByIndex', [Web3.toChecksumAddress(a.acc), 1])]
+
+
+@patch("axie_utils.axies.batch_call", side_effect=[[1, None, 3], [None]])
+@patch("axie_utils.Axies.number_of_axies", return_value=3)
+def test_get_axies_raises_on_partial_inventory(*args):
+    a = Axies("ronin:" + "ab" * 20)
+    with pytest.raises(ValueError):
+        a.get_axies()
+
+
+def test_check_axie_owners_uses_injected_endpoint():
+    endpoint = "http://localhost:8545"
+    a = Axies("ronin:" + "ab" * 20, w3=get_web3(endpoint))
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(endpoint, json=_owner_callback)
+        owners = a.check_axie_owners([1])
+    assert owners == {1: True}
+
+
+def _owner_callback(request, context):
+    responses = []
+    for call_ in request.json():
+        axie_id = int(call_['params'][0]['data'][10:], 16)
+        if axie_id == 3:
+            responses.append({"jsonrpc": "2.0", "id": call_['id'], "error": {"message": "execution reverted"}})
+            continue
+        owner = 'ab' * 20 if axie_id % 2 else 'cd' * 20
+        responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": '0x' + owner.rjust(64, '0')})
+    return responses
+
+
+def test_check_axie_owners():
+    a = Axies("ronin:" + "ab" * 20)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_owner_callback)
+        owners = a.check_axie_owners([1, 2, 3, 5])
+    assert req_mocker.call_count == 1
+    assert owners == {1: True, 2: False, 3: False, 5: True}
 
 
 @freeze_time('2021-01-14 01:10:05')
-@patch("web3.eth.Eth.contract.functions.tokenOfOwnerByIndex")
-@patch("axie_utils.Axies.get_morph_date_and_body", return_value=(None, None))
+@patch("axie_utils.axies.batch_call", return_value=[123])
+@patch("axie_utils.Axies.get_morph_dates_and_bodies",
+       side_effect=lambda ids: {axie: (None, None) for axie in ids})
 @patch("web3.eth.Eth.contract")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("axie_utils.Axies.number_of_axies", return_value=1)
@@ -90,8 +141,9 @@ def test_find_axies_to_morph_none_morph_date_shape(mocked_number_of_axies,
 
 
 @freeze_time('2021-01-14 01:10:05')
-@patch("web3.eth.Eth.contract.functions.tokenOfOwnerByIndex")
-@patch("axie_utils.Axies.get_morph_date_and_body", return_value=(datetime(2021, 1, 14, 1, 0, 0), "Normal"))
+@patch("axie_utils.axies.batch_call", return_value=[123])
+@patch("axie_utils.Axies.get_morph_dates_and_bodies",
+       side_effect=lambda ids: {axie: (datetime(2021, 1, 14, 1, 0, 0), "Normal") for axie in ids})
 @patch("web3.eth.Eth.contract")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("axie_utils.Axies.number_of_axies", return_value=1)
@@ -112,9 +164,9 @@ def test_find_axies_to_morph_already_adult(mocked_number_of_axies,
 
 
 @freeze_time('2021-01-14 01:10:05')
-@patch("web3.eth.Eth.contract.functions.tokenOfOwnerByIndex")
-@patch("axie_utils.Axies.get_morph_date_and_body",
-       return_value=(datetime(2021, 1, 14, 1, 10, 5)+timedelta(days=2), None))
+@patch("axie_utils.axies.batch_call", return_value=[123])
+@patch("axie_utils.Axies.get_morph_dates_and_bodies",
+       side_effect=lambda ids: {axie: (datetime(2021, 1, 14, 1, 10, 5)+timedelta(days=2), None) for axie in ids})
 @patch("web3.eth.Eth.contract")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("axie_utils.Axies.number_of_axies", return_value=1)
@@ -134,8 +186,9 @@ def test_find_axies_to_morph_not_hatch_time(mocked_number_of_axies,
     assert axies_to_morph == []
 
 
-@patch("web3.eth.Eth.contract.functions.tokenOfOwnerByIndex")
-@patch("axie_utils.Axies.get_morph_date_and_body", return_value=(datetime(2021, 1, 14, 0, 0, 0), None))
+@patch("axie_utils.axies.batch_call", return_value=[123])
+@patch("axie_utils.Axies.get_morph_dates_and_bodies",
+       side_effect=lambda ids: {axie: (datetime(2021, 1, 14, 0, 0, 0), None) for axie in ids})
 @patch("web3.eth.Eth.contract")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("axie_utils.Axies.number_of_axies", return_value=1)
@@ -196,6 +249,46 @@ def test_get_morph_date_body_malformed_json(mocked_json):
     assert resp == (None, None)
 
 
+def _morph_info_callback(request, context):
+    payload = request.json()
+    assert payload['operationName'] == 'GetAxieMorphInfo'
+    data = {}
+    for alias, axie_id in payload['variables'].items():
+        assert f"{alias}: axie(axieId: ${alias})" in payload['query']
+        if axie_id == "3":
+            data[alias] = None
+        else:
+            data[alias] = {"birthDate": 1610500000, "bodyShape": "Normal" if axie_id == "2" else None}
+    return {"data": data}
+
+
+@freeze_time('2021-01-20 00:00:00')
+def test_iter_axies_to_morph():
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", json=_morph_info_callback)
+        a = Axies("ronin:abc1")
+        results = list(a.iter_morph_dates_and_bodies([1, 2, 3], chunk_size=2))
+        statuses = dict((axie, status) for axie, status, _ in a.iter_axies_to_morph([1, 2, 3, 4]))
+    morph_date = datetime.utcfromtimestamp(1610500000) + timedelta(days=5)
+    assert sorted(results, key=lambda r: r[0]) == [(1, morph_date, None), (2, morph_date, "Normal"), (3, None, None)]
+    assert statuses == {1: 'morphable', 2: 'adult', 3: None, 4: 'morphable'}
+    # Two chunks for the first scan, one aliased query for the four axies of the second
+    assert req_mocker.call_count == 3
+
+
+@freeze_time('2021-01-14 01:10:05')
+@patch("axie_utils.axies.batch_call", return_value=[4, 1, 2])
+@patch("axie_utils.Axies.number_of_axies", return_value=3)
+def test_find_axies_to_morph_keeps_inventory_order(*_):
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", json={"data": {
+            "axie0": {"birthDate": 1610000000, "bodyShape": None},
+            "axie1": {"birthDate": 1610000000, "bodyShape": None},
+            "axie2": {"birthDate": 1610000000, "bodyShape": "Normal"}
+        }})
+        assert Axies("ronin:" + "a" * 40).find_axies_to_morph() == [4, 1]
+
+
 def test_get_axie_details_success():
     mocked_json = {
         'data': {
@@ -242,4 +335,95 @@ def test_get_axie_details_fail_req():
         req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", status_code=500)
         a = Axies("ronin:abc1")
         resp = a.get_axie_details(123)
-    assert resp == None
\ No newline at end of file
+    assert resp == None
+
+
+def test_axie_detail_cache_single_fetch():
+    mocked_json = {'data': {'axie': {
+        'id': '123',
+        'class': 'Beast',
+        'birthDate': 1610500000,
+        'bodyShape': None,
+        'parts': [{'id': 'eyes-clear', 'name': 'Clear', 'class': 'Aquatic', 'type': 'Eyes'}]
+    }}}
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", json=mocked_json)
+        assert Axies.get_axie_details(123) == {'eyes': 'clear', 'class': 'beast'}
+        assert Axies.get_morph_date_and_body(123) == (datetime.utcfromtimestamp(1610500000) + timedelta(days=5), None)
+        assert Axies.get_axie_details("123") == {'eyes': 'clear', 'class': 'beast'}
+        assert list(Axies.iter_morph_dates_and_bodies([123])) == [
+            (123, datetime.utcfromtimestamp(1610500000) + timedelta(days=5), None)]
+    assert req_mocker.call_count == 1
+
+
+def test_axie_detail_cache_expires_mutable_fields():
+    cache = AxieDetailCache(maxsize=2, ttl=60)
+    record = {'class': 'Beast', 'parts': [], 'birthDate': 1, 'bodyShape': None}
+    with freeze_time('2021-01-14 00:00:00') as frozen:
+        cache.set(1, record)
+        frozen.tick(timedelta(seconds=120))
+        # Parts and class never change, bodyShape has to be fetched again
+        assert cache.get(1, ('class', 'parts')) is record
+        assert cache.get(1, ('birthDate', 'bodyShape')) is None
+
+
+def test_axie_detail_cache_lru():
+    cache = AxieDetailCache(maxsize=2)
+    cache.set(1, {'class': 'Beast'})
+    cache.set(2, {'class': 'Bird'})
+    assert cache.get(1, ('class',)) == {'class': 'Beast'}
+    cache.set(3, {'class': 'Bug'})
+    assert cache.get(2, ('class',)) is None
+    assert cache.get(1, ('class',)) == {'class': 'Beast'}
+    assert cache.get(3, ('parts',)) is None
+
+
+def _store_callback(request, context):
+    payload = request.json()
+    data = {}
+    for alias, axie_id in payload['variables'].items():
+        data[alias] = {
+            "id": axie_id,
+            "class": "Beast",
+            "birthDate": 1610500000,
+            "bodyShape": None if axie_id == "1" else "Normal",
+            "owner": "0xABC",
+            "parts": [{"id": "eyes-clear", "name": "Clear", "class": "Aquatic", "type": "Eyes"}]
+        }
+    return {"data": data}
+
+
+def test_axie_store_refresh(tmp_path):
+    path = str(tmp_path / "axies.db")
+    with freeze_time('2021-01-14 00:00:00') as frozen:
+        with requests_mock.Mocker() as req_mocker:
+            req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", json=_store_callback)
+            store = AxieStore(path)
+            assert sorted(store.refresh([1, 2, 3], chunk_size=2)) == [1, 2, 3]
+            assert req_mocker.call_count == 2
+            # Nothing changed and nothing is old enough
+            assert store.refresh([1, 2, 3]) == []
+            # Transferred axies are fetched again, adults never go stale on their own
+            assert store.refresh([1, 2, 3], changed=[3]) == [3]
+            frozen.tick(timedelta(days=2))
+            assert store.refresh([1, 2, 3]) == [1]
+            store.close()
+    restored = AxieStore(path)
+    record = restored.get(2)
+    assert record['class'] == "Beast"
+    assert record['owner'] == "0xabc"
+    assert record['bodyShape'] == "Normal"
+    assert record['parts'][0]['name'] == "Clear"
+    assert restored.get(4) is None
+    restored.close()
+
+
+def test_axie_store_last_seen_block(tmp_path):
+    w3 = Mock()
+    w3.eth.block_number = 1234
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post("https://graphql-gateway.axieinfinity.com/graphql", json=_store_callback)
+        store = AxieStore(str(tmp_path / "axies.db"), w3=w3)
+        store.refresh([5])
+    assert store.get(5)['lastSeenBlock'] == 1234
+    store.close()
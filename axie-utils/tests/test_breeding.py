@@ -1,8 +1,15 @@
-from mock import patch
+from concurrent.futures import Future
 
-from axie_utils import Breed, TrezorBreed
+import requests_mock
+from eth_account import Account
+from mock import patch, call, ANY
+
+from axie_utils import Breed, BulkBreed, TrezorBreed
 from axie_utils.abis import AXIE_ABI
+from axie_utils.calldata import encode_breed_axies
+from axie_utils.signing import SigningPool
 from axie_utils.utils import AXIE_CONTRACT, RONIN_PROVIDER, USER_AGENT
+from tests.utils import axie_node
 
 
 def test_breed_init():
@@ -17,7 +24,7 @@ def test_breed_init():
 
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.breeding.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch("web3.eth.Eth.account.sign_transaction")
 @patch("axie_utils.breeding.get_nonce", return_value=1)
@@ -40,15 +47,26 @@ def test_breed_execute(mocked_provider,
     mock_get_nonce.assert_called_once()
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(AXIE_CONTRACT)
-    mocked_contract.assert_called_with(address="checksum", abi=AXIE_ABI)
+    # The calldata is encoded without going through the contract
+    mocked_contract.assert_not_called()
     mocked_sign_transaction.assert_called_once()
+    assert mocked_sign_transaction.call_args[0][0] == {
+        "value": 0,
+        "chainId": 2020,
+        "gas": 492874,
+        "gasPrice": 1000000000,
+        "nonce": 1,
+        "to": "checksum",
+        "data": encode_breed_axies(123, 456)
+    }
     mock_raw_send.assert_called_once()
     mock_keccak.assert_called_once()
     mock_to_hex.assert_called_with("result_of_keccak")
-    mock_receipt.assert_called_with("transaction_hash")
+    mock_receipt.assert_called_with("transaction_hash", w3=ANY)
 
 
 @patch("axie_utils.breeding.parse_path", return_value="parsed_path")
@@ -66,7 +84,7 @@ def test_trezorbreed_init(mock_parse):
 @patch("web3.Web3.toBytes")
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.breeding.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch('axie_utils.breeding.ethereum.sign_tx', return_value=(b'a', b'b', b'c'))
 @patch("axie_utils.breeding.get_nonce", return_value=1)
@@ -92,7 +110,8 @@ def test_trezorbreed_execute(mocked_provider,
     mock_get_nonce.assert_called_once()
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(AXIE_CONTRACT)
     mocked_contract.assert_called_with(address="checksum", abi=AXIE_ABI)
@@ -100,4 +119,57 @@ def test_trezorbreed_execute(mocked_provider,
     mock_raw_send.assert_called_once()
     mock_keccak.assert_called_once()
     mock_to_hex.assert_called_with("result_of_keccak")
-    mock_receipt.assert_called_with("transaction_hash")
+    mock_receipt.assert_called_with("transaction_hash", w3=ANY)
+
+
+def receipt_future(receipt):
+    future = Future()
+    future.set_result(receipt)
+    return future
+
+
+@patch("axie_utils.breeding.watch_receipt")
+@patch("axie_utils.breeding.get_nonce", side_effect=[10, 20])
+def test_bulk_breed(mocked_nonce, mocked_watch):
+    mocked_watch.side_effect = lambda tx_hash, w3: receipt_future({'status': 1})
+    first, second = Account.from_key("0x" + "1" * 64), Account.from_key("0x" + "2" * 64)
+    node = axie_node({1: first.address, 2: first.address, 3: first.address, 4: first.address,
+                      5: second.address, 6: second.address, 7: first.address})
+    bulk = BulkBreed(
+        [(1, 2, first.address), (3, 4, first.address), (5, 6, "ronin:" + second.address[2:]),
+         (5, 7, second.address), (8, 9, "ronin:" + "c" * 40)],
+        {first.address: "0x" + "1" * 64, "ronin:" + second.address[2:].lower(): "0x" + "2" * 64})
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=node)
+        results = bulk.execute()
+    # One batch for the owners of all 9 axies, one burst for the 3 breeds
+    assert req_mocker.call_count == 2
+    assert len(req_mocker.request_history[0].json()) == 9
+    assert [Account.recover_transaction(raw) for raw in node.sent] == [first.address, first.address, second.address]
+    assert {pair: result['status'] for pair, result in results.items()} == {
+        (1, 2): 'bred', (3, 4): 'bred', (5, 6): 'bred', (5, 7): 'not_owned', (8, 9): 'error'}
+    assert [results[pair]['nonce'] for pair in [(1, 2), (3, 4), (5, 6)]] == [10, 11, 20]
+    assert results[(8, 9)]['error'] == "missing private key"
+    mocked_nonce.assert_has_calls([call(first.address.lower()), call(second.address.lower())])
+    assert mocked_watch.call_count == 3
+
+
+@patch("axie_utils.breeding.watch_receipt")
+@patch("axie_utils.breeding.get_nonce", side_effect=[10, 20])
+def test_bulk_breed_with_signing_pool(mocked_nonce, mocked_watch):
+    mocked_watch.side_effect = lambda tx_hash, w3: receipt_future({'status': 1})
+    first, second = Account.from_key("0x" + "1" * 64), Account.from_key("0x" + "2" * 64)
+    node = axie_node({1: first.address, 2: first.address, 3: second.address, 4: second.address})
+    private_keys = {first.address: "0x" + "1" * 64, second.address: "0x" + "2" * 64}
+    # The pool is missing the second key, its breed fails to sign and is not broadcast
+    pool = SigningPool({first.address: "0x" + "1" * 64}, max_workers=1)
+    bulk = BulkBreed([(1, 2, first.address), (3, 4, second.address)], private_keys, signer=pool)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=node)
+        results = bulk.execute()
+    assert [Account.recover_transaction(raw) for raw in node.sent] == [first.address]
+    assert results[(1, 2)]['status'] == 'bred'
+    assert results[(3, 4)]['status'] == 'error'
+    assert results[(3, 4)]['error'] == "missing private key"
+    assert results[(3, 4)]['nonce'] == 20
+    assert mocked_watch.call_count == 1
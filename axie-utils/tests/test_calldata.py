@@ -0,0 +1,60 @@
+import pytest
+from web3 import Web3
+
+from axie_utils.abis import AXIE_ABI, SCATTER_ABI, SLP_ABI
+from axie_utils.calldata import (
+    encode_breed_axies,
+    encode_checkpoint,
+    encode_disperse_ether,
+    encode_disperse_token_simple,
+    encode_safe_transfer_from,
+    encode_transfer
+)
+from axie_utils.utils import AXIE_CONTRACT, SCATTER_CONTRACT, SLP_CONTRACT
+
+FROM = Web3.toChecksumAddress("0x" + "ab" * 20)
+TO = Web3.toChecksumAddress("0x" + "1c" * 20)
+W3 = Web3()
+SLP = W3.eth.contract(address=Web3.toChecksumAddress(SLP_CONTRACT), abi=SLP_ABI)
+AXIE = W3.eth.contract(address=Web3.toChecksumAddress(AXIE_CONTRACT), abi=AXIE_ABI)
+SCATTER = W3.eth.contract(address=Web3.toChecksumAddress(SCATTER_CONTRACT), abi=SCATTER_ABI)
+
+
+@pytest.mark.parametrize("amount", [0, 1, 10 ** 18, 2 ** 256 - 1])
+def test_encode_transfer(amount):
+    assert encode_transfer(TO, amount) == SLP.encodeABI(fn_name='transfer', args=[TO, amount])
+
+
+@pytest.mark.parametrize("signature", ["0x" + "ab" * 65, "0x", b"\x01" * 32, b"\x02" * 33])
+def test_encode_checkpoint(signature):
+    assert encode_checkpoint(FROM, 150, 1639000000, signature) == SLP.encodeABI(
+        fn_name='checkpoint', args=[FROM, 150, 1639000000, signature])
+
+
+def test_encode_axie_calls():
+    assert encode_safe_transfer_from(FROM, TO, 123456) == AXIE.encodeABI(
+        fn_name='safeTransferFrom', args=[FROM, TO, 123456])
+    assert encode_breed_axies(1, 2 ** 40) == AXIE.encodeABI(fn_name='breedAxies', args=[1, 2 ** 40])
+
+
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_encode_disperse(count):
+    recipients = [FROM, TO, FROM][:count]
+    amounts = [1, 2 ** 200, 3][:count]
+    assert encode_disperse_ether(recipients, amounts) == SCATTER.encodeABI(
+        fn_name='disperseEther', args=[recipients, amounts])
+    assert encode_disperse_token_simple(TO, recipients, amounts) == SCATTER.encodeABI(
+        fn_name='disperseTokenSimple', args=[TO, recipients, amounts])
+
+
+@pytest.mark.parametrize("args", [
+    ("ronin:" + "ab" * 20, 1),
+    ("0x" + "ab" * 19, 1),
+    (TO, -1),
+    (TO, 2 ** 256),
+    (TO, True),
+    (TO, "1")
+])
+def test_encode_rejects_invalid_arguments(args):
+    with pytest.raises(ValueError):
+        encode_transfer(*args)
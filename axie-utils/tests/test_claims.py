@@ -1,16 +1,26 @@
+import asyncio
 import builtins
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 
 import pytest
-from mock import patch, mock_open, call
+from mock import patch, mock_open, call, ANY
 import requests_mock
 from hexbytes import HexBytes
+from eth_account import Account
 from eth_account.messages import encode_defunct
 
 from axie_utils import Claim, TrezorClaim
+from axie_utils.claims import ClaimBatch, async_execute_claims
 from axie_utils.abis import SLP_ABI
-from axie_utils.utils import SLP_CONTRACT, RONIN_PROVIDER, USER_AGENT
-from tests.utils import MockedSignedMsg
+from axie_utils.utils import SLP_CONTRACT, RONIN_PROVIDER, RONIN_PROVIDER_FREE, USER_AGENT
+from tests.utils import MockedAsyncSession, MockedSignedMsg
+
+
+def receipt_future(receipt):
+    future = Future()
+    future.set_result(receipt)
+    return future
 
 
 @patch("web3.eth.Eth.contract")
@@ -23,7 +33,8 @@ def test_claim_init(mocked_provider, mocked_checksum, mocked_contract):
         c = Claim(account="ronin:foo", private_key="bar", acc_name="test_acc", force=False)
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(SLP_CONTRACT)
     mocked_contract.assert_called()
@@ -43,7 +54,8 @@ def test_claim_init_force(mocked_provider, mocked_checksum, mocked_contract):
         c = Claim(account="ronin:foo", private_key="bar", acc_name="test_acc", force=True)
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(SLP_CONTRACT)
     mocked_contract.assert_called()
@@ -72,7 +84,8 @@ def test_has_unclaimed_slp(mocked_provider, mocked_checksum, mocked_contract):
             assert unclaimed == 2
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called()
@@ -97,7 +110,8 @@ def test_has_unclaimed_failed_date(mocked_provider, mocked_checksum, mocked_cont
             assert unclaimed is None
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called()
@@ -122,7 +136,8 @@ def test_has_unclaimed_date_force(mocked_provider, mocked_checksum, mocked_contr
             assert unclaimed == 2
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called()
@@ -143,7 +158,8 @@ def test_has_unclaimed_slp_failed_req(mocked_provider, mocked_checksum, mocked_c
             assert unclaimed is None
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called()
@@ -213,7 +229,8 @@ def test_get_jwt(mocked_provider, mocked_checksum, mocked_random_msg, mock_sign_
         assert req_mocker.request_history[0].json() == expected_payload
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(SLP_CONTRACT)
     mocked_random_msg.assert_called_once()
@@ -234,7 +251,8 @@ def test_get_jwt_fail_req(mocked_provider, mocked_checksum, mocked_random_msg, m
         assert jwt is None
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
@@ -284,7 +302,8 @@ def test_jwq_fail_req_content(mocked_provider, mocked_checksum, mocked_random_ms
         assert req_mocker.request_history[0].json() == expected_payload
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
@@ -320,7 +339,8 @@ def test_jwq_fail_req_content_2(mocked_provider, mocked_checksum, mocked_random_
         assert jwt is None
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
@@ -329,7 +349,7 @@ def test_jwq_fail_req_content_2(mocked_provider, mocked_checksum, mocked_random_
 
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.claims.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch("web3.eth.Eth.account.sign_transaction")
 @patch("axie_utils.claims.get_nonce", return_value=1)
@@ -371,7 +391,8 @@ def test_claim_execution(mocked_provider,
             c.execute()
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_has_calls([call(SLP_CONTRACT), call("0xfoo")])
     mocked_contract.assert_called()
@@ -383,14 +404,14 @@ def test_claim_execution(mocked_provider,
     mock_get_nonce.assert_called_with("0xfoo")
     mocked_sign_transaction.assert_called_once()
     mock_raw_send.assert_called_once()
-    mock_receipt.assert_called_with("transaction_hash")
+    mock_receipt.assert_called_with("transaction_hash", w3=ANY)
     mock_keccak.assert_called_once()
     mock_to_hex.assert_called_with("result_of_keccak")
 
 
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.claims.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch("web3.eth.Eth.account.sign_transaction")
 @patch("axie_utils.claims.get_nonce", return_value=1)
@@ -432,7 +453,8 @@ def test_execution_failed_get_blockchain(mocked_provider,
             c.execute()
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with('0xa8754b9fa15fc18bb59458815510e40a12cd2014')
         mocked_contract.assert_called()
@@ -460,7 +482,8 @@ def test_trezor_claim_init(mocked_provider, mocked_checksum, mocked_contract, mo
         c = TrezorClaim(account="ronin:foo", acc_name="test_acc", bip_path="m/44'/60'/0'/0/0", client="client", force=False)
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(SLP_CONTRACT)
     mocked_contract.assert_called_with(address="checksum", abi=SLP_ABI)
@@ -493,7 +516,8 @@ def test_has_unclaimed_slp_trezor(mocked_provider, mocked_checksum, mocked_contr
         mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called_with(address="checksum", abi=SLP_ABI)
@@ -516,7 +540,8 @@ def test_has_unclaimed_slp_failed_req_trezor(mocked_provider, mocked_checksum, m
         mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_contract.assert_called()
@@ -575,7 +600,8 @@ def test_get_jwt_trezor(mocked_provider, mocked_checksum, mocked_random_msg, moc
     mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_checksum.assert_called_with(SLP_CONTRACT)
     mocked_random_msg.assert_called_once()
@@ -604,7 +630,8 @@ def test_get_jwt_fail_req_trezor(
         mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
@@ -662,7 +689,8 @@ def test_jwq_fail_req_content_trezor(
         assert req_mocker.request_history[0].json() == expected_payload
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
@@ -706,163 +734,20 @@ def test_jwq_fail_req_content_2_trezor(
         mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with(SLP_CONTRACT)
         mocked_random_msg.assert_called_once()
         mock_sign_message.assert_called()
 
 
-@pytest.mark.asyncio
 @patch("axie_utils.graphql.parse_path", return_value="parsed_path")
 @patch("axie_utils.claims.rlp.encode")
 @patch("web3.Web3.toBytes")
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
-@patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
-@patch("axie_utils.claims.ethereum.sign_tx", return_value=(b'a', b'b', b'c'))
-@patch("axie_utils.claims.get_nonce", return_value=1)
-@patch("axie_utils.claims.TrezorClaim.get_jwt", return_value="token")
-@patch("axie_utils.claims.TrezorClaim.has_unclaimed_slp", return_value=456)
-@patch("axie_utils.claims.check_balance", return_value=123)
-@patch("web3.eth.Eth.contract")
-@patch("web3.Web3.toChecksumAddress", return_value="checksum")
-@patch("web3.Web3.HTTPProvider", return_value="provider")
-async def test_claim_async_execute_trezor(mocked_provider,
-                                          mocked_checksum,
-                                          mocked_contract,
-                                          moocked_check_balance,
-                                          mocked_unclaimed_slp,
-                                          mock_get_jwt,
-                                          mock_get_nonce,
-                                          mocked_sign_transaction,
-                                          mock_raw_send,
-                                          mock_receipt,
-                                          mock_keccak,
-                                          mock_to_hex,
-                                          mocked_to_bytes,
-                                          mock_rlp,
-                                          mocked_parse):
-    with patch.object(builtins,
-                      "open",
-                      mock_open(read_data='SLP_ABI')):
-        with requests_mock.Mocker() as req_mocker:
-            req_mocker.post(
-                "http://game-api-pre.skymavis.com/v1/players/me/items/1/claim",
-                json={
-                    "blockchainRelated": {
-                        "signature": {
-                            "amount": "456",
-                            "timestamp": str(int(datetime.now().timestamp())),
-                            "signature": "0xsignature"
-                        }
-                    }
-                }
-            )
-            c = TrezorClaim(account="ronin:foo", acc_name="test_acc", bip_path="m/44'/60'/0'/0/0", client="client", force=False)
-            await c.async_execute()
-    mocked_provider.assert_called_with(
-        RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
-    )
-    mocked_to_bytes.assert_called()
-    mock_rlp.assert_called()
-    mocked_checksum.assert_has_calls([call(SLP_CONTRACT), call("0xfoo")])
-    mocked_contract.assert_called_with(address="checksum", abi=SLP_ABI)
-    moocked_check_balance.assert_called_with("0xfoo")
-    mocked_unclaimed_slp.assert_called_once()
-    mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
-    assert c.bip_path == "parsed_path"
-    assert c.client == "client"
-    assert c.account == "0xfoo"
-    mock_get_jwt.assert_called_once()
-    mock_get_nonce.assert_called_with("0xfoo")
-    mocked_sign_transaction.assert_called_once()
-    mock_raw_send.assert_called_once()
-    mock_receipt.assert_called_with("transaction_hash")
-    mock_keccak.assert_called_once()
-    mock_to_hex.assert_called_with("result_of_keccak")
-
-
-@pytest.mark.asyncio
-@patch("axie_utils.graphql.parse_path", return_value="parsed_path")
-@patch("axie_utils.claims.rlp.encode")
-@patch("web3.Web3.toBytes")
-@patch("web3.Web3.toHex", return_value="transaction_hash")
-@patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
-@patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
-@patch("axie_utils.claims.ethereum.sign_tx", return_value=(b'a', b'b', b'c'))
-@patch("axie_utils.claims.get_nonce", return_value=1)
-@patch("axie_utils.claims.TrezorClaim.get_jwt", return_value="token")
-@patch("axie_utils.claims.TrezorClaim.has_unclaimed_slp", return_value=456)
-@patch("axie_utils.claims.check_balance", return_value=123)
-@patch("web3.eth.Eth.contract")
-@patch("web3.Web3.toChecksumAddress", return_value="checksum")
-@patch("web3.Web3.HTTPProvider", return_value="provider")
-async def test_async_execute_failed_get_blockchain_trezor(mocked_provider,
-                                                          mocked_checksum,
-                                                          mocked_contract,
-                                                          moocked_check_balance,
-                                                          mocked_unclaimed_slp,
-                                                          mock_get_jwt,
-                                                          mock_get_nonce,
-                                                          mocked_sign_transaction,
-                                                          mock_raw_send,
-                                                          mock_receipt,
-                                                          mock_keccak,
-                                                          mock_to_hex,
-                                                          mocked_to_bytes,
-                                                          mock_rlp,
-                                                          mocked_parse):
-    with patch.object(builtins,
-                      "open",
-                      mock_open(read_data='SLP_ABI')):
-        with requests_mock.Mocker() as req_mocker:
-            req_mocker.post(
-                "http://game-api-pre.skymavis.com/v1/players/me/items/1/claim",
-                json={
-                    "blockchainRelated": {
-                        "signature": {
-                            "amount": "",
-                            "timestamp": 0,
-                            "signature": ""
-                        }
-                    }
-                }
-            )
-            c = TrezorClaim(account="ronin:foo", acc_name="test_acc", bip_path="m/44'/60'/0'/0/0", client="client", force=False)
-            await c.async_execute()
-        mocked_provider.assert_called_with(
-            RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
-        )
-        mocked_checksum.assert_called_with('0xa8754b9fa15fc18bb59458815510e40a12cd2014')
-        mocked_contract.assert_called_with(address="checksum", abi=SLP_ABI)
-        moocked_check_balance.assert_not_called()
-        mocked_unclaimed_slp.assert_called_once()
-        mocked_parse.assert_called_with("m/44'/60'/0'/0/0")
-        assert c.bip_path == "parsed_path"
-        assert c.client == "client"
-        assert c.account == "0xfoo"
-        mock_get_jwt.assert_called_once()
-        mock_get_nonce.assert_not_called()
-        mocked_sign_transaction.assert_not_called()
-        mock_raw_send.assert_not_called()
-        mock_receipt.assert_not_called()
-        mock_keccak.assert_not_called()
-        mock_to_hex.assert_not_called()
-        mock_rlp.assert_not_called()
-        mocked_to_bytes.assert_not_called()
-
-
-@patch("axie_utils.graphql.parse_path", return_value="parsed_path")
-@patch("axie_utils.claims.rlp.encode")
-@patch("web3.Web3.toBytes")
-@patch("web3.Web3.toHex", return_value="transaction_hash")
-@patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.claims.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch("axie_utils.claims.ethereum.sign_tx", return_value=(b'a', b'b', b'c'))
 @patch("axie_utils.claims.get_nonce", return_value=1)
@@ -907,7 +792,8 @@ def test_claim_execute_trezor(mocked_provider,
             c.execute()
     mocked_provider.assert_called_with(
         RONIN_PROVIDER,
-        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+        request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+        session=ANY
     )
     mocked_to_bytes.assert_called()
     mock_rlp.assert_called()
@@ -923,7 +809,7 @@ def test_claim_execute_trezor(mocked_provider,
     mock_get_nonce.assert_called_with("0xfoo")
     mocked_sign_transaction.assert_called_once()
     mock_raw_send.assert_called_once()
-    mock_receipt.assert_called_with("transaction_hash")
+    mock_receipt.assert_called_with("transaction_hash", w3=ANY)
     mock_keccak.assert_called_once()
     mock_to_hex.assert_called_with("result_of_keccak")
 
@@ -933,7 +819,7 @@ def test_claim_execute_trezor(mocked_provider,
 @patch("web3.Web3.toBytes")
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.claims.wait_for_receipt", return_value={'status': 1})
 @patch("web3.eth.Eth.send_raw_transaction", return_value="raw_tx")
 @patch("axie_utils.claims.ethereum.sign_tx", return_value=(b'a', b'b', b'c'))
 @patch("axie_utils.claims.get_nonce", return_value=1)
@@ -978,7 +864,8 @@ def test_execute_failed_get_blockchain_trezor(mocked_provider,
             c.execute()
         mocked_provider.assert_called_with(
             RONIN_PROVIDER,
-            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}}
+            request_kwargs={"headers": {"content-type": "application/json", "user-agent": USER_AGENT}},
+            session=ANY
         )
         mocked_checksum.assert_called_with('0xa8754b9fa15fc18bb59458815510e40a12cd2014')
         mocked_contract.assert_called_with(address="checksum", abi=SLP_ABI)
@@ -996,4 +883,152 @@ def test_execute_failed_get_blockchain_trezor(mocked_provider,
         mock_keccak.assert_not_called()
         mock_to_hex.assert_not_called()
         mock_rlp.assert_not_called()
-        mocked_to_bytes.assert_not_called()
\ No newline at end of file
+        mocked_to_bytes.assert_not_called()
+
+
+PRIVATE_KEY = "0x" + "11" * 32
+ADDRESS = Account.from_key(PRIVATE_KEY).address.lower()
+GRAPHQL_URL = "https://graphql-gateway.axieinfinity.com/graphql"
+CLAIM_URL = "http://game-api-pre.skymavis.com/v1/players/me/items/1/claim"
+
+
+def _graphql(payload):
+    if payload['operationName'] == 'CreateRandomMessage':
+        return {"data": {"createRandomMessage": "random_msg"}}
+    return {"data": {"createAccessTokenWithSignature": {"accessToken": "token"}}}
+
+
+def _node(payload):
+    if payload['method'] == 'eth_sendRawTransaction':
+        return {"jsonrpc": "2.0", "id": 1, "result": "0xhash"}
+    return {"jsonrpc": "2.0", "id": 1, "result": hex(500)}
+
+
+def _claim_session(address, signature):
+    return MockedAsyncSession({
+        f"http://game-api-pre.skymavis.com/v1/players/{address}/items/1": {
+            "lastClaimedItemAt": 0, "rawTotal": 456, "rawClaimableTotal": 0},
+        GRAPHQL_URL: _graphql,
+        CLAIM_URL: {"blockchainRelated": {"signature": signature}},
+        RONIN_PROVIDER_FREE: {"jsonrpc": "2.0", "id": 1, "result": "0x5"},
+        RONIN_PROVIDER: _node
+    })
+
+
+@pytest.mark.asyncio
+@patch("web3.providers.rpc.HTTPProvider.make_request", side_effect=AssertionError("blocking web3 call"))
+@patch("axie_utils.claims.watch_receipt", side_effect=lambda *args, **kwargs: receipt_future({'status': 1}))
+async def test_claim_async_execute(mock_receipt, mock_make_request):
+    with patch.object(builtins, "open", mock_open(read_data='{"foo": "bar"}')):
+        c = Claim(account=ADDRESS.replace("0x", "ronin:"), private_key=PRIVATE_KEY, acc_name="test_acc", force=False)
+    session = _claim_session(ADDRESS, {"amount": 456, "timestamp": 1, "signature": "0x" + "ab" * 65})
+    await c.async_execute(session)
+    calls = [(url, json['method'] if json and 'method' in json else None) for _, url, json in session.requests]
+    assert calls == [
+        (f"http://game-api-pre.skymavis.com/v1/players/{ADDRESS}/items/1", None),
+        (GRAPHQL_URL, None),
+        (GRAPHQL_URL, None),
+        (CLAIM_URL, None),
+        (RONIN_PROVIDER_FREE, "eth_getTransactionCount"),
+        (RONIN_PROVIDER, "eth_sendRawTransaction"),
+        (RONIN_PROVIDER, "eth_call")
+    ]
+    raw_tx = session.requests[5][2]['params'][0]
+    assert Account.recover_transaction(raw_tx).lower() == ADDRESS
+    mock_receipt.assert_called_with(c.w3.toHex(c.w3.keccak(hexstr=raw_tx)), w3=c.w3)
+    mock_make_request.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("axie_utils.graphql.parse_path", return_value="parsed_path")
+@patch("axie_utils.graphql.ethereum.sign_message", return_value=MockedSignedMsg())
+@patch("axie_utils.claims.ethereum.sign_tx", return_value=(27, b'\x00' + b'\x01' * 31, b'\x02' * 32))
+@patch("web3.providers.rpc.HTTPProvider.make_request", side_effect=AssertionError("blocking web3 call"))
+@patch("axie_utils.claims.watch_receipt", side_effect=lambda *args, **kwargs: receipt_future({'status': 1}))
+async def test_claim_async_execute_trezor(mock_receipt, mock_make_request, mock_sign_tx, mock_sign_message, _):
+    with patch.object(builtins, "open", mock_open(read_data='SLP_ABI')):
+        c = TrezorClaim(account=ADDRESS, acc_name="test_acc", bip_path="m/44'/60'/0'/0/0", client="client", force=False)
+    session = _claim_session(ADDRESS, {"amount": 456, "timestamp": 1, "signature": "0x" + "ab" * 65})
+    await c.async_execute(session)
+    mock_sign_message.assert_called_with("client", "parsed_path", "random_msg")
+    assert mock_sign_tx.call_args.kwargs['nonce'] == 5
+    assert mock_sign_tx.call_args.kwargs['chain_id'] == 2020
+    assert mock_sign_tx.call_args.kwargs['data'] == c.w3.toBytes(hexstr=c.slp_contract.encodeABI(
+        fn_name='checkpoint', args=[c.w3.toChecksumAddress(ADDRESS), 456, 1, "0x" + "ab" * 65]))
+    assert [json['method'] for _, url, json in session.requests if url == RONIN_PROVIDER] == [
+        "eth_sendRawTransaction", "eth_call"]
+    mock_receipt.assert_called_once()
+    mock_make_request.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("axie_utils.claims.watch_receipt")
+async def test_claim_async_execute_no_signature(mock_receipt):
+    with patch.object(builtins, "open", mock_open(read_data='{"foo": "bar"}')):
+        c = Claim(account=ADDRESS, private_key=PRIVATE_KEY, acc_name="test_acc", force=False)
+    session = _claim_session(ADDRESS, {"amount": "", "timestamp": 0, "signature": ""})
+    await c.async_execute(session)
+    assert [url for _, url, _ in session.requests][-1] == CLAIM_URL
+    mock_receipt.assert_not_called()
+
+
+class SlowClaim:
+
+    running = 0
+    peak = 0
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def async_execute(self, session):
+        SlowClaim.running += 1
+        SlowClaim.peak = max(SlowClaim.peak, SlowClaim.running)
+        await asyncio.sleep(0.01)
+        SlowClaim.running -= 1
+        if self.fail:
+            raise ValueError("nonce too low")
+        return True
+
+
+@pytest.mark.asyncio
+async def test_async_execute_claims_bounded():
+    claims = [SlowClaim(fail=i == 3) for i in range(10)]
+    results = await async_execute_claims(claims, max_concurrency=3)
+    assert results == [True, True, True, None, True, True, True, True, True, True]
+    assert SlowClaim.peak == 3
+
+
+@pytest.mark.asyncio
+@patch("axie_utils.claims.watch_receipt", side_effect=lambda *args, **kwargs: receipt_future({'status': 1}))
+async def test_claim_batch(mock_receipt):
+    other_key = "0x" + "22" * 32
+    other = Account.from_key(other_key).address.lower()
+    broken_key = "0x" + "33" * 32
+    broken = Account.from_key(broken_key).address.lower()
+    session = _claim_session(ADDRESS, {"amount": 456, "timestamp": 1, "signature": "0x" + "ab" * 65})
+    session.responses[f"http://game-api-pre.skymavis.com/v1/players/{other}/items/1"] = {
+        "lastClaimedItemAt": 0, "rawTotal": 0, "rawClaimableTotal": 0}
+    session.responses[f"http://game-api-pre.skymavis.com/v1/players/{broken}/items/1"] = {
+        "lastClaimedItemAt": 0, "rawTotal": 10, "rawClaimableTotal": 0}
+    with patch.object(builtins, "open", mock_open(read_data='{"foo": "bar"}')):
+        batch = ClaimBatch([
+            ("acc1", ADDRESS, PRIVATE_KEY),
+            ("acc2", other, other_key),
+            ("acc3", broken, broken_key)
+        ], concurrency={'send': 1}, rates={'claim_api': 100})
+
+    def nonce(payload):
+        if payload['params'][0].lower() == broken:
+            return {"jsonrpc": "2.0", "id": 1, "error": {"message": "node down"}}
+        return {"jsonrpc": "2.0", "id": 1, "result": "0x5"}
+
+    session.responses[RONIN_PROVIDER_FREE] = nonce
+    reports = await batch.async_execute(session)
+    assert [(r['acc_name'], r['status'], r['stage'], r['amount']) for r in reports] == [
+        ("acc1", "claimed", "receipt", 456),
+        ("acc2", "skipped", "unclaimed", None),
+        ("acc3", "error", "send", 10)
+    ]
+    assert reports[0]['hash'] == mock_receipt.call_args.args[0]
+    assert reports[0]['account'] == ADDRESS.replace("0x", "ronin:")
+    assert "node down" in reports[2]['error']
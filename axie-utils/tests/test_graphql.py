@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from mock import patch
+import requests_mock
+from hexbytes import HexBytes
+
+from axie_utils.graphql import EncryptedJWTCache, JWTCache, jwt_expiry
+from axie_utils.morphing import Morph
+
+
+def make_jwt(exp):
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip('=')
+    return f"eyJhbGciOiJIUzI1NiJ9.{claims}.signature"
+
+
+def test_jwt_expiry():
+    assert jwt_expiry(make_jwt(1700000000)) == 1700000000
+    assert jwt_expiry("not-a-jwt") is None
+    assert jwt_expiry(None) is None
+
+
+def test_jwt_cache():
+    now = int(datetime.now().timestamp())
+    cache = JWTCache(margin=60)
+    fresh = make_jwt(now + 3600)
+    cache.set("0xabc", fresh)
+    cache.set("0xdef", make_jwt(now + 30))
+    cache.set("0x123", "opaque-token")
+    assert cache.get("0xabc") == fresh
+    # Too close to expiry, or no expiry at all, means no reuse
+    assert cache.get("0xdef") is None
+    assert cache.get("0x123") is None
+    cache.invalidate("0xabc")
+    assert cache.get("0xabc") is None
+
+
+def _graphql_callback(request, context):
+    operation = request.json()['operationName']
+    if operation == 'CreateRandomMessage':
+        return {"data": {"createRandomMessage": "random_msg"}}
+    if operation == 'CreateAccessTokenWithSignature':
+        token = make_jwt(int(datetime.now().timestamp()) + 3600)
+        return {"data": {"createAccessTokenWithSignature": {"accessToken": token}}}
+    return {"data": {"morphAxie": True}}
+
+
+@patch("web3.eth.Eth.account.sign_message", return_value={"signature": HexBytes(b"123")})
+def test_morph_reuses_cached_jwt(_):
+    cache = JWTCache()
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post('https://graphql-gateway.axieinfinity.com/graphql', json=_graphql_callback)
+        for axie in range(3):
+            Morph(axie=axie, account="ronin:abc1", private_key="0xabc1", jwt_cache=cache).execute()
+    operations = [r.json()['operationName'] for r in req_mocker.request_history]
+    assert operations == ['CreateRandomMessage', 'CreateAccessTokenWithSignature',
+                          'MorphAxie', 'MorphAxie', 'MorphAxie']
+    tokens = {r.headers['authorization'] for r in req_mocker.request_history if 'authorization' in r.headers}
+    assert tokens == {f"Bearer {cache.get('0xabc1')}"}
+
+
+def test_encrypted_jwt_cache(tmp_path):
+    path = str(tmp_path / "jwt.cache")
+    key = EncryptedJWTCache.generate_key()
+    token = make_jwt(int(datetime.now().timestamp()) + 3600)
+    cache = EncryptedJWTCache(path, key)
+    cache.set("0xabc", token)
+    cache.set("0xold", make_jwt(1))
+    with open(path, 'rb') as f:
+        assert b"0xabc" not in f.read()
+    restored = EncryptedJWTCache(path, key)
+    assert restored.get("0xabc") == token
+    # Expired tokens are not written back
+    assert "0xold" not in restored._tokens
+    # A different key cannot read the file, it starts empty instead of failing
+    assert EncryptedJWTCache(path, EncryptedJWTCache.generate_key()).get("0xabc") is None
+
+
+def test_encrypted_jwt_cache_needs_cryptography(tmp_path):
+    with patch.dict("sys.modules", {"cryptography.fernet": None}):
+        with pytest.raises(ImportError):
+            EncryptedJWTCache(str(tmp_path / "jwt.cache"), b"key")
@@ -0,0 +1,190 @@
+import json
+
+from mock import patch
+import requests_mock
+
+from axie_utils.indexer import AxieIndexer, BalanceIndexer, TRANSFER_TOPIC
+from axie_utils.utils import check_balance, AXIE_CONTRACT, RONIN_PROVIDER, SLP_CONTRACT, WETH_CONTRACT
+
+ALICE = '0x' + 'a' * 40
+BOB = '0x' + 'b' * 40
+CAROL = '0x' + 'c' * 40
+
+
+def _topic(address):
+    return '0x' + address[2:].rjust(64, '0')
+
+
+class FakeChain:
+    # Minimal JSON-RPC stand-in: eth_blockNumber and eth_getLogs with address, range and topic filters
+
+    def __init__(self, head, max_range=None):
+        self.head = head
+        self.max_range = max_range
+        self.logs = []
+        self.ranges = []
+        # (contract, account) -> balance, served to eth_call balanceOf
+        self.balances = {}
+        self.calls = []
+
+    def transfer(self, block, sender, receiver, token, contract=AXIE_CONTRACT, value=None):
+        topics = [TRANSFER_TOPIC, _topic(sender), _topic(receiver)]
+        if value is None:
+            topics.append(hex(token))
+        self.logs.append({
+            "address": contract,
+            "blockNumber": hex(block),
+            "logIndex": hex(len(self.logs)),
+            "topics": topics,
+            "data": hex(value) if value is not None else "0x"
+        })
+
+    def _matches(self, log, query):
+        start, end = int(query['fromBlock'], 16), int(query['toBlock'], 16)
+        addresses = query['address'] if isinstance(query['address'], list) else [query['address']]
+        if log['address'] not in addresses or not start <= int(log['blockNumber'], 16) <= end:
+            return False
+        for expected, actual in zip(query['topics'], log['topics']):
+            if expected is not None and actual not in (expected if isinstance(expected, list) else [expected]):
+                return False
+        return True
+
+    def __call__(self, request, context):
+        responses = []
+        for call_ in request.json():
+            if call_['method'] == 'eth_blockNumber':
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": hex(self.head)})
+                continue
+            query = call_['params'][0]
+            if call_['method'] == 'eth_call':
+                self.calls.append(call_['params'])
+                balance = self.balances.get((query['to'], '0x' + query['data'][-40:]), 0)
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": hex(balance)})
+                continue
+            start, end = int(query['fromBlock'], 16), int(query['toBlock'], 16)
+            self.ranges.append((start, end))
+            if self.max_range and end - start + 1 > self.max_range:
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "error": {"message": "query returned more than 10000 results"}})
+                continue
+            logs = [log for log in self.logs if self._matches(log, query)]
+            responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": logs})
+        return responses
+
+
+def test_axie_indexer_refresh(tmp_path):
+    chain = FakeChain(head=105)
+    chain.transfer(10, CAROL, ALICE, 1)
+    chain.transfer(20, CAROL, ALICE, 2)
+    chain.transfer(30, ALICE, BOB, 1)
+    chain.transfer(40, CAROL, CAROL, 3)
+    chain.transfer(50, ALICE, CAROL, 2)
+    chain.transfer(60, CAROL, BOB, 4)
+    path = str(tmp_path / "axies.json")
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=chain)
+        indexer = AxieIndexer(["ronin:" + ALICE[2:], BOB], path=path, chunk_size=16)
+        assert indexer.refresh() == [1, 2, 4]
+        assert indexer.block == 100
+        assert indexer.get_axies("ronin:" + ALICE[2:]) == []
+        assert indexer.get_axies(BOB) == [1, 4]
+        assert indexer.owner_of(1) == BOB
+        assert indexer.owner_of(3) is None
+        # Only the new blocks are scanned
+        chain.transfer(103, BOB, ALICE, 4)
+        chain.head = 120
+        scanned = len(chain.ranges)
+        assert indexer.refresh() == [4]
+        assert all(start > 100 for start, _ in chain.ranges[scanned:])
+    with open(path) as f:
+        assert json.load(f)['block'] == 115
+    restored = AxieIndexer([BOB, ALICE], path=path)
+    assert restored.block == 115
+    assert restored.get_axies(ALICE) == [4]
+    assert restored.owner_of(1) == BOB
+
+
+def test_axie_indexer_splits_refused_ranges():
+    chain = FakeChain(head=70, max_range=4)
+    chain.transfer(7, CAROL, ALICE, 1)
+    chain.transfer(61, CAROL, ALICE, 2)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=chain)
+        indexer = AxieIndexer([ALICE], chunk_size=16, confirmations=0)
+        indexer.refresh()
+    assert indexer.get_axies(ALICE) == [1, 2]
+    assert max(end - start + 1 for start, end in chain.ranges) == 16
+
+
+@patch("axie_utils.indexer.Axies.get_axies", side_effect=[[1, 2], [3]])
+def test_axie_indexer_bootstrap(mocked_get_axies, tmp_path):
+    chain = FakeChain(head=500)
+    chain.transfer(502, ALICE, BOB, 2)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=chain)
+        indexer = AxieIndexer([ALICE, BOB], path=str(tmp_path / "axies.json"), start_block=1)
+        indexer.bootstrap()
+        assert indexer.block == 500
+        assert indexer.get_axies(ALICE) == [1, 2]
+        chain.head = 510
+        assert indexer.refresh() == [2]
+    assert indexer.get_axies(ALICE) == [1]
+    assert indexer.get_axies(BOB) == [2, 3]
+    assert all(start > 500 for start, _ in chain.ranges)
+
+
+def test_balance_indexer(tmp_path):
+    chain = FakeChain(head=100)
+    chain.balances[(SLP_CONTRACT, ALICE)] = 40
+    chain.balances[(WETH_CONTRACT, BOB)] = 2 * 10**18
+    path = str(tmp_path / "balances.json")
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=chain)
+        indexer = BalanceIndexer([ALICE, BOB], path=path, chunk_size=16)
+        indexer.bootstrap()
+        assert indexer.block == 95
+        # Reconciliation reads balanceOf at the indexed block
+        assert {params[1] for params in chain.calls} == {hex(95)}
+        assert indexer.balance(ALICE, 'slp') == 40
+        assert indexer.balance("ronin:" + BOB[2:], 'weth') == 2.0
+        chain.transfer(97, '0x' + '0' * 40, ALICE, None, contract=SLP_CONTRACT, value=100)
+        chain.transfer(98, ALICE, BOB, None, contract=SLP_CONTRACT, value=30)
+        chain.transfer(99, BOB, CAROL, None, contract=WETH_CONTRACT, value=5 * 10**17)
+        chain.transfer(99, CAROL, CAROL, None, contract=SLP_CONTRACT, value=7)
+        chain.head = 110
+        assert indexer.refresh() == [ALICE, BOB]
+    assert indexer.balance(ALICE, 'slp') == 110
+    assert indexer.balance(BOB, 'slp') == 30
+    assert indexer.balance(BOB, 'weth') == 1.5
+    assert indexer.balance(CAROL, 'slp') is None
+    assert indexer.balance(ALICE, 'ron') is None
+    restored = BalanceIndexer([BOB, ALICE], path=path)
+    assert restored.block == 105
+    assert restored.balance(ALICE, 'slp') == 110
+    # A checkpoint for other tokens is not reused
+    assert BalanceIndexer([BOB, ALICE], tokens=['slp'], path=path).block == -1
+
+
+def test_balance_indexer_reconcile():
+    chain = FakeChain(head=50)
+    chain.balances[(SLP_CONTRACT, ALICE)] = 12
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=chain)
+        indexer = BalanceIndexer([ALICE], tokens=['slp'], confirmations=0)
+        indexer.bootstrap()
+        chain.balances[(SLP_CONTRACT, ALICE)] = 20
+        assert indexer.reconcile(fix=False) == [(ALICE, 'slp', 12, 20)]
+        assert indexer.balance(ALICE) == 12
+        assert indexer.reconcile(sample=1) == [(ALICE, 'slp', 12, 20)]
+        assert indexer.balance(ALICE) == 20
+
+
+@patch("web3.eth.Eth.contract")
+def test_check_balance_from_index(mocked_contract):
+    indexer = BalanceIndexer([ALICE], tokens=['slp'])
+    indexer.balances = [42]
+    # Never refreshed, so the node is asked
+    mocked_contract.return_value.functions.balanceOf.return_value.call.return_value = 7
+    assert check_balance(ALICE, 'slp', index=indexer) == 7
+    indexer.refreshed_at = float('inf')
+    assert check_balance(ALICE, 'slp', index=indexer) == 42
+    assert check_balance(ALICE, 'axs', index=indexer) == 7
@@ -1,5 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
 import axie_utils
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fresh_import(code):
+    # (seconds, loaded modules) of a fresh interpreter running code
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"{code}\n"
+        "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    seconds, modules = json.loads(result.stdout.splitlines()[-1])
+    return seconds, set(modules)
+
 
 def test_version():
     assert axie_utils.__version__ == '2.1.3'
@@ -8,22 +28,66 @@ def test_version():
 def test_init():
     assert axie_utils.__all__ == [
     'Axies',
+    'AxieStore',
     'AxieGraphQL',
+    'AxieIndexer',
+    'BalanceIndexer',
     'Breed',
+    'BulkBreed',
+    'BulkTransfer',
     'Claim',
+    'ClaimBatch',
     'CustomUI',
+    'EncryptedJWTCache',
+    'GasEstimator',
+    'JWTCache',
     'Morph',
+    'MorphBatch',
+    'NonceManager',
     'Payment',
+    'PaymentPlanner',
     'Scatter',
+    'SigningPool',
     'Transfer',
     'TrezorAxieGraphQL',
     'TrezorBreed',
     'TrezorClaim',
     'TrezorConfig',
     'TrezorMorph',
+    'TrezorMorphBatch',
     'TrezorPayment',
     'TrezorScatter',
+    'TrezorSigningSession',
     'TrezorTransfer',
     'get_nonce',
     'get_lastclaim',
-    'check_balance']
+    'get_web3',
+    'check_balance',
+    'check_balances',
+    'async_execute_claims']
+
+
+
+def test_exports_are_lazy():
+    assert sorted(axie_utils._EXPORTS) == sorted(axie_utils.__all__)
+    for name in axie_utils.__all__:
+        assert getattr(axie_utils, name) is getattr(
+            sys.modules[f"axie_utils.{axie_utils._EXPORTS[name]}"], name)
+    assert set(axie_utils.__all__) <= set(dir(axie_utils))
+
+
+def test_import_time():
+    eager, modules = fresh_import("from axie_utils import *")
+    assert "trezorlib.ethereum" not in modules
+    bare, modules = fresh_import("import axie_utils")
+    assert "web3" not in modules and "axie_utils.utils" not in modules
+    assert bare < eager / 10
+    _, modules = fresh_import("from axie_utils import check_balance")
+    assert "axie_utils.utils" in modules and "axie_utils.payments" not in modules
+    assert not [module for module in modules if module.startswith("trezorlib")]
+    # trezorlib is only imported once a Trezor class needs it
+    _, modules = fresh_import(
+        "from axie_utils import TrezorTransfer\n"
+        "assert 'trezorlib' not in sys.modules\n"
+        "TrezorTransfer('ronin:' + 'a' * 40, None, \"m/44'/60'/0'/0/0\", 'ronin:' + 'b' * 40, 1)")
+    assert "trezorlib.tools" in modules
@@ -1,9 +1,9 @@
-from mock import patch
+from mock import patch, call, Mock
 import requests_mock
 from hexbytes import HexBytes
 from eth_account.messages import encode_defunct
 
-from axie_utils.morphing import Morph, TrezorMorph
+from axie_utils.morphing import Morph, MorphBatch, TrezorMorph, TrezorMorphBatch
 from tests.utils import MockedSignedMsg
 
 
@@ -92,3 +92,48 @@ def test_morph_execute_bad_json_response_trezor(mock_get_jwt, mock_sign_msg, moc
     mock_parse.assert_called()
     mock_get_jwt.assert_called()
     mock_sign_msg.assert_called()
+
+
+def _morph_callback(request, context):
+    if request.json()['variables']['axieId'] == "2":
+        return {"data": {"morphAxie": False}}
+    return {"data": {"morphAxie": True}}
+
+
+@patch("web3.eth.Eth.account.sign_message", return_value={"signature": HexBytes(b"123")})
+@patch("axie_utils.MorphBatch.get_jwt", return_value="token")
+def test_morph_batch_execute(mock_get_jwt, mock_sign_msg):
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post('https://graphql-gateway.axieinfinity.com/graphql', json=_morph_callback)
+        m = MorphBatch(axies=[1, 2, 3], account="ronin:abc1", private_key="0xabc1", max_workers=2)
+        results = m.execute()
+    assert results == {1: 'morphed', 2: 'failed', 3: 'morphed'}
+    mock_get_jwt.assert_called_once()
+    assert mock_sign_msg.call_count == 3
+    assert sorted(r.json()['variables']['axieId'] for r in req_mocker.request_history) == ["1", "2", "3"]
+    assert {r.headers['authorization'] for r in req_mocker.request_history} == {"Bearer token"}
+
+
+@patch("axie_utils.MorphBatch.get_jwt", return_value=None)
+def test_morph_batch_execute_no_jwt(_):
+    with requests_mock.Mocker() as req_mocker:
+        m = MorphBatch(axies=[1, 2], account="ronin:abc1", private_key="0xabc1")
+        assert m.execute() == {1: 'failed', 2: 'failed'}
+    assert req_mocker.call_count == 0
+
+
+@patch("axie_utils.graphql.parse_path", return_value="m/44'/60'/0'/0/0")
+@patch("axie_utils.morphing.ethereum.sign_message", return_value=MockedSignedMsg())
+@patch("axie_utils.TrezorMorphBatch.get_jwt", return_value="token")
+def test_morph_batch_execute_trezor(mock_get_jwt, mock_sign_msg, mock_parse):
+    client = Mock()
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post('https://graphql-gateway.axieinfinity.com/graphql', json=_morph_callback)
+        m = TrezorMorphBatch(axies=[1, 3], account="ronin:abc1", client=client, bip_path="m/44'/60'/0'/0/0")
+        assert m.execute() == {1: 'morphed', 3: 'morphed'}
+    mock_sign_msg.assert_has_calls([
+        call(client, "m/44'/60'/0'/0/0", "axie_id=1&owner=0xabc1"),
+        call(client, "m/44'/60'/0'/0/0", "axie_id=3&owner=0xabc1")
+    ])
+    client.open.assert_called_once()
+    client.close.assert_called_once()
@@ -1,9 +1,15 @@
-from mock import patch, call
+from concurrent.futures import Future
 
-from axie_utils import Payment, TrezorPayment
+from mock import patch, call, ANY
+from web3 import Web3
+
+from axie_utils import GasEstimator, Payment, PaymentPlanner, TrezorPayment
 from axie_utils.abis import SLP_ABI
 from axie_utils.utils import SLP_CONTRACT
 
+# Every payment passes the balance preflight
+funded = patch("axie_utils.payments.preflight", lambda txs, **kwargs: [True] * len(txs))
+
 
 @patch("web3.eth.Eth.contract", return_value="contract")
 @patch("web3.Web3.toChecksumAddress")
@@ -24,6 +30,7 @@ def test_payment_get_nonce_calls_w3_low_nonce(mocked_checksum, mock_contract):
     assert p.amount == 10
 
 
+@funded
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("web3.eth.Eth.account.sign_transaction")
@@ -31,7 +38,7 @@ def test_payment_get_nonce_calls_w3_low_nonce(mocked_checksum, mock_contract):
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.payments.wait_for_receipt", return_value={'status': 1})
 def test_execute_calls_web3_functions(mock_transaction_receipt,
                                       mock_contract,
                                       mock_keccak,
@@ -57,9 +64,10 @@ def test_execute_calls_web3_functions(mock_transaction_receipt,
         call(SLP_CONTRACT),
         call('0xfrom_ronin'),
         call('0xto_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    mock_transaction_receipt.assert_called_with("transaction_hash", w3=ANY)
 
 
+@funded
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
 @patch("axie_utils.Payment.increase_gas_tx")
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
@@ -68,7 +76,7 @@ def test_execute_calls_web3_functions(mock_transaction_receipt,
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 0})
+@patch("axie_utils.payments.wait_for_receipt", return_value={'status': 0})
 def test_execute_calls_web3_functions_retry(mock_transaction_receipt,
                                             mock_contract,
                                             mock_keccak,
@@ -95,10 +103,11 @@ def test_execute_calls_web3_functions_retry(mock_transaction_receipt,
         call(SLP_CONTRACT),
         call('0xfrom_ronin'),
         call('0xto_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    mock_transaction_receipt.assert_called_with("transaction_hash", w3=ANY)
     mock_increase_gas_tx.assert_called_with(123)
 
 
+@funded
 @patch("axie_utils.payments.rlp.encode")
 @patch("web3.Web3.toBytes")
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
@@ -108,7 +117,7 @@ def test_execute_calls_web3_functions_retry(mock_transaction_receipt,
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.payments.wait_for_receipt", return_value={'status': 1})
 def test_execute_calls_web3_functions_trezor(mock_transaction_receipt,
                                              mock_contract,
                                              mock_keccak,
@@ -138,9 +147,10 @@ def test_execute_calls_web3_functions_trezor(mock_transaction_receipt,
         call(SLP_CONTRACT),
         call('0xfrom_ronin'),
         call('0xto_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    mock_transaction_receipt.assert_called_with("transaction_hash", w3=ANY)
 
 
+@funded
 @patch("axie_utils.payments.rlp.encode")
 @patch("web3.Web3.toBytes")
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
@@ -150,7 +160,7 @@ def test_execute_calls_web3_functions_trezor(mock_transaction_receipt,
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 0})
+@patch("axie_utils.payments.wait_for_receipt", return_value={'status': 0})
 @patch("axie_utils.payments.TrezorPayment.increase_gas_tx")
 def test_execute_calls_web3_functions_retry_trezor(mock_increase_gas_tx,
                                                    mock_transaction_receipt,
@@ -182,5 +192,153 @@ def test_execute_calls_web3_functions_retry_trezor(mock_increase_gas_tx,
         call(SLP_CONTRACT),
         call('0xfrom_ronin'),
         call('0xto_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    mock_transaction_receipt.assert_called_with("transaction_hash", w3=ANY)
     mock_increase_gas_tx.assert_called_with(123)
+
+
+@patch("web3.eth.Eth.get_transaction_count")
+@patch("web3.Web3.toChecksumAddress", return_value="checksum")
+@patch("web3.eth.Eth.account.sign_transaction")
+@patch("web3.eth.Eth.send_raw_transaction")
+@patch("web3.Web3.toHex", side_effect=["hash_1", "hash_2"])
+@patch("web3.Web3.keccak", return_value='result_of_keccak')
+@patch("web3.eth.Eth.contract")
+def test_send_pipelined_nonces(mock_contract,
+                               mock_keccak,
+                               mock_to_hex,
+                               mock_send,
+                               mock_sign,
+                               mock_checksum,
+                               mocked_get_transaction_count):
+    payments = [
+        Payment("random_account", "ronin:from_ronin", "0xkey", "ronin:to_ronin", 10),
+        Payment("random_account", "ronin:from_ronin", "0xkey", "ronin:to_ronin_2", 20)
+    ]
+    hashes = [p.send(nonce) for p, nonce in zip(payments, [7, 8])]
+    assert hashes == ["hash_1", "hash_2"]
+    assert mock_send.call_count == 2
+    mocked_get_transaction_count.assert_not_called()
+    built = mock_contract.return_value.functions.transfer.return_value.buildTransaction
+    assert [c[0][0]['nonce'] for c in built.call_args_list] == [7, 8]
+
+
+@funded
+@patch("web3.eth.Eth.estimate_gas", return_value=50000)
+@patch("web3.eth.Eth.get_transaction_count", return_value=123)
+@patch("web3.eth.Eth.account.sign_transaction")
+@patch("web3.eth.Eth.send_raw_transaction")
+@patch("web3.Web3.keccak", return_value=b'\x01' * 32)
+@patch("axie_utils.payments.wait_for_receipt")
+def test_execute_uses_gas_estimator(mock_transaction_receipt, _, mock_send, mock_sign, __, mock_estimate):
+    tx_hash = "0x" + "01" * 32
+    mock_transaction_receipt.return_value = {'status': 1, 'transactionHash': tx_hash, 'gasUsed': 40000}
+    estimator = GasEstimator(min_samples=1)
+    p = Payment(
+        "random_account",
+        "ronin:" + "a" * 40,
+        "0x" + "1" * 64,
+        "ronin:" + "b" * 40,
+        10,
+        gas_estimator=estimator)
+    assert p.execute() == tx_hash
+    assert mock_sign.call_args[0][0]['gas'] == 60000
+    assert mock_estimate.call_args[0][0]['data'].startswith("0xa9059cbb")
+    # Learned from the receipt, the next payment does not ask the node
+    assert p.gas_limit() == 48000
+    assert mock_estimate.call_count == 1
+
+
+MANAGER = "ronin:" + "a" * 40
+SCHOLAR = "ronin:" + "b" * 40
+PLANNED = [
+    (MANAGER, "ronin:" + "1" * 40, 10),
+    (MANAGER, "ronin:" + "2" * 40, 20),
+    (SCHOLAR, "ronin:" + "3" * 40, 30),
+    (MANAGER, "ronin:" + "3" * 40, 40),
+    (SCHOLAR, "ronin:" + "4" * 40, 5, 'AXS'),
+    (SCHOLAR, "ronin:" + "1" * 40, 50),
+]
+
+
+def receipt_future(receipt):
+    future = Future()
+    future.set_result(receipt)
+    return future
+
+
+def test_payment_planner_plan():
+    planner = PaymentPlanner(PLANNED, {MANAGER: "0xkey1", SCHOLAR: "0xkey2"})
+    assert planner.plan() == [
+        ("0x" + "a" * 40, 'slp', 'scatter', [0, 1, 3]),
+        ("0x" + "b" * 40, 'slp', 'payment', [2, 5]),
+        ("0x" + "b" * 40, 'axs', 'scatter', [4]),
+    ]
+    assert planner.payments[4] == {"from": "0x" + "b" * 40, "to": "0x" + "4" * 40, "amount": 5, "token": "axs"}
+    assert [step[2] for step in PaymentPlanner(PLANNED, {}, scatter_threshold=4).plan()] == \
+        ['payment', 'payment', 'scatter']
+
+
+@funded
+@patch("axie_utils.payments.watch_receipt", side_effect=lambda _hash, w3: receipt_future(
+    {'status': 1 if _hash == "0xp1" else 0}))
+@patch("axie_utils.payments.get_nonce", return_value=5)
+@patch("axie_utils.payments.Payment.send", side_effect=["0xp1", "0xp2"])
+@patch("axie_utils.payments.Scatter.execute_chunks")
+def test_payment_planner_execute(mocked_chunks, mocked_send, _, __):
+    mocked_chunks.return_value = {0: {
+        "recipients": {Web3.toChecksumAddress("0x" + "1" * 40): 10, Web3.toChecksumAddress("0x" + "2" * 40): 20,
+                       Web3.toChecksumAddress("0x" + "3" * 40): 40},
+        "nonce": 3,
+        "hash": "0xs",
+        "status": "paid",
+        "error": None
+    }}
+    # No key for the scholar's AXS group, it is reported and nothing is sent for it
+    planner = PaymentPlanner(PLANNED[:4] + PLANNED[5:], {MANAGER: "0xkey1", SCHOLAR: "0xkey2"})
+    results = planner.execute()
+    mocked_send.assert_has_calls([call(5, 1), call(6, 1)])
+    assert [(result['via'], result['hash'], result['status']) for result in results] == [
+        ('scatter', '0xs', 'paid'),
+        ('scatter', '0xs', 'paid'),
+        ('payment', '0xp1', 'paid'),
+        ('scatter', '0xs', 'paid'),
+        ('payment', '0xp2', 'failed'),
+    ]
+    assert results[2]['from'] == SCHOLAR
+    assert results[2]['to'] == "ronin:" + "3" * 40
+    mocked_chunks.assert_called_once_with(1, funded=True)
+
+
+@funded
+def test_payment_planner_missing_key():
+    results = PaymentPlanner(PLANNED[4:5], {}).execute()
+    assert results[0]['status'] == 'error'
+    assert results[0]['error'] == 'missing private key'
+
+
+@patch("axie_utils.payments.preflight", return_value=[True, False, True, True, True, True])
+def test_payment_planner_rejects_unfunded(mocked_preflight):
+    planner = PaymentPlanner(PLANNED, {MANAGER: "0xkey1", SCHOLAR: "0xkey2"})
+    with patch.object(planner, 'scatter', return_value={}) as mocked_scatter, \
+            patch.object(planner, 'pay', return_value={}):
+        results = planner.execute()
+    mocked_preflight.assert_called_once_with([
+        (payment['from'], payment['token'], payment['amount']) for payment in planner.payments
+    ], endpoint=planner.w3.provider.endpoint_uri)
+    assert results[1]['status'] == 'rejected'
+    assert results[1]['via'] == 'rejected'
+    # Below the threshold once the rejected payment is left out
+    assert planner.plan([True, False, True, True, True, True])[:2] == [
+        ("0x" + "a" * 40, 'slp', 'rejected', [1]),
+        ("0x" + "a" * 40, 'slp', 'payment', [0, 3]),
+    ]
+    mocked_scatter.assert_called_once_with("0x" + "b" * 40, 'axs', [4], 1)
+
+
+@patch("axie_utils.payments.get_nonce")
+@patch("axie_utils.payments.preflight", return_value=[False])
+def test_execute_skips_unfunded_payment(mocked_preflight, mocked_nonce):
+    p = Payment("random_account", "ronin:" + "a" * 40, "0x" + "1" * 64, "ronin:" + "b" * 40, 10)
+    assert p.execute() is None
+    mocked_preflight.assert_called_with([("0x" + "a" * 40, 'slp', 10)], endpoint=p.w3.provider.endpoint_uri)
+    mocked_nonce.assert_not_called()
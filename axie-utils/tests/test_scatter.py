@@ -1,8 +1,10 @@
-from subprocess import call
+from concurrent.futures import Future
+
 from web3 import Web3
 from mock import patch, call
 
 from axie_utils import Scatter, TrezorScatter
+from axie_utils.scatter import ALLOWANCE_CACHE, MAX_ALLOWANCE, SCATTER_BASE_GAS, SCATTER_RECIPIENT_GAS
 from axie_utils.utils import TOKEN, SCATTER_CONTRACT
 from tests.utils import MockedAllowed, MockedNotAllowed
     
@@ -162,7 +164,7 @@ def test_increase_gas_tx_ron(mocked_nonce, mocked_execute_ron, mocked_checksum,
     mocked_execute_ron.assert_called_with(1.01, 123)
 
 
-@patch("axie_utils.scatter.check_balance", return_value=100000)
+@patch("axie_utils.scatter.preflight", return_value=[True])
 @patch("axie_utils.scatter.Scatter.is_contract_accepted", return_value=True)
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
@@ -171,14 +173,14 @@ def test_increase_gas_tx_ron(mocked_nonce, mocked_execute_ron, mocked_checksum,
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.scatter.wait_for_receipt", return_value={'status': 1})
 def test_execute_token(*args):
     s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1, 'ronin:dce2': 10})
     resp = s.execute()
     assert resp == 'transaction_hash'
 
 
-@patch("axie_utils.scatter.check_balance", return_value=1000)
+@patch("axie_utils.scatter.preflight", return_value=[True])
 @patch("axie_utils.scatter.TrezorScatter.is_contract_accepted", return_value=True)
 @patch("axie_utils.payments.rlp.encode")
 @patch("web3.Web3.toBytes")
@@ -189,14 +191,14 @@ def test_execute_token(*args):
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.scatter.wait_for_receipt", return_value={'status': 1})
 def test_execute_token_trezor(*args):
     s = TrezorScatter('slp', 'ronin:from_acc', 'client', "m/44'/60'/0'/0/0", {'ronin:abc1': 1, 'ronin:dce2': 10})
     resp = s.execute()
     assert resp == 'transaction_hash'
 
 
-@patch("axie_utils.scatter.check_balance", return_value=1000)
+@patch("axie_utils.scatter.preflight", return_value=[True])
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
 @patch("web3.Web3.toChecksumAddress", return_value="checksum")
 @patch("web3.eth.Eth.account.sign_transaction")
@@ -204,14 +206,14 @@ def test_execute_token_trezor(*args):
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.scatter.wait_for_receipt", return_value={'status': 1})
 def test_execute_ron(*args):
     s = Scatter('ron', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1, 'ronin:dce2': 10})
     resp = s.execute()
     assert resp == 'transaction_hash'
 
 
-@patch("axie_utils.scatter.check_balance", return_value=1000)
+@patch("axie_utils.scatter.preflight", return_value=[True])
 @patch("axie_utils.payments.rlp.encode")
 @patch("web3.Web3.toBytes")
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
@@ -221,8 +223,172 @@ def test_execute_ron(*args):
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.scatter.wait_for_receipt", return_value={'status': 1})
 def test_execute_ron_trezor(*args):
     s = TrezorScatter('ron', 'ronin:from_acc', 'client', "m/44'/60'/0'/0/0", {'ronin:abc1': 1, 'ronin:dce2': 10})
     resp = s.execute()
     assert resp == 'transaction_hash'
+
+
+@patch("axie_utils.scatter.Scatter.send_token", return_value="token_hash")
+@patch("axie_utils.scatter.Scatter.send_ron", return_value="ron_hash")
+@patch("web3.eth.Eth.get_transaction_count")
+@patch("web3.eth.Eth.contract")
+@patch("web3.Web3.toChecksumAddress", return_value="checksum")
+def test_send_uses_given_nonce(mocked_checksum, mocked_contract, mocked_get_nonce, mocked_send_ron, mocked_send_token):
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1})
+    assert s.send(7) == "token_hash"
+    mocked_send_token.assert_called_with(7, 1)
+    s = Scatter('ron', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1})
+    assert s.send(8, 1.01) == "ron_hash"
+    mocked_send_ron.assert_called_with(8, 1.01)
+    mocked_get_nonce.assert_not_called()
+
+
+def receipt_future(receipt):
+    future = Future()
+    future.set_result(receipt)
+    return future
+
+
+RECIPIENTS = {f"ronin:{i:040x}": i + 1 for i in range(5)}
+
+
+@patch("web3.eth.Eth.contract")
+def test_scatter_chunks(_):
+    budget = SCATTER_BASE_GAS + 2 * SCATTER_RECIPIENT_GAS
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', RECIPIENTS, gas_budget=budget)
+    assert s.chunk_size == 2
+    assert s.chunks() == [(0, 2), (2, 4), (4, 5)]
+    assert s.recipients((4, 5)) == ([Web3.toChecksumAddress(f"0x{4:040x}")], [5])
+    assert s.gas_limit((4, 5)) == SCATTER_BASE_GAS + SCATTER_RECIPIENT_GAS
+    assert s.gas_limit((0, 2)) == budget
+    assert s.gas_limit() == 1000000
+    assert len(Scatter('slp', 'ronin:from_acc', '0xprivate_key', RECIPIENTS).chunks()) == 1
+
+
+@patch("axie_utils.scatter.watch_receipt")
+@patch("axie_utils.scatter.get_nonce", return_value=7)
+@patch("axie_utils.scatter.preflight", return_value=[True])
+@patch("axie_utils.scatter.Scatter.is_contract_accepted", return_value=True)
+@patch("axie_utils.scatter.Scatter.send", side_effect=["0xa", "0xb", "0xc"])
+@patch("web3.eth.Eth.contract")
+def test_execute_splits_in_chunks(_, mocked_send, mocked_accepted, mocked_balance, __, mocked_watch):
+    mocked_watch.side_effect = [
+        receipt_future({'status': 1}),
+        receipt_future({'status': 0}),
+        receipt_future(None)
+    ]
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', RECIPIENTS,
+                gas_budget=SCATTER_BASE_GAS + 2 * SCATTER_RECIPIENT_GAS)
+    results = s.execute()
+    mocked_send.assert_has_calls([call(7, 1, (0, 2)), call(8, 1, (2, 4)), call(9, 1, (4, 5))])
+    assert [results[i]['status'] for i in range(3)] == ['paid', 'failed', 'timeout']
+    assert [results[i]['nonce'] for i in range(3)] == [7, 8, 9]
+    assert results[1]['hash'] == '0xb'
+    assert list(results[1]['recipients'].values()) == [3, 4]
+    mocked_balance.assert_called_once_with([('0xfrom_acc', 'slp', 15)], endpoint=s.w3.provider.endpoint_uri)
+    mocked_accepted.assert_called_once()
+
+
+@patch("axie_utils.scatter.watch_receipt", return_value=receipt_future({'status': 1}))
+@patch("axie_utils.scatter.get_nonce", return_value=7)
+@patch("axie_utils.scatter.preflight", return_value=[True])
+@patch("axie_utils.scatter.Scatter.send", side_effect=["0xa", ValueError("nonce too low")])
+@patch("web3.eth.Eth.contract")
+def test_execute_chunks_stops_after_send_error(_, mocked_send, __, ___, mocked_watch):
+    s = Scatter('ron', 'ronin:from_acc', '0xprivate_key', RECIPIENTS,
+                gas_budget=SCATTER_BASE_GAS + 2 * SCATTER_RECIPIENT_GAS)
+    # Only the chunks asked for are sent again
+    results = s.execute_chunks(chunks=[0, 1, 2])
+    assert mocked_send.call_count == 2
+    assert [results[i]['status'] for i in range(3)] == ['paid', 'error', 'skipped']
+    assert results[1]['error'] == "nonce too low"
+    assert results[2]['nonce'] is None
+    mocked_watch.assert_called_once_with("0xa", w3=s.w3)
+
+
+@patch("axie_utils.scatter.Scatter.send")
+@patch("axie_utils.scatter.preflight", return_value=[False])
+@patch("web3.eth.Eth.contract")
+def test_execute_chunks_without_funds(_, __, mocked_send):
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', RECIPIENTS,
+                gas_budget=SCATTER_BASE_GAS + 2 * SCATTER_RECIPIENT_GAS)
+    results = s.execute_chunks(chunks=[2])
+    assert results == {2: {
+        "recipients": {Web3.toChecksumAddress(f"0x{4:040x}"): 5},
+        "nonce": None,
+        "hash": None,
+        "status": "skipped",
+        "error": None
+    }}
+    mocked_send.assert_not_called()
+
+
+@patch("axie_utils.scatter.rlp.encode", return_value=b'raw')
+@patch("axie_utils.scatter.ethereum.sign_tx", return_value=(b'a', b'b', b'c'))
+@patch("web3.eth.Eth.send_raw_transaction")
+@patch("web3.eth.Eth.contract")
+def test_send_chunk_trezor(mocked_contract, _, mocked_sign, __):
+    mocked_contract.return_value.functions.disperseTokenSimple.return_value.buildTransaction.return_value = {
+        'data': '0x00'
+    }
+    s = TrezorScatter('slp', 'ronin:from_acc', 'client', "m/44'/60'/0'/0/0", RECIPIENTS,
+                      gas_budget=SCATTER_BASE_GAS + 2 * SCATTER_RECIPIENT_GAS)
+    s.send(3, 1, (4, 5))
+    mocked_contract.return_value.functions.disperseTokenSimple.assert_called_with(
+        Web3.toChecksumAddress(TOKEN['slp']), [Web3.toChecksumAddress(f"0x{4:040x}")], [5])
+    assert mocked_sign.call_args[1]['gas_limit'] == SCATTER_BASE_GAS + SCATTER_RECIPIENT_GAS
+    assert mocked_sign.call_args[1]['nonce'] == 3
+
+
+@patch("web3.eth.Eth.contract")
+@patch("web3.Web3.toChecksumAddress", return_value='checksum')
+def test_allowance_cache(_, mocked_contract):
+    allowance = mocked_contract.return_value.functions.allowance.return_value.call
+    allowance.return_value = 25
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1, 'ronin:dce2': 10})
+    assert s.is_contract_accepted() is True
+    assert s.is_contract_accepted() is True
+    assert allowance.call_count == 1
+    assert ALLOWANCE_CACHE.get('ronin:from_acc', TOKEN['slp'].upper(), SCATTER_CONTRACT) == 25
+    # Two scatters of 11 leave 3, which no longer covers the next one
+    ALLOWANCE_CACHE.spend('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT, 11)
+    assert s.is_contract_accepted() is True
+    assert allowance.call_count == 1
+    ALLOWANCE_CACHE.spend('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT, 11)
+    assert s.is_contract_accepted() is True
+    assert allowance.call_count == 2
+    ALLOWANCE_CACHE.invalidate('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT)
+    assert ALLOWANCE_CACHE.get('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT) is None
+
+
+@patch("web3.eth.Eth.get_transaction_count", return_value=123)
+@patch("web3.Web3.toChecksumAddress", return_value='checksum')
+@patch("web3.eth.Eth.account.sign_transaction")
+@patch("web3.eth.Eth.send_raw_transaction")
+@patch("web3.Web3.keccak", return_value=b'\x01' * 32)
+@patch("web3.eth.Eth.contract")
+@patch("web3.eth.Eth.wait_for_transaction_receipt", return_value={'status': 1})
+def test_approve_and_send_update_allowance_cache(*args):
+    s = Scatter('slp', 'ronin:from_acc', '0xprivate_key', {'ronin:abc1': 1, 'ronin:dce2': 10})
+    s.send_token(1)
+    assert ALLOWANCE_CACHE.get('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT) is None
+    assert s.approve_contract() is True
+    assert ALLOWANCE_CACHE.get('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT) == MAX_ALLOWANCE
+    s.send_token(2)
+    assert ALLOWANCE_CACHE.get('0xfrom_acc', TOKEN['slp'], SCATTER_CONTRACT) == MAX_ALLOWANCE - 11
+
+
+@patch("axie_utils.scatter.get_nonce")
+@patch("axie_utils.scatter.TrezorScatter.is_contract_accepted")
+@patch("axie_utils.scatter.preflight", return_value=[False])
+@patch("web3.eth.Eth.contract")
+@patch("web3.Web3.toChecksumAddress", return_value='checksum')
+def test_execute_token_without_funds_trezor(_, __, mocked_preflight, mocked_accepted, mocked_nonce):
+    s = TrezorScatter('slp', 'ronin:from_acc', 'client', "m/44'/60'/0'/0/0", {'ronin:abc1': 1, 'ronin:dce2': 10})
+    assert s.execute() is None
+    mocked_preflight.assert_called_once_with([('0xfrom_acc', 'slp', 11)], endpoint=s.w3.provider.endpoint_uri)
+    # Nothing is approved or sent
+    mocked_accepted.assert_not_called()
+    mocked_nonce.assert_not_called()
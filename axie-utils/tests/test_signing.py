@@ -0,0 +1,120 @@
+from eth_account import Account
+from mock import Mock, call, patch
+from trezorlib.exceptions import Cancelled
+from trezorlib.tools import parse_path
+from web3 import Web3
+
+from axie_utils.payments import TrezorPayment
+from axie_utils.signing import SigningPool, TrezorSigningSession
+from axie_utils.transfers import TrezorTransfer
+
+KEY = "0x" + "1" * 64
+OTHER_KEY = "0x" + "2" * 64
+OWNER = Account.from_key(KEY).address
+OTHER = Account.from_key(OTHER_KEY).address
+
+
+def unsigned(nonce):
+    return {
+        "chainId": 2020,
+        "gas": 21000,
+        "gasPrice": 1000000000,
+        "nonce": nonce,
+        "to": OTHER,
+        "value": 1,
+        "data": b""
+    }
+
+
+def test_sign_in_process_matches_eth_account():
+    pool = SigningPool({OWNER: KEY, "ronin:" + OTHER[2:]: OTHER_KEY}, max_workers=1)
+    results = pool.sign([(OWNER, unsigned(1)), ("ronin:" + OTHER[2:].lower(), unsigned(2))])
+    expected = [Account.sign_transaction(unsigned(1), KEY), Account.sign_transaction(unsigned(2), OTHER_KEY)]
+    assert [result['raw'] for result in results] == [bytes(signed.rawTransaction) for signed in expected]
+    assert [result['hash'] for result in results] == [signed.hash.hex() for signed in expected]
+    assert [result['error'] for result in results] == [None, None]
+    assert pool._executor is None
+
+
+def test_sign_in_worker_processes_keeps_order():
+    pool = SigningPool({OWNER: KEY, OTHER: OTHER_KEY}, max_workers=2, chunk_size=2)
+    jobs = [(OWNER if nonce % 2 else OTHER, unsigned(nonce)) for nonce in range(9)]
+    try:
+        results = pool.sign(jobs)
+    finally:
+        pool.close()
+    assert [Account.recover_transaction(result['raw']) for result in results] == [
+        OWNER if nonce % 2 else OTHER for nonce in range(9)]
+    assert results[4]['hash'] == Account.sign_transaction(unsigned(4), OTHER_KEY).hash.hex()
+    assert pool._executor is None
+
+
+def test_sign_errors_do_not_leak_keys(caplog):
+    pool = SigningPool({OWNER: KEY}, max_workers=2, chunk_size=1)
+    broken = unsigned(3)
+    broken['gas'] = KEY[2:]
+    try:
+        results = pool.sign([(OWNER, unsigned(1)), (OWNER, broken), ("0x" + "c" * 40, unsigned(4))])
+    finally:
+        pool.close()
+    assert results[0]['error'] is None
+    assert results[1]['raw'] is None and results[1]['hash'] is None
+    assert KEY[2:] not in results[1]['error']
+    assert results[2]['error'] == "missing private key"
+    assert KEY[2:] not in caplog.text
+
+
+def trezor_signature(*args, **kwargs):
+    return (2075, b'\x00' + b'r' * 31, b's' * 32)
+
+
+@patch("axie_utils.signing.ethereum.sign_tx", side_effect=trezor_signature)
+@patch("web3.eth.Eth.send_raw_transaction")
+def test_trezor_session_signs_and_broadcasts_in_order(mock_send, mock_sign_tx):
+    mock_send.side_effect = [None, ValueError("nonce too low"), None]
+    client = Mock()
+    transfers = [
+        TrezorTransfer("ronin:" + "a" * 40, client, "m/44'/60'/0'/0/0", "ronin:" + "b" * 40, axie_id)
+        for axie_id in (1, 2, 3)
+    ]
+    session = TrezorSigningSession(client)
+    results = session.sign([(t.bip_path, t.build(10 + i)) for i, t in enumerate(transfers)])
+    client.open.assert_called_once()
+    client.close.assert_called_once()
+    assert mock_sign_tx.call_count == 3
+    assert [c[1]['nonce'] for c in mock_sign_tx.call_args_list] == [10, 11, 12]
+    assert mock_sign_tx.call_args_list[0][1]['n'] == parse_path("m/44'/60'/0'/0/0")
+    assert mock_send.call_args_list == [call(result['raw']) for result in results]
+    assert [result['error'] for result in results] == [None, "nonce too low", None]
+    assert results[0]['hash'] == Web3.toHex(Web3.keccak(results[0]['raw']))
+
+
+@patch("axie_utils.signing.ethereum.sign_tx", side_effect=trezor_signature)
+@patch("web3.eth.Eth.send_raw_transaction")
+def test_trezor_session_encodes_like_trezor_transfer(mock_send, mock_sign_tx):
+    client = Mock()
+    t = TrezorTransfer("ronin:" + "a" * 40, client, "m/44'/60'/0'/0/0", "ronin:" + "b" * 40, 123)
+    raw_transaction = TrezorSigningSession(client).sign_tx("m/44'/60'/0'/0/0", t.build(7))
+    t.send(7)
+    mock_send.assert_called_once_with(raw_transaction)
+    session_call, transfer_call = mock_sign_tx.call_args_list
+    assert session_call[1]['data'] == transfer_call[1]['data']
+    assert session_call[1]['to'].lower() == transfer_call[1]['to']
+
+
+@patch("axie_utils.signing.ethereum.sign_tx", side_effect=[trezor_signature(), Cancelled(), trezor_signature()])
+@patch("web3.eth.Eth.send_raw_transaction")
+def test_trezor_session_stops_when_device_refuses(mock_send, mock_sign_tx):
+    client = Mock()
+    payments = [
+        TrezorPayment("test", client, "m/44'/60'/0'/0/0", "ronin:" + "a" * 40, "ronin:" + "b" * 40, amount)
+        for amount in (1, 2, 3)
+    ]
+    results = TrezorSigningSession(client).sign(
+        [(p.bip_path, p.build(i)) for i, p in enumerate(payments)], broadcast=False)
+    mock_send.assert_not_called()
+    assert mock_sign_tx.call_count == 2
+    assert results[0]['raw'] is not None and results[0]['error'] is None
+    assert results[1]['raw'] is None and results[1]['error'] is not None
+    assert results[2]['raw'] is None and results[2]['error'].startswith("not signed")
+    client.close.assert_called_once()
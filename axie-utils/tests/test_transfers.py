@@ -1,46 +1,52 @@
-from mock import patch, call
+from concurrent.futures import Future
+
+import requests_mock
+from eth_account import Account
+from mock import patch, call, ANY
+from web3 import Web3
 
 from axie_utils.abis import AXIE_ABI
-from axie_utils.transfers import Transfer, TrezorTransfer
-from axie_utils.utils import AXIE_CONTRACT
+from axie_utils.signing import SigningPool
+from axie_utils.transfers import BulkTransfer, Transfer, TrezorTransfer
+from axie_utils.utils import AXIE_CONTRACT, RONIN_PROVIDER
+from tests.utils import axie_node
+
+KEY = "0x" + "1" * 64
+OWNER = Account.from_key(KEY).address
 
 
 @patch("web3.eth.Eth.get_transaction_count", return_value=123)
-@patch("web3.Web3.toChecksumAddress", return_value="checksum")
-@patch("web3.eth.Eth.account.sign_transaction")
 @patch("web3.eth.Eth.send_raw_transaction")
-@patch("web3.Web3.toHex", return_value="transaction_hash")
-@patch("web3.Web3.keccak", return_value='result_of_keccak')
-@patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.transfers.wait_for_receipt", return_value={'status': 1})
 def test_execute_transfer(mock_transaction_receipt,
-                          mock_contract,
-                          mock_keccak,
-                          mock_to_hex,
                           mock_send,
-                          mock_sign,
-                          mock_checksum,
                           mocked_get_transaction_count):
+    receiver = "0x" + "b" * 40
     t = Transfer(
-        "ronin:from_ronin",
-        "0xsecret",
-        "ronin:to_ronin",
+        "ronin:" + OWNER[2:],
+        KEY,
+        "ronin:" + receiver[2:],
         123
     )
-    t.execute()
-    mock_contract.assert_called_with(address='checksum', abi=AXIE_ABI)
-    mock_keccak.assert_called_once()
-    mock_to_hex.assert_called_with("result_of_keccak")
-    mock_send.assert_called_once()
-    mock_sign.assert_called_once()
-    assert mock_sign.call_args[1]['private_key'] == "0xsecret"
-    mock_checksum.assert_has_calls(calls=[
-        call(AXIE_CONTRACT),
-        call('0xfrom_ronin'),
-        call('0xfrom_ronin'),
-        call('0xto_ronin'),
-        call('0xfrom_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    with patch("web3.eth.Eth.contract") as mock_contract:
+        t.execute()
+    # The calldata is encoded without going through the contract, the signed tx is still the web3 one
+    mock_contract.assert_not_called()
+    axie_contract = Web3().eth.contract(address=Web3.toChecksumAddress(AXIE_CONTRACT), abi=AXIE_ABI)
+    expected = Account.sign_transaction(axie_contract.functions.safeTransferFrom(
+        OWNER,
+        Web3.toChecksumAddress(receiver),
+        123
+    ).buildTransaction({
+        "chainId": 2020,
+        "gas": 492874,
+        "from": OWNER,
+        "gasPrice": Web3.toWei("1", "gwei"),
+        "value": 0,
+        "nonce": 123
+    }), KEY)
+    mock_send.assert_called_once_with(expected.rawTransaction)
+    mock_transaction_receipt.assert_called_with(expected.hash.hex(), w3=ANY)
     mocked_get_transaction_count.assert_called()
 
 
@@ -53,7 +59,7 @@ def test_execute_transfer(mock_transaction_receipt,
 @patch("web3.Web3.toHex", return_value="transaction_hash")
 @patch("web3.Web3.keccak", return_value='result_of_keccak')
 @patch("web3.eth.Eth.contract")
-@patch("web3.eth.Eth.get_transaction_receipt", return_value={'status': 1})
+@patch("axie_utils.transfers.wait_for_receipt", return_value={'status': 1})
 def test_execute_transfer_trezor(mock_transaction_receipt,
                                  mock_contract,
                                  mock_keccak,
@@ -80,10 +86,74 @@ def test_execute_transfer_trezor(mock_transaction_receipt,
     mocked_to_bytes.assert_called()
     mocked_rlp.assert_called()
     mock_checksum.assert_has_calls(calls=[
-        call(AXIE_CONTRACT),
         call('0xfrom_ronin'),
+        call(AXIE_CONTRACT),
         call('0xfrom_ronin'),
         call('0xto_ronin'),
         call('0xfrom_ronin')])
-    mock_transaction_receipt.assert_called_with("transaction_hash")
+    mock_transaction_receipt.assert_called_with("transaction_hash", w3=ANY)
     mocked_get_transaction_count.assert_called()
+
+
+def receipt_future(receipt):
+    future = Future()
+    future.set_result(receipt)
+    return future
+
+
+@patch("axie_utils.transfers.watch_receipt")
+@patch("axie_utils.transfers.get_nonce", return_value=40)
+def test_bulk_transfer(mocked_nonce, mocked_watch):
+    mocked_watch.side_effect = [receipt_future({'status': 1}), receipt_future({'status': 0})]
+    node = axie_node({1: OWNER, 2: OWNER, 3: "0x" + "f" * 40, 4: OWNER}, rejected={1})
+    receiver = "ronin:" + "b" * 40
+    bulk = BulkTransfer("ronin:" + OWNER[2:], KEY, [(1, receiver), (2, receiver), (3, receiver), (4, receiver)])
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=node)
+        results = bulk.execute()
+    # One batch for ownership and one burst for the txs
+    assert req_mocker.call_count == 2
+    assert len(node.sent) == 3
+    assert [Account.recover_transaction(raw) for raw in node.sent] == [OWNER] * 3
+    assert {axie_id: result['status'] for axie_id, result in results.items()} == {
+        1: 'transferred', 2: 'error', 3: 'not_owned', 4: 'failed'}
+    assert [results[axie_id]['nonce'] for axie_id in (1, 2, 3, 4)] == [40, 41, None, 42]
+    assert results[1]['hash'] == Web3.toHex(Web3.keccak(hexstr=node.sent[0]))
+    assert results[2]['error'] == "nonce too low"
+    assert results[1]['to'] == receiver
+    mocked_watch.assert_has_calls([call(results[1]['hash'], w3=bulk.w3), call(results[4]['hash'], w3=bulk.w3)])
+
+
+@patch("axie_utils.transfers.watch_receipt", return_value=receipt_future({'status': 1}))
+@patch("axie_utils.transfers.get_nonce", return_value=43)
+def test_bulk_transfer_resubmits_given_axies(mocked_nonce, _):
+    node = axie_node({1: OWNER, 2: OWNER})
+    bulk = BulkTransfer(OWNER, KEY, [(1, "ronin:" + "b" * 40), (2, "ronin:" + "c" * 40)])
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=node)
+        results = bulk.execute(axies=[2])
+    assert list(results) == [2]
+    assert results[2]['status'] == 'transferred'
+    assert results[2]['nonce'] == 43
+    assert len(node.sent) == 1
+
+
+@patch("axie_utils.transfers.watch_receipt", return_value=receipt_future({'status': 1}))
+@patch("axie_utils.transfers.get_nonce", return_value=50)
+def test_bulk_transfer_with_signing_pool(mocked_nonce, _):
+    node = axie_node({1: OWNER, 2: OWNER, 3: OWNER})
+    receiver = "ronin:" + "b" * 40
+    pool = SigningPool({OWNER: KEY}, max_workers=2, chunk_size=1)
+    bulk = BulkTransfer(OWNER, KEY, [(1, receiver), (2, receiver), (3, receiver)], signer=pool)
+    try:
+        with requests_mock.Mocker() as req_mocker:
+            req_mocker.post(RONIN_PROVIDER, json=node)
+            results = bulk.execute()
+    finally:
+        pool.close()
+    assert [Account.recover_transaction(raw) for raw in node.sent] == [OWNER] * 3
+    assert [results[axie_id]['nonce'] for axie_id in (1, 2, 3)] == [50, 51, 52]
+    assert [results[axie_id]['hash'] for axie_id in (1, 2, 3)] == [
+        Web3.toHex(Web3.keccak(hexstr=raw)) for raw in node.sent]
+    assert node.sent[1] == Web3.toHex(bulk.transfers[2].sign(51))
+    assert all(result['status'] == 'transferred' for result in results.values())
@@ -1,17 +1,38 @@
+import asyncio
+import os
+import threading
 from datetime import datetime
 from tabnanny import check
 from unittest import mock
 
+import pytest
 from mock import patch, call
 import requests_mock
+from eth_account import Account
+from eth_account.hdaccount import seed_from_mnemonic
+from eth_account.hdaccount.deterministic import HDPath, derive_child_key, hmac_sha512
+from eth_keys.datatypes import PrivateKey
+from hexbytes import HexBytes
+from trezorlib import messages
+from web3 import Web3
 
-from axie_utils import TrezorConfig, get_lastclaim, check_balance
+from axie_utils import GasEstimator, NonceManager, TrezorConfig, get_lastclaim, check_balance, check_balances, get_nonce, get_web3
 from axie_utils.utils import (
+    derive_addresses,
+    preflight,
+    get_session,
+    reset_providers,
+    ReceiptWatcher,
+    StageLimiter,
+    POOL_SIZE,
+    RONIN_PROVIDER,
+    RONIN_PROVIDER_FREE,
     AXIE_CONTRACT,
     AXS_CONTRACT,
     SLP_CONTRACT,
     WETH_CONTRACT,
-    USDC_CONTRACT
+    USDC_CONTRACT,
+    BIP_ACCOUNT_PATH
 )
 
 
@@ -36,6 +57,76 @@ def test_trezor_list_paths(mock_get_client, mocked_get_address, mocked_parse_pat
     assert resp == {"ronin:bar": {"passphrase": "foo", "bip_path": "m/44'/60'/0'/0/0"}}
 
 
+MNEMONIC = "test test test test test test test test test test test junk"
+
+
+def account_node():
+    # Public node at m/44'/60'/0'/0 of MNEMONIC, as the device would return it
+    master = hmac_sha512(b"Bitcoin seed", seed_from_mnemonic(MNEMONIC, ""))
+    key, chain_code = master[:32], master[32:]
+    for node in HDPath(BIP_ACCOUNT_PATH)._path:
+        key, chain_code = derive_child_key(key, chain_code, node)
+    return messages.HDNodeType(
+        depth=4,
+        fingerprint=0,
+        child_num=0,
+        chain_code=chain_code,
+        public_key=PrivateKey(key).public_key.to_compressed_bytes()
+    )
+
+
+def mnemonic_addresses(count):
+    Account.enable_unaudited_hdwallet_features()
+    return [
+        Account.from_mnemonic(MNEMONIC, account_path=f"{BIP_ACCOUNT_PATH}/{i}").address.lower() for i in range(count)
+    ]
+
+
+def test_derive_addresses():
+    assert derive_addresses(account_node(), 5) == mnemonic_addresses(5)
+
+
+@patch('axie_utils.utils.ethereum.get_address')
+@patch('axie_utils.utils.ethereum.get_public_node')
+@patch('axie_utils.utils.get_default_client')
+def test_trezor_list_paths_fast(mock_get_client, mock_get_public_node, mock_get_address, tmp_path):
+    addresses = mnemonic_addresses(3)
+    mock_get_client.return_value.features.device_id = "device"
+    mock_get_public_node.return_value = messages.EthereumPublicKey(node=account_node(), xpub="xpub")
+    mock_get_address.return_value = Web3.toChecksumAddress(addresses[0])
+    cache_path = str(tmp_path / "bip_paths.json")
+    resp = TrezorConfig(3, 'foo').list_bip_paths(fast=True, cache_path=cache_path)
+    assert resp == {
+        address.replace('0x', 'ronin:'): {"passphrase": "foo", "bip_path": f"m/44'/60'/0'/0/{i}"}
+        for i, address in enumerate(addresses)
+    }
+    mock_get_client.assert_called_once()
+    mock_get_public_node.assert_called_once_with(mock_get_client.return_value, [2147483692, 2147483708, 2147483648, 0])
+    # Only the first address is checked against the device, without asking for a confirmation
+    mock_get_address.assert_called_once_with(mock_get_client.return_value, [2147483692, 2147483708, 2147483648, 0, 0])
+    with open(cache_path) as f:
+        assert "foo" not in f.read()
+    # Fewer accounts are answered from the cache, more accounts or another passphrase derive again
+    assert list(TrezorConfig(2, 'foo').list_bip_paths(fast=True, cache_path=cache_path)) == [
+        address.replace('0x', 'ronin:') for address in addresses[:2]]
+    assert mock_get_public_node.call_count == 1
+    TrezorConfig(4, 'foo').list_bip_paths(fast=True, cache_path=cache_path)
+    TrezorConfig(2, 'bar').list_bip_paths(fast=True, cache_path=cache_path)
+    assert mock_get_public_node.call_count == 3
+
+
+@patch('axie_utils.utils.ethereum.get_address', return_value="0x" + "b" * 40)
+@patch('axie_utils.utils.ethereum.get_public_node')
+@patch('axie_utils.utils.get_default_client')
+def test_trezor_list_paths_fast_wrong_wallet(mock_get_client, mock_get_public_node, _, tmp_path):
+    mock_get_client.return_value.features.device_id = "device"
+    mock_get_public_node.return_value = messages.EthereumPublicKey(node=account_node(), xpub="xpub")
+    cache_path = str(tmp_path / "bip_paths.json")
+    with pytest.raises(ValueError):
+        TrezorConfig(2).list_bip_paths(fast=True, cache_path=cache_path)
+    assert not os.path.exists(cache_path)
+
+
 def test_get_lastclaim():
     account = 'ronin:abc'
     url = f'https://game-api.skymavis.com/game-api/clients/{account.replace("ronin:", "0x")}/items/1'
@@ -135,3 +226,296 @@ def test_check_balance_ron(mocked_checksum, mocked_balance):
 def test_check_balance_invalid():
     balance = check_balance('account', 'foo')
     assert balance == 0
+
+
+def test_get_web3_is_shared_per_endpoint():
+    w3 = get_web3()
+    assert get_web3(RONIN_PROVIDER) is w3
+    assert get_web3(RONIN_PROVIDER_FREE) is not w3
+    assert w3.provider.endpoint_uri == RONIN_PROVIDER
+
+
+def test_get_session_pool_size():
+    session = get_session(RONIN_PROVIDER)
+    adapter = session.get_adapter(RONIN_PROVIDER)
+    assert adapter._pool_maxsize == POOL_SIZE
+    assert adapter.max_retries.total == 5
+    assert get_session(RONIN_PROVIDER) is session
+
+
+def test_reset_providers():
+    w3 = get_web3()
+    reset_providers()
+    assert get_web3() is not w3
+
+
+def test_check_balance_injected_w3():
+    w3 = mock.MagicMock()
+    w3.eth.get_balance.return_value = 2000000000000000000
+    balance = check_balance('ronin:' + 'a' * 40, 'ron', w3=w3)
+    assert balance == 2
+    w3.eth.get_balance.assert_called_once()
+
+
+def test_get_nonce_injected_w3():
+    w3 = mock.MagicMock()
+    w3.eth.get_transaction_count.return_value = 7
+    assert get_nonce('ronin:' + 'a' * 40, w3=w3) == 7
+
+
+def _balances_callback(request, context):
+    responses = []
+    for call_ in request.json():
+        if call_['method'] == 'eth_getBalance':
+            result = hex(3 * 10**18)
+        elif call_['params'][0]['to'] == WETH_CONTRACT:
+            result = hex(5 * 10**17)
+        elif call_['params'][0]['to'] == AXS_CONTRACT:
+            responses.append({"jsonrpc": "2.0", "id": call_['id'], "error": {"message": "execution reverted"}})
+            continue
+        else:
+            result = hex(42)
+        responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": result})
+    return responses
+
+
+def test_check_balances():
+    accounts = ['ronin:' + 'a' * 40, 'ronin:' + 'b' * 40]
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_balances_callback)
+        table = check_balances(accounts, ['slp', 'weth', 'ron', 'axs', 'foo'], batch_size=3)
+    # 8 real calls, sent in batches of 3
+    assert req_mocker.call_count == 3
+    assert table == [
+        [42, 0.5, 3.0, None, 0],
+        [42, 0.5, 3.0, None, 0]
+    ]
+    first_call = req_mocker.request_history[0].json()[0]
+    assert first_call['method'] == 'eth_call'
+    assert first_call['params'][0] == {"to": SLP_CONTRACT, "data": '0x70a08231' + '0' * 24 + 'a' * 40}
+
+
+def test_check_balances_empty():
+    assert check_balances([], ['slp']) == []
+
+
+def test_preflight():
+    alice, bob = 'ronin:' + 'a' * 40, '0x' + 'b' * 40
+    txs = [
+        (alice, 'slp', 30),
+        (alice, 'SLP', 20),
+        (alice, 'ron', 2 * 10**18),
+        (alice, 'ron', 10**18),
+        (bob, 'weth', 6 * 10**17),
+        (bob, 'axs', 10),
+    ]
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_balances_callback)
+        accepted = preflight(txs)
+    # One batch for every sender and token, RON included for the fees
+    assert req_mocker.call_count == 1
+    assert len(req_mocker.request_history[0].json()) == 8
+    # 42 SLP cover the first payment only, the fees leave less than 1 RON after spending 2.
+    # The AXS balance could not be read, so it is let through
+    assert accepted == [True, False, True, False, False, True]
+
+
+@patch("axie_utils.utils.get_nonce", side_effect=[10, 20, 11])
+def test_nonce_manager(mocked_get_nonce):
+    nm = NonceManager()
+    assert [nm.get_nonce('ronin:abc') for _ in range(3)] == [10, 11, 12]
+    assert nm.get_nonce('0xABC') == 13
+    assert nm.get_nonce('ronin:def') == 20
+    mocked_get_nonce.assert_has_calls(calls=[
+        call('ronin:abc', w3=None, block_identifier='pending'),
+        call('ronin:def', w3=None, block_identifier='pending')
+    ])
+    # Last nonce handed out is rolled back, older ones are reused first
+    nm.release('ronin:abc', 13)
+    nm.release('ronin:abc', 11)
+    assert nm.get_nonce('ronin:abc') == 11
+    assert nm.get_nonce('ronin:abc') == 13
+    assert nm.reconcile('ronin:abc') == 11
+    assert nm.get_nonce('ronin:abc') == 11
+
+
+@patch("axie_utils.utils.get_nonce", return_value=5)
+def test_nonce_manager_release_collapses(_):
+    nm = NonceManager()
+    assert [nm.get_nonce('ronin:abc') for _ in range(3)] == [5, 6, 7]
+    nm.release('ronin:abc', 6)
+    nm.release('ronin:abc', 7)
+    assert nm.get_nonce('ronin:abc') == 6
+    nm.release('ronin:abc', 99)
+    nm.reset()
+    assert nm.get_nonce('ronin:abc') == 5
+
+
+def test_check_balances_batch_rejected():
+    accounts = ['ronin:' + 'a' * 40]
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json={"jsonrpc": "2.0", "id": None, "error": {"message": "rate limited"}})
+        table = check_balances(accounts, ['slp', 'ron'])
+    assert table == [[None, None]]
+
+
+def test_nonce_manager_fetches_outside_lock():
+    nm = NonceManager()
+
+    def fetch(*args, **kwargs):
+        assert not nm._lock.locked()
+        return 3
+
+    with patch("axie_utils.utils.get_nonce", side_effect=fetch):
+        assert nm.get_nonce('ronin:abc') == 3
+        assert nm.get_nonce('ronin:abc') == 4
+
+
+def _receipts_callback(receipts):
+    def callback(request, context):
+        responses = []
+        for call_ in request.json():
+            tx_hash = call_['params'][0]
+            receipt = receipts.get(tx_hash)
+            if isinstance(receipt, dict) and 'message' in receipt:
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "error": receipt})
+            elif receipt is not None:
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": receipt})
+        return responses
+    return callback
+
+
+def test_receipt_watcher_batches_hashes():
+    receipts = {'0x1': {'status': '0x1', 'gasUsed': '0x5208'}, '0x2': {'status': '0x0'}}
+    watcher = ReceiptWatcher(poll_interval=60, timeout=60)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback(receipts))
+        with patch.object(threading.Thread, 'start'):
+            first = watcher.watch('0x1')
+            assert watcher.watch('0x1') is first
+            second = watcher.watch('0x2')
+        assert watcher.poll() == 0
+    assert req_mocker.call_count == 1
+    batch = req_mocker.request_history[0].json()
+    assert [(c['method'], c['params']) for c in batch] == [
+        ('eth_getTransactionReceipt', ['0x1']),
+        ('eth_getTransactionReceipt', ['0x2'])
+    ]
+    assert first.result() == {'status': 1, 'gasUsed': 21000}
+    assert second.result() == {'status': 0}
+
+
+def test_receipt_watcher_keeps_polling_not_found():
+    receipts = {'0x1': {'message': 'receipts not found by 0x1'}}
+    watcher = ReceiptWatcher(poll_interval=0.01, timeout=5)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback(receipts))
+        watcher.watch('0x1')
+        # Missing entries and rejected batches are polled again, not failed
+        watcher.watch('0x2')
+        assert watcher.poll() == 2
+        req_mocker.post(RONIN_PROVIDER, json={"jsonrpc": "2.0", "id": None, "error": {"message": "rate limited"}})
+        assert watcher.poll() == 2
+        receipts['0x1'] = receipts['0x2'] = {'status': '0x1'}
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback(receipts))
+        assert watcher.wait('0x1') == {'status': 1}
+        assert watcher.wait('0x2') == {'status': 1}
+
+
+def test_receipt_watcher_node_error():
+    receipts = {'0x1': {'message': 'execution reverted'}}
+    watcher = ReceiptWatcher(poll_interval=0.01, timeout=5)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback(receipts))
+        with pytest.raises(ValueError):
+            watcher.wait('0x1')
+
+
+def test_receipt_watcher_timeout():
+    watcher = ReceiptWatcher(poll_interval=0.01, timeout=0.05)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback({}))
+        assert watcher.wait('0x1') is None
+    assert watcher._pending == {}
+
+
+def test_receipt_watcher_second_timeout_extends_deadline():
+    watcher = ReceiptWatcher(poll_interval=60, timeout=1)
+    with patch.object(threading.Thread, 'start'):
+        watcher.watch('0x1')
+        watcher.watch('0x1', timeout=100)
+    assert watcher._pending['0x1'][1] > datetime.now().timestamp() + 50
+
+
+def test_receipt_watcher_stop_resolves_none():
+    watcher = ReceiptWatcher(poll_interval=60, timeout=60)
+    with requests_mock.Mocker() as req_mocker:
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback({}))
+        future = watcher.watch('0x1')
+        watcher.stop()
+        assert future.result(timeout=1) is None
+        # A stopped watcher starts a new poller for new work
+        receipts = {'0x2': {'status': '0x1'}}
+        req_mocker.post(RONIN_PROVIDER, json=_receipts_callback(receipts))
+        watcher.poll_interval = 0.01
+        assert watcher.watch('0x2').result(timeout=5) == {'status': 1}
+
+
+@pytest.mark.asyncio
+async def test_stage_limiter():
+    limiter = StageLimiter(concurrency=2, rate=100)
+    running = []
+    peak = []
+    starts = []
+
+    async def work():
+        async with limiter:
+            starts.append(asyncio.get_running_loop().time())
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    await asyncio.gather(*[work() for _ in range(6)])
+    assert max(peak) == 2
+    # Six entries at 100 per second span at least five intervals
+    assert starts[-1] - starts[0] >= 0.045
+
+
+GAS_CALL = {"from": "0xfrom", "to": SLP_CONTRACT, "data": "0xa9059cbb" + "00" * 64, "value": 0}
+
+
+@patch("web3.eth.Eth.estimate_gas", return_value=50000)
+def test_gas_estimator_asks_node_with_margin(mocked_estimate):
+    estimator = GasEstimator(margin=1.5)
+    assert estimator.estimate(GAS_CALL, 246437) == 75000
+    mocked_estimate.assert_called_with(GAS_CALL)
+    # Without rpc nothing was learned yet, so the default is used
+    assert estimator.estimate(GAS_CALL, 246437, rpc=False) == 246437
+    assert mocked_estimate.call_count == 1
+
+
+@patch("web3.eth.Eth.estimate_gas", side_effect=ValueError("execution reverted"))
+def test_gas_estimator_falls_back_to_default(_):
+    assert GasEstimator().estimate(GAS_CALL, 246437) == 246437
+
+
+@patch("web3.eth.Eth.estimate_gas", return_value=50000)
+def test_gas_estimator_learns_from_receipts(mocked_estimate):
+    estimator = GasEstimator(margin=1.5, min_samples=2)
+    for i, used in enumerate([30000, 40000, 35000]):
+        estimator.track(f"0x0{i}", GAS_CALL)
+        estimator.observe({"transactionHash": HexBytes(f"0x0{i}"), "status": 1, "gasUsed": used})
+    # Failed receipts and untracked hashes are not learned from
+    estimator.track("0x3", GAS_CALL)
+    estimator.observe({"transactionHash": "0x3", "status": 0, "gasUsed": 90000})
+    estimator.observe({"transactionHash": "0x9", "status": 1, "gasUsed": 90000})
+    estimator.observe(None)
+    assert estimator.estimate(GAS_CALL, 246437) == 60000
+    assert estimator.estimate(GAS_CALL, 246437, rpc=False) == 60000
+    mocked_estimate.assert_not_called()
+    # Same method with more calldata is another group
+    bigger = dict(GAS_CALL, data=GAS_CALL['data'] + "00" * 32)
+    assert estimator.estimate(bigger, 246437) == 75000
+    estimator.clear()
+    assert estimator.learned(GAS_CALL) is None
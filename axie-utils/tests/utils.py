@@ -1,4 +1,5 @@
 from hexbytes import HexBytes
+from web3 import Web3
 
 
 class MockedSignedMsg:
@@ -51,4 +52,68 @@ class MockedOwner:
 
     class functions:
         def ownerOf(self, *args, **kwargs):
-            return CallOwner()
\ No newline at end of file
+            return CallOwner()
+
+
+class MockedAsyncResponse:
+
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self, **kwargs):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class MockedAsyncSession:
+
+    def __init__(self, responses):
+        # url -> body, or a callable taking the json payload and returning the body
+        self.responses = responses
+        self.requests = []
+
+    def _request(self, method, url, json=None, **kwargs):
+        self.requests.append((method, url, json))
+        body = self.responses[url]
+        if callable(body):
+            body = body(json)
+        return MockedAsyncResponse(body)
+
+    def get(self, url, **kwargs):
+        return self._request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._request('POST', url, **kwargs)
+
+
+def axie_node(owners, rejected=()):
+    # Answers ownerOf from owners and accepts every raw tx but the ones at the positions in rejected
+    sent = []
+
+    def callback(request, context):
+        responses = []
+        for call_ in request.json():
+            if call_['method'] == 'eth_call':
+                axie_id = int(call_['params'][0]['data'][10:], 16)
+                owner = owners.get(axie_id, "0x" + "0" * 40)
+                result = "0x" + owner[2:].lower().rjust(64, '0')
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": result})
+                continue
+            sent.append(call_['params'][0])
+            if len(sent) - 1 in rejected:
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "error": {"message": "nonce too low"}})
+            else:
+                tx_hash = Web3.toHex(Web3.keccak(hexstr=call_['params'][0]))
+                responses.append({"jsonrpc": "2.0", "id": call_['id'], "result": tx_hash})
+        return responses
+    callback.sent = sent
+    return callback